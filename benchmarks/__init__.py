@@ -0,0 +1,5 @@
+"""Benchmarks of cbiohub on synthetic datahubs.
+
+Run ``python -m benchmarks.run run --scale small`` from the repository root,
+and ``python -m benchmarks.run compare OLD.json NEW.json`` to compare runs.
+"""
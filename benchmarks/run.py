@@ -0,0 +1,239 @@
+"""Time ingest, combine and the analyze queries on synthetic datahubs."""
+
+import contextlib
+import datetime
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from dynaconf import settings
+
+from .synthetic import HOTSPOTS, SCALES, generate_datahub
+
+RESULTS_PATH = Path(__file__).parent / "results"
+
+
+def git_commit():
+    """Return the commit the benchmarked code is at, if it's a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def package_versions():
+    """Return the installed versions of cbiohub and the libraries it relies on."""
+    versions = {}
+    for package in ["cbiohub", "pyarrow", "duckdb", "pandas"]:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def time_once(func, quiet):
+    """Run func once and return the elapsed wall clock time in seconds."""
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+
+def time_repeated(func, repeat, quiet):
+    """Time func repeat times, with the query cache cleared before every run."""
+    from cbiohub.query_cache import get_query_cache
+
+    runs = []
+    for _ in range(repeat):
+        get_query_cache().clear()
+        runs.append(time_once(func, quiet))
+    return {
+        "first": runs[0],
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "runs": runs,
+    }
+
+
+def run_scale(scale, work_path, repeat, seed, workers, quiet):
+    """Generate a datahub at a scale and time every stage on it."""
+    from cbiohub.analyze import (
+        find_variant,
+        get_combined_df,
+        variant_frequency_per_cancer_type,
+    )
+    from cbiohub.cooccurrence import gene_cooccurrence
+    from cbiohub.data_commands import data
+    from cbiohub.summaries import mutation_summary
+
+    params = SCALES[scale]
+    datahub_path = work_path / scale / "datahub"
+    processed_path = work_path / scale / "processed"
+    generate_datahub(datahub_path, seed=seed, **params)
+    settings.PROCESSED_PATH = str(processed_path)
+    directory = processed_path / "combined"
+
+    def ingest():
+        data.main(
+            ["ingest", str(datahub_path), "--workers", str(workers)],
+            standalone_mode=False,
+        )
+
+    def combine():
+        data.main(["combine"], standalone_mode=False)
+
+    symbol, chrom, position, ref, alt, protein_change = HOTSPOTS[0]
+    queries = {
+        "find_variant": lambda: find_variant(
+            chrom=chrom,
+            start=position,
+            end=position,
+            ref=ref,
+            alt=alt,
+            directory=directory,
+        ),
+        "find_variant_by_protein_change": lambda: find_variant(
+            hugo_symbol=symbol, protein_change=protein_change, directory=directory
+        ),
+        "variant_frequency_per_cancer_type": lambda: (
+            variant_frequency_per_cancer_type(
+                chrom, position, position, ref, alt, "CANCER_TYPE", directory
+            )
+        ),
+        "mutation_summary_per_cancer_type": lambda: mutation_summary(
+            "gene", "CANCER_TYPE", directory=directory
+        ),
+        "gene_cooccurrence": lambda: gene_cooccurrence(top=50, directory=directory),
+        "get_combined_df": lambda: get_combined_df(directory),
+    }
+
+    timings = {
+        "ingest": time_once(ingest, quiet),
+        "combine": time_once(combine, quiet),
+    }
+    for name, query in queries.items():
+        timings[name] = time_repeated(query, repeat, quiet)
+    return {"params": params, "timings": timings}
+
+
+def stage_seconds(timing):
+    """Return the seconds to compare for a stage, the median for queries."""
+    return timing["median"] if isinstance(timing, dict) else timing
+
+
+@click.group()
+def cli():
+    """Benchmark cbiohub on synthetic datahubs."""
+    pass
+
+
+@cli.command()
+@click.option(
+    "--scale",
+    "scales",
+    type=click.Choice(list(SCALES)),
+    multiple=True,
+    help="Scales to benchmark, can be repeated (default: tiny and small).",
+)
+@click.option("--repeat", type=int, default=5, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--workers", type=int, default=1, show_default=True)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="JSON file for the results (default: benchmarks/results/<time>.json).",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Where to generate the datahubs, kept afterwards (default: a "
+    "temporary directory).",
+)
+@click.option("--verbose", is_flag=True, default=False, help="Show command output.")
+def run(scales, repeat, seed, workers, output, work_dir, verbose):
+    """Time ingest, combine and the queries at each scale."""
+    scales = scales or ("tiny", "small")
+    created = datetime.datetime.now(datetime.timezone.utc)
+    results = {
+        "created": created.isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": package_versions(),
+        "repeat": repeat,
+        "seed": seed,
+        "workers": workers,
+        "scales": {},
+    }
+
+    work_path = Path(work_dir or tempfile.mkdtemp(prefix="cbiohub-benchmark-"))
+    try:
+        for scale in scales:
+            click.echo(f"Benchmarking {scale} {SCALES[scale]}")
+            result = run_scale(scale, work_path, repeat, seed, workers, not verbose)
+            results["scales"][scale] = result
+            for stage, timing in result["timings"].items():
+                click.echo(f"  {stage:<35} {stage_seconds(timing):10.4f} s")
+    finally:
+        if work_dir is None:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    if output is None:
+        RESULTS_PATH.mkdir(exist_ok=True)
+        output = RESULTS_PATH / f"{created.strftime('%Y%m%dT%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    click.echo(click.style(f"✅ Benchmark results saved to {output}", fg="green"))
+
+
+@cli.command()
+@click.argument("baseline", type=click.File())
+@click.argument("contender", type=click.File())
+def compare(baseline, contender):
+    """Compare the timings of two benchmark result files."""
+    baseline = json.load(baseline)
+    contender = json.load(contender)
+    click.echo(
+        f"{'scale':<8} {'stage':<35} {'baseline':>10} {'contender':>10} {'ratio':>7}"
+    )
+    for scale, result in contender["scales"].items():
+        if scale not in baseline["scales"]:
+            continue
+        baseline_timings = baseline["scales"][scale]["timings"]
+        for stage, timing in result["timings"].items():
+            if stage not in baseline_timings:
+                continue
+            old = stage_seconds(baseline_timings[stage])
+            new = stage_seconds(timing)
+            ratio = new / old if old else float("inf")
+            color = "green" if ratio < 0.95 else "red" if ratio > 1.05 else None
+            click.echo(
+                click.style(
+                    f"{scale:<8} {stage:<35} {old:10.4f} {new:10.4f} {ratio:7.2f}",
+                    fg=color,
+                )
+            )
+
+
+if __name__ == "__main__":
+    cli()
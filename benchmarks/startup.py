@@ -0,0 +1,103 @@
+"""Guard against regressions in the startup time of the cbiohub cli."""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+from .run import git_commit, package_versions
+
+COMMANDS = {
+    "help": ["--help"],
+    "version": ["version"],
+}
+
+# Libraries that should only be imported by the commands that need them
+HEAVY_MODULES = ["pandas", "pyarrow", "duckdb", "numpy", "tabulate", "tqdm"]
+
+
+def time_command(args, repeat):
+    """Run the cli with args in a fresh interpreter and time each run."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "cbiohub.cli", *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        runs.append(time.perf_counter() - start)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def heavy_imports():
+    """Return the heavy libraries that importing the cli pulls in."""
+    code = (
+        "import sys, cbiohub.cli; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout.strip()
+    return output.split(",") if output else []
+
+
+@click.command()
+@click.option("--repeat", type=int, default=10, show_default=True)
+@click.option(
+    "--max-seconds",
+    type=float,
+    default=0.5,
+    show_default=True,
+    help="Fail if the median startup time of a command exceeds this.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="JSON file to save the results to.",
+)
+def main(repeat, max_seconds, output):
+    """Time `cbiohub --help` and `cbiohub version`, and check that importing
+    the cli doesn't import pandas, pyarrow or duckdb."""
+    results = {
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "packages": package_versions(),
+        "heavy_imports": heavy_imports(),
+        "timings": {},
+    }
+    failed = False
+    for name, args in COMMANDS.items():
+        timing = time_command(args, repeat)
+        results["timings"][name] = timing
+        slow = timing["median"] > max_seconds
+        failed |= slow
+        click.echo(
+            click.style(
+                f"{'❌' if slow else '✅'} cbiohub {' '.join(args)}: "
+                f"{timing['median']:.3f} s median, {timing['min']:.3f} s min",
+                fg="red" if slow else "green",
+            )
+        )
+    if results["heavy_imports"]:
+        failed = True
+        click.echo(
+            click.style(
+                f"❌ Importing the cli imports {', '.join(results['heavy_imports'])}",
+                fg="red",
+            )
+        )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
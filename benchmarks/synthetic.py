@@ -0,0 +1,252 @@
+"""Generate a synthetic datahub of cBioPortal studies for benchmarking."""
+
+import random
+from pathlib import Path
+
+import click
+
+# Parameters of the synthetic datahub at each benchmark scale
+SCALES = {
+    "tiny": dict(studies=3, samples=50, mutations_per_sample=10, extra_attributes=5),
+    "small": dict(
+        studies=10, samples=200, mutations_per_sample=50, extra_attributes=20
+    ),
+    "medium": dict(
+        studies=50, samples=500, mutations_per_sample=100, extra_attributes=50
+    ),
+    "large": dict(
+        studies=200, samples=1000, mutations_per_sample=200, extra_attributes=100
+    ),
+}
+
+# Real hotspots, so queries for well known variants hit something
+HOTSPOTS = [
+    ("BRAF", "7", 140453136, "A", "T", "p.V600E"),
+    ("KRAS", "12", 25398284, "C", "T", "p.G12D"),
+    ("TP53", "17", 7577120, "C", "T", "p.R273H"),
+    ("ERBB2", "17", 37880220, "G", "A", "p.S310F"),
+    ("PIK3CA", "3", 178936091, "G", "A", "p.E545K"),
+]
+
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X"]
+BASES = "ACGT"
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+CANCER_TYPES = [
+    ("Melanoma", "Cutaneous Melanoma", "SKCM"),
+    ("Non-Small Cell Lung Cancer", "Lung Adenocarcinoma", "LUAD"),
+    ("Colorectal Cancer", "Colon Adenocarcinoma", "COAD"),
+    ("Breast Cancer", "Breast Invasive Ductal Carcinoma", "IDC"),
+    ("Glioma", "Glioblastoma Multiforme", "GBM"),
+    ("Prostate Cancer", "Prostate Adenocarcinoma", "PRAD"),
+]
+SAMPLE_TYPES = ["Primary", "Metastasis"]
+
+MUTATION_COLUMNS = [
+    "Hugo_Symbol",
+    "Entrez_Gene_Id",
+    "Center",
+    "NCBI_Build",
+    "Chromosome",
+    "Start_Position",
+    "End_Position",
+    "Strand",
+    "Variant_Classification",
+    "Variant_Type",
+    "Reference_Allele",
+    "Tumor_Seq_Allele1",
+    "Tumor_Seq_Allele2",
+    "Tumor_Sample_Barcode",
+    "HGVSp_Short",
+    "t_ref_count",
+    "t_alt_count",
+    "n_ref_count",
+    "n_alt_count",
+]
+
+
+def make_genes(num_genes, rng):
+    """Return (symbol, chromosome, start, hotspot position) for synthetic genes."""
+    genes = [(symbol, chrom, start, start) for symbol, chrom, start, *_ in HOTSPOTS]
+    for i in range(num_genes - len(genes)):
+        start = rng.randrange(1_000_000, 200_000_000)
+        hotspot = start + rng.randrange(0, 10_000)
+        genes.append((f"GENE{i}", rng.choice(CHROMOSOMES), start, hotspot))
+    return genes
+
+
+def clinical_header(columns):
+    """Return the four '#' metadata rows and the column row of a clinical file."""
+    rows = [
+        [name.replace("_", " ").title() for name, _ in columns],
+        [name.replace("_", " ").title() for name, _ in columns],
+        [datatype for _, datatype in columns],
+        ["1"] * len(columns),
+    ]
+    lines = ["#" + "\t".join(row) for row in rows]
+    lines.append("\t".join(name for name, _ in columns))
+    return "\n".join(lines) + "\n"
+
+
+def write_study(
+    study_path,
+    study_id,
+    genes,
+    weights,
+    rng,
+    samples,
+    mutations_per_sample,
+    extra_attributes,
+    hotspot_rate,
+):
+    """Write the meta, clinical and mutation files of one synthetic study."""
+    study_path.mkdir(parents=True, exist_ok=True)
+    (study_path / "meta_study.txt").write_text(
+        f"type_of_cancer: mixed\n"
+        f"cancer_study_identifier: {study_id}\n"
+        f"name: Synthetic study {study_id}\n"
+        f"description: Synthetic study for benchmarking\n"
+        f"add_global_case_list: true\n"
+    )
+
+    patient_ids = [f"{study_id}_P{i}" for i in range(samples)]
+    sample_ids = [f"{study_id}_S{i}" for i in range(samples)]
+    # attributes only this study has, like the many study specific attributes
+    # in datahub
+    extra = [
+        (f"{study_id.upper()}_ATTR_{j}", "STRING") for j in range(extra_attributes)
+    ]
+
+    patient_columns = [
+        ("PATIENT_ID", "STRING"),
+        ("SEX", "STRING"),
+        ("AGE", "NUMBER"),
+        ("OS_STATUS", "STRING"),
+        ("OS_MONTHS", "NUMBER"),
+    ]
+    with open(study_path / "data_clinical_patient.txt", "w") as f:
+        f.write(clinical_header(patient_columns))
+        for patient_id in patient_ids:
+            status = rng.choice(["0:LIVING", "1:DECEASED"])
+            age = rng.choice([str(rng.randint(20, 89)), "NA"])
+            months = f"{rng.random() * 120:.1f}"
+            sex = rng.choice(["Male", "Female"])
+            f.write(f"{patient_id}\t{sex}\t{age}\t{status}\t{months}\n")
+
+    sample_columns = [
+        ("PATIENT_ID", "STRING"),
+        ("SAMPLE_ID", "STRING"),
+        ("CANCER_TYPE", "STRING"),
+        ("CANCER_TYPE_DETAILED", "STRING"),
+        ("ONCOTREE_CODE", "STRING"),
+        ("SAMPLE_TYPE", "STRING"),
+        ("TMB_NONSYNONYMOUS", "NUMBER"),
+    ] + extra
+    with open(study_path / "data_clinical_sample.txt", "w") as f:
+        f.write(clinical_header(sample_columns))
+        for patient_id, sample_id in zip(patient_ids, sample_ids):
+            values = [patient_id, sample_id, *rng.choice(CANCER_TYPES)]
+            values.append(rng.choice(SAMPLE_TYPES))
+            values.append(f"{rng.random() * 20:.2f}")
+            values += [rng.choice(["A", "B", "C", ""]) for _ in extra]
+            f.write("\t".join(values) + "\n")
+
+    with open(study_path / "data_mutations.txt", "w") as f:
+        f.write("#version 2.4\n")
+        f.write("\t".join(MUTATION_COLUMNS) + "\n")
+        for sample_id in sample_ids:
+            for symbol, chrom, start, hotspot in rng.choices(
+                genes, weights, k=mutations_per_sample
+            ):
+                if rng.random() < hotspot_rate:
+                    position = hotspot
+                else:
+                    position = start + rng.randrange(0, 100_000)
+                ref = rng.choice(BASES)
+                alt = rng.choice(BASES.replace(ref, ""))
+                protein_change = (
+                    f"p.{rng.choice(AMINO_ACIDS)}{(position - start) // 3 + 1}"
+                    f"{rng.choice(AMINO_ACIDS)}"
+                )
+                for hotspot_gene in HOTSPOTS:
+                    if (symbol, position) == (hotspot_gene[0], hotspot_gene[2]):
+                        ref, alt, protein_change = hotspot_gene[3:]
+                values = [
+                    symbol,
+                    "0",
+                    "synthetic",
+                    "GRCh37",
+                    chrom,
+                    str(position),
+                    str(position),
+                    "+",
+                    "Missense_Mutation",
+                    "SNP",
+                    ref,
+                    ref,
+                    alt,
+                    sample_id,
+                    protein_change,
+                    str(rng.randint(5, 200)),
+                    str(rng.randint(1, 100)),
+                    rng.choice(["", str(rng.randint(5, 200))]),
+                    rng.choice(["", "0"]),
+                ]
+                f.write("\t".join(values) + "\n")
+
+
+def generate_datahub(
+    output_path,
+    studies,
+    samples,
+    mutations_per_sample,
+    extra_attributes=0,
+    num_genes=1000,
+    hotspot_rate=0.2,
+    seed=0,
+):
+    """Generate a synthetic datahub folder with one directory per study.
+
+    Gene frequencies follow a Zipf like distribution, so a few genes (starting
+    with the HOTSPOTS genes) are mutated in many samples. The same seed always
+    generates the same datahub. Returns the list of study paths.
+    """
+    output_path = Path(output_path)
+    rng = random.Random(seed)
+    genes = make_genes(num_genes, rng)
+    weights = [1 / (rank + 1) for rank in range(len(genes))]
+
+    study_paths = []
+    for i in range(studies):
+        study_id = f"synthetic_{i}"
+        write_study(
+            output_path / study_id,
+            study_id,
+            genes,
+            weights,
+            rng,
+            samples,
+            mutations_per_sample,
+            extra_attributes,
+            hotspot_rate,
+        )
+        study_paths.append(output_path / study_id)
+    return study_paths
+
+
+@click.command()
+@click.argument("output_path", type=click.Path(file_okay=False))
+@click.option("--scale", type=click.Choice(list(SCALES)), default="small")
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(output_path, scale, seed):
+    """Generate a synthetic datahub at OUTPUT_PATH."""
+    study_paths = generate_datahub(output_path, seed=seed, **SCALES[scale])
+    click.echo(
+        click.style(
+            f"✅ Generated {len(study_paths)} synthetic studies in {output_path}",
+            fg="green",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
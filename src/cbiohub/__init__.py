@@ -1,5 +1,20 @@
-from .analyze import get_combined_df
-
 __all__ = [
     "get_combined_df",
+    "get_combined_table",
+    "CombinedTable",
+    "get_expression",
 ]
+
+
+def __getattr__(name):
+    # analyze pulls in pyarrow and duckdb, only import it when it's used so
+    # importing the cli stays fast
+    if name == "get_expression":
+        from .expression import get_expression
+
+        return get_expression
+    if name in __all__:
+        from . import analyze
+
+        return getattr(analyze, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
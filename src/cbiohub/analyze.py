@@ -1,52 +1,418 @@
+import gzip
+import json
+import threading
 from pathlib import Path
 
 import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
 import pyarrow.dataset as ds
+import pyarrow.compute as pc
 import duckdb
 import pyarrow as pa
-import pandas as pd
 from dynaconf import settings
 
+from .cohort_index import (
+    SAMPLE_KEY_COLUMN,
+    bitmap_contains,
+    select_cohort_bitmap,
+    select_cohort_keys,
+)
+from .defaults import CNA_ALTERATIONS
+from .frames import DICTIONARY_COLUMNS, get_dictionary_columns, to_pandas
+from .metrics import span
+from .query_cache import get_query_cache
+from .study import CLINICAL_ATTRIBUTES_KEY, CommentLines, ShortRows, read_header
+from .variant_index import INDEX_KEYS, lookup_variant_index, read_indexed_rows
+
 MUTATION_COLUMNS = {
     "Chromosome": pa.string(),
-    "Start_Position": pa.string(),
-    "End_Position": pa.string(),
+    "Start_Position": pa.int64(),
+    "End_Position": pa.int64(),
     "Reference_Allele": pa.string(),
     "Tumor_Seq_Allele1": pa.string(),
     "Tumor_Seq_Allele2": pa.string(),
-    "t_ref_count": pa.string(),
-    "t_alt_count": pa.string(),
-    "n_ref_count": pa.string(),
-    "n_alt_count": pa.string(),
+    "t_ref_count": pa.int64(),
+    "t_alt_count": pa.int64(),
+    "n_ref_count": pa.int64(),
+    "n_alt_count": pa.int64(),
     "Hugo_Symbol": pa.string(),
     "HGVSp_Short": pa.string(),
     "Tumor_Sample_Barcode": pa.string(),
     "study_id": pa.string(),
 }
 
+INTEGER_PATTERN = r"^-?[0-9]+$"
+# UCSC style "chr" prefix of chromosome names, stripped so chr1 and 1 match
+CHROMOSOME_PREFIX_PATTERN = r"^[Cc][Hh][Rr]"
+
+# DuckDB database with a view for each combined table, created by `combine`
+CATALOG_FILE = "catalog.duckdb"
+CATALOG_VIEWS = {
+    "mutations": "combined_mutations",
+    "clinical_patient": "combined_clinical_patient",
+    "clinical_sample": "combined_clinical_sample",
+    "clinical_patient_long": "combined_clinical_patient_long",
+    "clinical_patient_core": "combined_clinical_patient_core",
+    "clinical_sample_long": "combined_clinical_sample_long",
+    "clinical_sample_core": "combined_clinical_sample_core",
+    "cna": "combined_cna",
+    "summary_samples": "summary_samples",
+    "summary_samples_by_attribute": "summary_samples_by_attribute",
+    "summary_gene": "summary_gene",
+    "summary_gene_by_attribute": "summary_gene_by_attribute",
+    "summary_protein_change": "summary_protein_change",
+    "summary_protein_change_by_attribute": "summary_protein_change_by_attribute",
+    "summary_variant": "summary_variant",
+    "summary_variant_by_attribute": "summary_variant_by_attribute",
+}
+
+# DuckDB types the string values of the long clinical tables are cast back to,
+# by the datatype of their attribute
+LONG_VALUE_TYPES = {"NUMBER": "DOUBLE", "BOOLEAN": "BOOLEAN"}
+
+# Shared DuckDB connections per combined directory, see get_connection
+_connections = {}
+_connections_lock = threading.Lock()
+
+# Hive partitioning of the combined tables that are written as datasets of
+# per-study fragments by `combine --partition`
+COMBINED_PARTITIONING = {
+    "combined_mutations": pa.schema([("Chromosome", pa.string())]),
+}
+
+
+def cast_mutation_table(table):
+    """Select MUTATION_COLUMNS from a per-study mutation table and cast them.
+
+    Ingested mutation files store every value as a string. Rows with a value
+    that can't be cast to its integer column are split off and returned
+    separately (with their original string values) so they can be quarantined
+    instead of failing the whole study. A "chr" prefix is stripped from the
+    chromosome names, see normalize_chromosome. Returns (typed_table,
+    quarantined).
+    """
+    columns = [col for col in MUTATION_COLUMNS if col in table.schema.names]
+    table = table.select(columns)
+    if "Chromosome" in columns:
+        table = table.set_column(
+            table.schema.get_field_index("Chromosome"),
+            "Chromosome",
+            pc.replace_substring_regex(
+                table["Chromosome"].cast(pa.string()),
+                pattern=CHROMOSOME_PREFIX_PATTERN,
+                replacement="",
+            ),
+        )
+
+    invalid = None
+    for col in columns:
+        if not pa.types.is_integer(MUTATION_COLUMNS[col]):
+            continue
+        values = table[col]
+        if pa.types.is_integer(values.type):
+            continue
+        values = pc.utf8_trim_whitespace(values)
+        table = table.set_column(table.schema.get_field_index(col), col, values)
+        bad = pc.invert(
+            pc.fill_null(pc.match_substring_regex(values, INTEGER_PATTERN), True)
+        )
+        invalid = bad if invalid is None else pc.or_(invalid, bad)
+
+    if invalid is None:
+        quarantined = table.slice(0, 0)
+    else:
+        quarantined = table.filter(invalid)
+        table = table.filter(pc.invert(invalid))
+
+    schema = pa.schema({col: MUTATION_COLUMNS[col] for col in columns})
+    return table.cast(schema), quarantined
+
+
+def normalize_chromosome(chrom):
+    """Strip a "chr" prefix from a query chromosome, like combine does for the
+    stored ones."""
+    chrom = str(chrom)
+    return chrom[3:] if chrom.lower().startswith("chr") else chrom
+
 
 def get_combined_df(directory=None):
     """Get combined study data."""
+    mut = get_combined_table("mutations", list(MUTATION_COLUMNS), directory=directory)
+    clinp = get_combined_table("clinical_patient", directory=directory)
+    clins = get_combined_table("clinical_sample", directory=directory)
+
+    with span("query.get_combined_df") as timing:
+        frames = mut.to_pandas(), clinp.to_pandas(), clins.to_pandas()
+        timing.rows = len(frames[0])
+    return frames
+
+
+class CombinedTable:
+    """Lazy handle on one of the combined tables.
+
+    Nothing is read until the table is materialized with to_arrow, to_pandas,
+    to_batches or to_duckdb. The selected columns and filter are pushed down
+    into the Arrow dataset scan, so only the needed columns and row groups are
+    read.
+    """
+
+    def __init__(self, directory, name, columns=None, filter=None):
+        self.directory = directory
+        self.name = name
+        self.columns = list(columns) if columns is not None else None
+        self.filter = filter
+
+    def __repr__(self):
+        return (
+            f"CombinedTable({self.name!r}, columns={self.columns!r}, "
+            f"filter={self.filter!r})"
+        )
+
+    def select(self, columns):
+        """Return a handle that only reads the given columns."""
+        return CombinedTable(self.directory, self.name, columns, self.filter)
+
+    def where(self, filter):
+        """Return a handle with an additional filter.
+
+        The filter is either a pyarrow.dataset expression, e.g.
+        ds.field("Hugo_Symbol") == "BRAF", or a list of (column, op, value)
+        tuples like the filters argument of pandas.read_parquet.
+        """
+        if not isinstance(filter, ds.Expression):
+            filter = pq.filters_to_expression(filter)
+        if self.filter is not None:
+            filter = self.filter & filter
+        return CombinedTable(self.directory, self.name, self.columns, filter)
+
+    def dataset(self):
+        """Return the underlying Arrow dataset."""
+        return get_combined_dataset(
+            self.directory,
+            CATALOG_VIEWS[self.name],
+            dictionary_columns=get_dictionary_columns(DICTIONARY_COLUMNS),
+        )
+
+    @property
+    def schema(self):
+        """Return the schema of the table with the selected columns."""
+        schema = self.dataset().schema
+        if self.columns is None:
+            return schema
+        return pa.schema([schema.field(col) for col in self.columns])
+
+    def scanner(self, **kwargs):
+        """Return an Arrow scanner with the columns and filter pushed down."""
+        return self.dataset().scanner(
+            columns=self.columns, filter=self.filter, **kwargs
+        )
+
+    def count_rows(self):
+        """Count the rows matching the filter."""
+        return self.dataset().count_rows(filter=self.filter)
+
+    def to_arrow(self):
+        """Read the table into an Arrow table."""
+        return self.scanner().to_table()
+
+    def to_pandas(self):
+        """Read the table into a pandas DataFrame.
+
+        Low-cardinality string columns become categoricals or Arrow-backed
+        strings depending on the STRING_DTYPE setting, see frames.py.
+        """
+        return to_pandas(self.to_arrow())
+
+    def to_batches(self, batch_size=128 * 1024):
+        """Iterate over the table in Arrow record batches."""
+        return iter(self.scanner(batch_size=batch_size).to_batches())
+
+    def __iter__(self):
+        return self.to_batches()
+
+    def to_duckdb(self, con=None):
+        """Return a DuckDB relation that scans the table."""
+        if con is None:
+            con = duckdb.connect()
+        return con.from_arrow(self.scanner())
+
+
+def get_combined_table(name, columns=None, filter=None, directory=None):
+    """Get a lazy handle on a combined table.
+
+    name is one of "mutations", "clinical_patient" or "clinical_sample". See
+    CombinedTable for the supported filters and ways to materialize it.
+    """
+    if name not in CATALOG_VIEWS:
+        raise ValueError(
+            f"Unknown table: {name}, choose from {', '.join(CATALOG_VIEWS)}"
+        )
     if directory is None:
         directory = Path(settings.PROCESSED_PATH) / "combined"
     else:
         directory = Path(directory)
 
-    mut = pd.read_parquet(
-        directory / "combined_mutations.parquet", columns=MUTATION_COLUMNS
-    )
-    clinp = pd.read_parquet(directory / "combined_clinical_patient.parquet")
-    clins = pd.read_parquet(directory / "combined_clinical_sample.parquet")
+    table = CombinedTable(directory, name, columns)
+    return table.where(filter) if filter is not None else table
 
-    return mut, clinp, clins
 
+def get_combined_dataset(directory, name, dictionary_columns=None):
+    """Open a combined table, stored either as a single Parquet file or as a
+    directory of per-study fragments.
 
-def find_samples_in_parquet(filter_expression, directory):
-    dataset = ds.dataset(directory / "combined_mutations.parquet", format="parquet")
-    table = dataset.to_table(
-        filter=filter_expression, columns=["Tumor_Sample_Barcode", "study_id"]
+    dictionary_columns are string columns to read as dictionary arrays.
+    """
+    file_format = ds.ParquetFileFormat(
+        read_options=ds.ParquetReadOptions(dictionary_columns=dictionary_columns)
     )
-    if table.num_rows > 0:
+    dataset_path = directory / name
+    if dataset_path.is_dir():
+        partitioning = None
+        if name in COMBINED_PARTITIONING:
+            partitioning = ds.partitioning(COMBINED_PARTITIONING[name], flavor="hive")
+        schema = pq.read_schema(dataset_path / "_common_metadata")
+        if dictionary_columns:
+            # partition fields are not read from the files, so they stay strings
+            partition_fields = partitioning.schema.names if partitioning else []
+            schema = pa.schema(
+                [
+                    (
+                        field.with_type(pa.dictionary(pa.int32(), field.type))
+                        if field.name in dictionary_columns
+                        and field.name not in partition_fields
+                        else field
+                    )
+                    for field in schema
+                ],
+                metadata=schema.metadata,
+            )
+        return ds.dataset(
+            dataset_path, format=file_format, schema=schema, partitioning=partitioning
+        )
+    return ds.dataset(directory / f"{name}.parquet", format=file_format)
+
+
+def get_combined_relation(directory, name):
+    """Return the DuckDB table expression for a combined table."""
+    dataset_path = directory / name
+    if dataset_path.is_dir():
+        options = "union_by_name = true"
+        if name in COMBINED_PARTITIONING:
+            hive_types = ", ".join(
+                f"'{field.name}': 'VARCHAR'" for field in COMBINED_PARTITIONING[name]
+            )
+            options += f", hive_partitioning = true, hive_types = {{{hive_types}}}"
+        return f"read_parquet('{quote_path(dataset_path)}/**/*.parquet', {options})"
+    return f"read_parquet('{quote_path(directory / name)}.parquet')"
+
+
+def quote_path(path):
+    """Escape a path for use in a DuckDB string literal."""
+    return str(path).replace("'", "''")
+
+
+def quote_identifier(name):
+    """Quote a column name for use in a DuckDB query."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def create_views(con, directory):
+    """Create a view for each combined table that exists in directory.
+
+    The views read the tables by absolute path, so the catalog works from any
+    working directory.
+    """
+    directory = Path(directory).resolve()
+    for view, name in CATALOG_VIEWS.items():
+        if (directory / name).is_dir() or (directory / f"{name}.parquet").exists():
+            con.execute(
+                f"CREATE OR REPLACE VIEW {view} AS "
+                f"SELECT * FROM {get_combined_relation(directory, name)}"
+            )
+
+
+def create_catalog(directory):
+    """(Re)create the DuckDB catalog of the combined tables in directory.
+
+    The new catalog is written next to the old one and moved into place, so
+    processes that have the old catalog open are not affected.
+    """
+    directory = Path(directory)
+    catalog_file = directory / CATALOG_FILE
+    tmp_file = directory / f"{CATALOG_FILE}.tmp"
+    tmp_file.unlink(missing_ok=True)
+
+    con = duckdb.connect(str(tmp_file))
+    try:
+        create_views(con, directory)
+    finally:
+        con.close()
+    tmp_file.replace(catalog_file)
+    return catalog_file
+
+
+def get_connection(directory):
+    """Return a cursor on the shared DuckDB connection for a combined directory.
+
+    One connection per directory is kept open for the lifetime of the process,
+    so the Parquet metadata cache is reused across queries. It is reopened when
+    `combine` refreshes the catalog. The returned cursor should be closed by
+    the caller.
+    """
+    catalog_file = directory / CATALOG_FILE
+    key = str(directory.resolve())
+    with _connections_lock:
+        version = catalog_file.stat().st_mtime_ns if catalog_file.exists() else None
+        cached = _connections.get(key)
+        if cached is None or cached[0] != version:
+            if cached is not None:
+                cached[1].close()
+            if version is None:
+                # no catalog (yet), create the views in memory instead
+                con = duckdb.connect()
+                create_views(con, directory)
+            else:
+                con = duckdb.connect(str(catalog_file), read_only=True)
+            con.execute("SET parquet_metadata_cache = true")
+            _connections[key] = (version, con)
+        return _connections[key][1].cursor()
+
+
+def get_clinical_columns(con, view):
+    """Return the column names of a clinical view."""
+    return [row[0] for row in con.execute(f"DESCRIBE {view}").fetchall()]
+
+
+def find_samples_in_parquet(filter_expression, directory, index_key=None, cohort=None):
+    """Find the samples with mutations matching a filter expression.
+
+    index_key is an optional (kind, values) tuple for the variant index, see
+    variant_index.py. When a valid index exists only the matching rows are
+    read, otherwise the combined mutations are scanned. With a cohort
+    expression only the samples in the cohort are returned.
+    """
+    columns = ["Tumor_Sample_Barcode", "study_id"]
+    if cohort is not None:
+        columns.append(SAMPLE_KEY_COLUMN)
+    with span("query.find_variant") as timing:
+        locations = None
+        if index_key is not None:
+            locations = lookup_variant_index(directory, *index_key)
+
+        if locations is None:
+            dataset = get_combined_dataset(directory, "combined_mutations")
+            table = dataset.to_table(filter=filter_expression, columns=columns)
+        else:
+            key_columns = list(INDEX_KEYS[index_key[0]])
+            table = read_indexed_rows(directory, locations, key_columns + columns)
+            if table is not None:
+                # drop hash collisions
+                table = table.filter(filter_expression)
+        if table is not None and cohort is not None:
+            table = filter_cohort(table, cohort, directory)
+        timing.rows = table.num_rows if table is not None else 0
+
+    if table is not None and table.num_rows > 0:
         unique_identifiers = [
             f"{study_id}:{barcode}"
             for study_id, barcode in zip(
@@ -58,27 +424,59 @@ def find_samples_in_parquet(filter_expression, directory):
         return False, []
 
 
-def variant_exists(chrom, start, end, ref, alt, directory=None):
+def filter_cohort(table, cohort, directory):
+    """Keep the rows of table of the samples in a cohort expression, by testing
+    their sample_key in the cohort's bitmap."""
+    bitmap = select_cohort_bitmap(cohort, directory)
+    return table.filter(pa.array(bitmap_contains(bitmap, table[SAMPLE_KEY_COLUMN])))
+
+
+def get_cohort_join(con, directory, cohort, view, alias=None):
+    """Build the join restricting the rows of a view to the samples of a cohort.
+
+    The cohort expression is evaluated on the bitmaps of the cohort index (see
+    cohort_index.py) and the dense ids of its samples registered on con, so
+    the join is a single integer key against the sample_key column combine adds
+    to the clinical sample, mutation and copy-number tables. Returns an empty
+    string without a cohort.
+    """
+    if cohort is None:
+        return ""
+    if SAMPLE_KEY_COLUMN not in get_clinical_columns(con, view):
+        raise ValueError(
+            f"No {SAMPLE_KEY_COLUMN} column in {view}, run `cbiohub combine` first"
+        )
+    ids = select_cohort_keys(cohort, directory)
+    con.register("cohort_samples", pa.table({SAMPLE_KEY_COLUMN: ids}))
+    return (
+        "SEMI JOIN cohort_samples "
+        f"ON {alias or view}.{SAMPLE_KEY_COLUMN} = cohort_samples.{SAMPLE_KEY_COLUMN}"
+    )
+
+
+def variant_exists(chrom, start, end, ref, alt, directory=None, cohort=None):
     """Check if a particular variant exists in the combined mutations parquet."""
     if directory is None:
         directory = Path(settings.PROCESSED_PATH) / "combined"
     else:
         directory = Path(directory)
 
+    chrom = normalize_chromosome(chrom)
     filter_expression = (
         (ds.field("Chromosome") == chrom)
-        &
-        # TODO: treat everything as string for now
-        (ds.field("Start_Position") == str(start))
-        & (ds.field("End_Position") == str(end))
+        & (ds.field("Start_Position") == int(start))
+        & (ds.field("End_Position") == int(end))
         & (ds.field("Reference_Allele") == ref)
         & (ds.field("Tumor_Seq_Allele2") == alt)
     )
+    index_key = ("coordinates", (chrom, int(start), int(end), ref, alt))
 
-    return find_samples_in_parquet(filter_expression, directory)
+    return find_samples_in_parquet(filter_expression, directory, index_key, cohort)
 
 
-def variant_exists_by_protein_change(hugo_symbol, protein_change, directory=None):
+def variant_exists_by_protein_change(
+    hugo_symbol, protein_change, directory=None, cohort=None
+):
     """Check if a particular variant exists based on Hugo symbol and protein change."""
     if directory is None:
         directory = Path(settings.PROCESSED_PATH) / "combined"
@@ -92,8 +490,9 @@ def variant_exists_by_protein_change(hugo_symbol, protein_change, directory=None
     filter_expression = (ds.field("Hugo_Symbol") == hugo_symbol) & (
         ds.field("HGVSp_Short") == protein_change
     )
+    index_key = ("protein_change", (hugo_symbol, protein_change))
 
-    return find_samples_in_parquet(filter_expression, directory)
+    return find_samples_in_parquet(filter_expression, directory, index_key, cohort)
 
 
 def find_variant(
@@ -105,49 +504,389 @@ def find_variant(
     hugo_symbol=None,
     protein_change=None,
     directory=None,
+    cohort=None,
 ):
-    """Find a variant based on either genomic coordinates or Hugo symbol and protein change."""
+    """Find a variant based on either genomic coordinates or Hugo symbol and protein change.
+
+    cohort is an optional cohort expression, e.g. "CANCER_TYPE=Melanoma AND
+    SAMPLE_TYPE=Metastasis", to only find the samples in, see cohort_index.py.
+    """
     if chrom and start and end and ref and alt:
-        return variant_exists(chrom, start, end, ref, alt, directory)
+        return variant_exists(chrom, start, end, ref, alt, directory, cohort)
     elif hugo_symbol and protein_change:
-        return variant_exists_by_protein_change(hugo_symbol, protein_change, directory)
+        return variant_exists_by_protein_change(
+            hugo_symbol, protein_change, directory, cohort
+        )
     else:
         raise ValueError("Insufficient arguments provided to find a variant.")
 
 
+# Columns of the query variants used by find_variants
+QUERY_VARIANT_SCHEMA = pa.schema(
+    [
+        ("query_id", pa.int64()),
+        ("Chromosome", pa.string()),
+        ("Start_Position", pa.int64()),
+        ("End_Position", pa.int64()),
+        ("Reference_Allele", pa.string()),
+        ("Tumor_Seq_Allele2", pa.string()),
+        ("Hugo_Symbol", pa.string()),
+        ("HGVSp_Short", pa.string()),
+    ]
+)
+
+# Column names accepted in TSV/MAF query files, matched case-insensitively
+QUERY_COLUMN_ALIASES = {
+    "chrom": "Chromosome",
+    "chromosome": "Chromosome",
+    "start": "Start_Position",
+    "start_position": "Start_Position",
+    "end": "End_Position",
+    "end_position": "End_Position",
+    "ref": "Reference_Allele",
+    "reference_allele": "Reference_Allele",
+    "alt": "Tumor_Seq_Allele2",
+    "tumor_seq_allele2": "Tumor_Seq_Allele2",
+    "gene": "Hugo_Symbol",
+    "hugo_symbol": "Hugo_Symbol",
+    "protein_change": "HGVSp_Short",
+    "hgvsp_short": "HGVSp_Short",
+}
+
+
+def normalize_query_variant(query_id, variant):
+    """Normalize a query variant dict to the QUERY_VARIANT_SCHEMA columns.
+
+    Variants with all genomic coordinates are looked up by coordinates, others
+    by Hugo symbol and protein change, like find_variant.
+    """
+    row = {
+        field.name: variant.get(field.name) or None for field in QUERY_VARIANT_SCHEMA
+    }
+    row["query_id"] = query_id
+
+    coordinates = [
+        "Chromosome",
+        "Start_Position",
+        "End_Position",
+        "Reference_Allele",
+        "Tumor_Seq_Allele2",
+    ]
+    if all(row[col] is not None for col in coordinates):
+        row["Chromosome"] = normalize_chromosome(row["Chromosome"])
+        row["Start_Position"] = int(row["Start_Position"])
+        row["End_Position"] = int(row["End_Position"])
+        row["Hugo_Symbol"] = row["HGVSp_Short"] = None
+    elif row["Hugo_Symbol"] is not None and row["HGVSp_Short"] is not None:
+        protein_change = row["HGVSp_Short"]
+        row["HGVSp_Short"] = (
+            protein_change if protein_change.startswith("p.") else f"p.{protein_change}"
+        )
+        for col in coordinates:
+            row[col] = None
+    else:
+        raise ValueError(
+            f"Insufficient arguments provided to find variant {query_id + 1}."
+        )
+    return row
+
+
+def vcf_to_maf_alleles(pos, ref, alt):
+    """Convert a VCF position and alleles to MAF style start, end, ref and alt."""
+    # drop the padding base VCF uses for indels
+    prefix = 0
+    while prefix < min(len(ref), len(alt)) and ref[prefix] == alt[prefix]:
+        prefix += 1
+    ref, alt = ref[prefix:], alt[prefix:]
+    start = pos + prefix
+
+    if not ref:
+        # insertion, MAF positions are the bases flanking the insertion
+        return start - 1, start, "-", alt
+    if not alt:
+        return start, start + len(ref) - 1, ref, "-"
+    return start, start + len(ref) - 1, ref, alt
+
+
+def read_vcf_variants(path):
+    """Read the variants of a (optionally gzipped) VCF file as dicts."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    variants = []
+    with opener(path, "rt") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            chrom, pos, _, ref, alts = line.rstrip("\n").split("\t")[:5]
+            for alt in alts.split(","):
+                start, end, maf_ref, maf_alt = vcf_to_maf_alleles(int(pos), ref, alt)
+                variants.append(
+                    {
+                        "Chromosome": chrom,
+                        "Start_Position": start,
+                        "End_Position": end,
+                        "Reference_Allele": maf_ref,
+                        "Tumor_Seq_Allele2": maf_alt,
+                    }
+                )
+    return variants
+
+
+def read_tsv_variants(path):
+    """Read the variants of a TSV or MAF file as dicts."""
+    _, column_names, skip_rows = read_header(path)
+    convert_options = pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in column_names},
+        include_columns=[
+            name for name in column_names if name.lower() in QUERY_COLUMN_ALIASES
+        ],
+    )
+    short_rows = ShortRows(column_names, convert_options)
+    with CommentLines(path) as stream:
+        table = pacsv.read_csv(
+            stream,
+            read_options=pacsv.ReadOptions(skip_rows=skip_rows),
+            parse_options=pacsv.ParseOptions(
+                delimiter="\t", invalid_row_handler=short_rows
+            ),
+            convert_options=convert_options,
+        )
+    table = pa.Table.from_batches(
+        table.to_batches() + short_rows.take(), schema=table.schema
+    )
+    table = table.rename_columns(
+        [QUERY_COLUMN_ALIASES[name.lower()] for name in table.schema.names]
+    )
+    return table.to_pylist()
+
+
+def read_query_variants(path):
+    """Read query variants from a VCF, MAF or TSV file into an Arrow table.
+
+    TSV files need a header with either the coordinate columns (chrom, start,
+    end, ref, alt) or the gene and protein_change columns. MAF column names
+    are accepted too.
+    """
+    path = Path(path)
+    if path.name.endswith((".vcf", ".vcf.gz")):
+        variants = read_vcf_variants(path)
+    else:
+        variants = read_tsv_variants(path)
+    rows = [normalize_query_variant(i, variant) for i, variant in enumerate(variants)]
+    return pa.Table.from_pylist(rows, schema=QUERY_VARIANT_SCHEMA)
+
+
+def find_variants(variants, directory=None, batch_size=1000, cohort=None):
+    """Find many variants at once with a single join against the combined mutations.
+
+    variants is an Arrow table with the QUERY_VARIANT_SCHEMA columns, see
+    read_query_variants. Returns an iterator of a (variant, exists, unique_ids)
+    tuple for every query variant, in input order, only counting the samples
+    in the cohort expression if given. The query runs before this returns, so
+    an invalid cohort raises ValueError right away, and the results are
+    fetched as they are iterated.
+    """
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    query = """
+    WITH hits AS (
+        SELECT q.query_id, m.study_id, m.Tumor_Sample_Barcode
+        FROM query_variants AS q
+        JOIN mutations AS m
+        ON m.Chromosome = q.Chromosome
+        AND m.Start_Position = q.Start_Position
+        AND m.End_Position = q.End_Position
+        AND m.Reference_Allele = q.Reference_Allele
+        AND m.Tumor_Seq_Allele2 = q.Tumor_Seq_Allele2
+        {cohort_join}
+        UNION ALL
+        SELECT q.query_id, m.study_id, m.Tumor_Sample_Barcode
+        FROM query_variants AS q
+        JOIN mutations AS m
+        ON m.Hugo_Symbol = q.Hugo_Symbol
+        AND m.HGVSp_Short = q.HGVSp_Short
+        {cohort_join}
+    )
+    SELECT
+        q.query_id,
+        list(h.study_id || ':' || h.Tumor_Sample_Barcode)
+            FILTER (WHERE h.study_id IS NOT NULL) AS unique_ids
+    FROM query_variants AS q
+    LEFT JOIN hits AS h ON h.query_id = q.query_id
+    GROUP BY q.query_id
+    ORDER BY q.query_id
+    """
+
+    query_rows = {row.pop("query_id"): row for row in variants.to_pylist()}
+
+    con = get_connection(directory)
+    try:
+        with span("query.find_variants") as timing:
+            con.register("query_variants", variants)
+            cohort_join = get_cohort_join(con, directory, cohort, "mutations", "m")
+            con.execute(query.replace("{cohort_join}", cohort_join))
+            timing.rows = variants.num_rows
+    except BaseException:
+        con.close()
+        raise
+    return iter_variant_results(con, query_rows, batch_size)
+
+
+def iter_variant_results(con, query_rows, batch_size):
+    """Yield the results of find_variants from its cursor, closing it after."""
+    try:
+        while rows := con.fetchmany(batch_size):
+            for query_id, unique_ids in rows:
+                unique_ids = unique_ids or []
+                variant = {
+                    k: v for k, v in query_rows[query_id].items() if v is not None
+                }
+                yield variant, len(unique_ids) > 0, unique_ids
+    finally:
+        con.close()
+
+
 def variant_frequency_per_cancer_type(
-    chrom, start, end, ref, alt, clinical_attribute, directory=None
+    chrom, start, end, ref, alt, clinical_attribute, directory=None, cohort=None
 ):
-    """Check how frequently a particular variant occurs per cancer type."""
+    """Check how frequently a particular variant occurs per cancer type, in the
+    samples of an optional cohort expression."""
     if directory is None:
         directory = Path(settings.PROCESSED_PATH) / "combined"
     else:
         directory = Path(directory)
 
-    mutations_path = directory / "combined_mutations.parquet"
-    clinical_path = directory / "combined_clinical_sample.parquet"
-
-    query = f"""
-    SELECT clinical.{clinical_attribute}, COUNT(*) as frequency
-    FROM '{mutations_path}' AS mutations
-    JOIN '{clinical_path}' AS clinical
-    ON mutations.Tumor_Sample_Barcode = clinical.SAMPLE_ID
-    WHERE mutations.Chromosome = '{chrom}'
-    AND mutations.Start_Position = '{start}'
-    AND mutations.End_Position = '{end}'
-    AND mutations.Reference_Allele = '{ref}'
-    AND mutations.Tumor_Seq_Allele2 = '{alt}'
-    GROUP BY clinical.{clinical_attribute}
-    ORDER BY frequency DESC
-    """
+    args = [
+        normalize_chromosome(chrom),
+        int(start),
+        int(end),
+        ref,
+        alt,
+        clinical_attribute,
+        cohort,
+    ]
+    return get_query_cache().get_or_compute(
+        "variant_frequency_per_cancer_type",
+        directory,
+        args,
+        lambda: _variant_frequency_per_cancer_type(directory, *args),
+    )
 
-    con = duckdb.connect()
-    result = con.execute(query).fetchall()
-    con.close()
+
+def _variant_frequency_per_cancer_type(
+    directory, chrom, start, end, ref, alt, clinical_attribute, cohort
+):
+    con = get_connection(directory)
+    try:
+        clinical_join, value, params = get_clinical_attribute_join(
+            con, directory, clinical_attribute
+        )
+        cohort_join = get_cohort_join(con, directory, cohort, "mutations")
+
+        query = f"""
+        SELECT {value}, COUNT(*) as frequency
+        FROM mutations
+        {cohort_join}
+        {clinical_join}
+        WHERE mutations.Chromosome = ?
+        AND mutations.Start_Position = ?
+        AND mutations.End_Position = ?
+        AND mutations.Reference_Allele = ?
+        AND mutations.Tumor_Seq_Allele2 = ?
+        GROUP BY {value}
+        ORDER BY frequency DESC
+        """
+        with span("query.variant_frequency") as timing:
+            result = con.execute(
+                query, params + [chrom, start, end, ref, alt]
+            ).fetchall()
+            timing.rows = len(result)
+    finally:
+        con.close()
 
     return result
 
 
+def get_views(con):
+    """Return the names of the views in the catalog."""
+    return {
+        row[0]
+        for row in con.execute(
+            "SELECT view_name FROM duckdb_views() WHERE NOT internal"
+        ).fetchall()
+    }
+
+
+def get_attribute_datatype(directory, name, attribute):
+    """Return the cBioPortal datatype of a clinical attribute of a combined table."""
+    metadata = get_combined_dataset(directory, name).schema.metadata or {}
+    if CLINICAL_ATTRIBUTES_KEY not in metadata:
+        return "STRING"
+    attributes = json.loads(metadata[CLINICAL_ATTRIBUTES_KEY])
+    return attributes.get(attribute, {}).get("datatype", "STRING")
+
+
+def get_clinical_attribute_join(
+    con, directory, clinical_attribute, sample_column="mutations.Tumor_Sample_Barcode"
+):
+    """Build the join of a table of samples with a clinical sample attribute.
+
+    Picks the cheapest table holding the attribute: the core table for the
+    common attributes, the long table for any other attribute, and the wide
+    table when the combine predates the derived tables. Returns the join
+    clause, the expression for the attribute value and the join parameters.
+    sample_column is the column with the sample ids in the joined table.
+    Raises ValueError for an unknown attribute.
+    """
+    views = get_views(con)
+    if {"clinical_sample_core", "clinical_sample_long"} - views:
+        if clinical_attribute not in get_clinical_columns(con, "clinical_sample"):
+            raise ValueError(f"Unknown clinical attribute: {clinical_attribute}")
+        value = f"clinical.{quote_identifier(clinical_attribute)}"
+        join = (
+            "JOIN clinical_sample AS clinical "
+            f"ON {sample_column} = clinical.SAMPLE_ID"
+        )
+        return join, value, []
+
+    if clinical_attribute in get_clinical_columns(con, "clinical_sample_core"):
+        value = f"clinical.{quote_identifier(clinical_attribute)}"
+        join = (
+            "JOIN clinical_sample_core AS clinical "
+            f"ON {sample_column} = clinical.SAMPLE_ID"
+        )
+        return join, value, []
+
+    found = con.execute(
+        "SELECT 1 FROM clinical_sample_long WHERE attribute = ? LIMIT 1",
+        [clinical_attribute],
+    ).fetchone()
+    # an attribute without any values only shows up in the wide table
+    if found is None and clinical_attribute not in get_clinical_columns(
+        con, "clinical_sample"
+    ):
+        raise ValueError(f"Unknown clinical attribute: {clinical_attribute}")
+
+    datatype = get_attribute_datatype(
+        directory, "combined_clinical_sample_long", clinical_attribute
+    )
+    value = "clinical.value"
+    if datatype in LONG_VALUE_TYPES:
+        value = f"TRY_CAST(clinical.value AS {LONG_VALUE_TYPES[datatype]})"
+    # keep samples without a value for the attribute, like the wide table does
+    join = (
+        "JOIN clinical_sample_core AS samples "
+        f"ON {sample_column} = samples.SAMPLE_ID "
+        "LEFT JOIN clinical_sample_long AS clinical "
+        "ON clinical.study_id = samples.study_id "
+        "AND clinical.SAMPLE_ID = samples.SAMPLE_ID "
+        "AND clinical.attribute = ?"
+    )
+    return join, value, [clinical_attribute]
+
+
 def get_genomic_coordinates_by_gene_and_protein_change(
     gene, protein_change, directory=None
 ):
@@ -157,30 +896,139 @@ def get_genomic_coordinates_by_gene_and_protein_change(
     else:
         directory = Path(directory)
 
-    mutations_path = directory / "combined_mutations.parquet"
-
     # Ensure the protein change starts with "p."
     protein_change = (
         protein_change if protein_change.startswith("p.") else f"p.{protein_change}"
     )
 
-    query = f"""
-    SELECT 
-        Chromosome, 
-        Start_Position, 
-        End_Position, 
-        Reference_Allele, 
-        Tumor_Seq_Allele2, 
+    return get_query_cache().get_or_compute(
+        "get_genomic_coordinates_by_gene_and_protein_change",
+        directory,
+        [gene, protein_change],
+        lambda: _get_genomic_coordinates_by_gene_and_protein_change(
+            directory, gene, protein_change
+        ),
+    )
+
+
+def _get_genomic_coordinates_by_gene_and_protein_change(
+    directory, gene, protein_change
+):
+    query = """
+    SELECT
+        Chromosome,
+        Start_Position,
+        End_Position,
+        Reference_Allele,
+        Tumor_Seq_Allele2,
         COUNT(*) as frequency
-    FROM '{mutations_path}'
-    WHERE Hugo_Symbol = '{gene}'
-    AND HGVSp_Short = '{protein_change}'
+    FROM mutations
+    WHERE Hugo_Symbol = ?
+    AND HGVSp_Short = ?
     GROUP BY Chromosome, Start_Position, End_Position, Reference_Allele, Tumor_Seq_Allele2
     ORDER BY frequency DESC
     """
 
-    con = duckdb.connect()
-    result = con.execute(query).fetchall()
-    con.close()
+    con = get_connection(directory)
+    try:
+        with span("query.convert") as timing:
+            result = con.execute(query, [gene, protein_change]).fetchall()
+            timing.rows = len(result)
+    finally:
+        con.close()
+
+    return result
+
+
+def cna_value_filter(alteration):
+    """Return the SQL condition and parameters selecting a kind of CNA."""
+    if alteration not in CNA_ALTERATIONS:
+        raise ValueError(
+            f"Unknown alteration: {alteration}, choose from {', '.join(CNA_ALTERATIONS)}"
+        )
+    values = CNA_ALTERATIONS[alteration]
+    return f"cna.value IN ({', '.join('?' for _ in values)})", values
+
+
+def find_cna(gene, alteration="AMP", directory=None, cohort=None):
+    """Find the samples with a copy-number alteration of a gene, optionally
+    only those in a cohort expression.
+
+    Returns a list of study_id:sample_id identifiers.
+    """
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    condition, values = cna_value_filter(alteration)
+    con = get_connection(directory)
+    try:
+        cohort_join = get_cohort_join(con, directory, cohort, "cna")
+        query = f"""
+        SELECT cna.study_id || ':' || cna.SAMPLE_ID
+        FROM cna
+        {cohort_join}
+        WHERE cna.Hugo_Symbol = ?
+        AND {condition}
+        ORDER BY cna.study_id, cna.SAMPLE_ID
+        """
+        with span("query.find_cna") as timing:
+            result = [row[0] for row in con.execute(query, [gene, *values]).fetchall()]
+            timing.rows = len(result)
+    finally:
+        con.close()
+    return result
+
+
+def cna_frequency_per_cancer_type(
+    gene,
+    alteration="AMP",
+    clinical_attribute="CANCER_TYPE",
+    directory=None,
+    cohort=None,
+):
+    """Count the samples with a copy-number alteration of a gene per cancer type
+    (or other clinical sample attribute), in an optional cohort expression."""
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    args = [gene, alteration, clinical_attribute, cohort]
+    return get_query_cache().get_or_compute(
+        "cna_frequency_per_cancer_type",
+        directory,
+        args,
+        lambda: _cna_frequency_per_cancer_type(directory, *args),
+    )
+
+
+def _cna_frequency_per_cancer_type(
+    directory, gene, alteration, clinical_attribute, cohort
+):
+    condition, values = cna_value_filter(alteration)
+    con = get_connection(directory)
+    try:
+        clinical_join, value, params = get_clinical_attribute_join(
+            con, directory, clinical_attribute, sample_column="cna.SAMPLE_ID"
+        )
+        cohort_join = get_cohort_join(con, directory, cohort, "cna")
+
+        query = f"""
+        SELECT {value}, COUNT(*) as frequency
+        FROM cna
+        {cohort_join}
+        {clinical_join}
+        WHERE cna.Hugo_Symbol = ?
+        AND {condition}
+        GROUP BY {value}
+        ORDER BY frequency DESC
+        """
+        with span("query.cna_frequency") as timing:
+            result = con.execute(query, params + [gene, *values]).fetchall()
+            timing.rows = len(result)
+    finally:
+        con.close()
 
     return result
@@ -1,23 +1,16 @@
 import os
-from pathlib import Path
-import shutil
 import click
-import importlib.metadata
-import pandas as pd
-import pyarrow as pa
-import time
+import cProfile
 from dynaconf import (
     settings,
 )
-from .analyze import (
-    find_variant,
-    get_genomic_coordinates_by_gene_and_protein_change,
-    variant_frequency_per_cancer_type,
-    MUTATION_COLUMNS,
-)
+from . import metrics
 from .data_commands import data  # Import the data subcommand group
-from .study import Study  # Assuming the Study class is in a file named study.py
-from tabulate import tabulate
+from .defaults import CNA_ALTERATIONS
+from .server import get_server_url, query_server, serve
+
+# pandas, pyarrow, duckdb and tabulate are imported inside the commands that
+# use them, so `cbiohub --help`, `version` and `config` start quickly
 
 settings.PROCESSED_PATH = os.path.expanduser(settings.PROCESSED_PATH)
 
@@ -32,12 +25,84 @@ def common_options(func):
     return func
 
 
+def server_option(func):
+    """Decorator to add the option to forward a query to a running server."""
+    func = click.option(
+        "--server",
+        "server_url",
+        default=None,
+        help="Forward the query to a running `cbiohub serve` (http://host:port "
+        "or unix:///path/to/socket), defaults to the SERVER_URL setting",
+    )(func)
+    return func
+
+
+def cohort_option(func):
+    """Decorator to add the option to restrict a query to a cohort of samples."""
+    func = click.option(
+        "--cohort",
+        default=None,
+        help="Only include the samples of a cohort expression, e.g. "
+        "'CANCER_TYPE=Melanoma AND SAMPLE_TYPE=Metastasis'",
+    )(func)
+    return func
+
+
+def forward_query(server_url, endpoint, params):
+    """Forward a query to a running server, returning None if it can't be reached."""
+    try:
+        return query_server(server_url, endpoint, params)
+    except OSError as e:
+        click.echo(
+            click.style(f"❌ Could not reach server {server_url}: {e}", fg="red")
+        )
+        return None
+
+
 @click.group()
-def cli():
-    pass
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print the time, rows, bytes and peak memory of every stage when done.",
+)
+@click.option(
+    "--metrics-json",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the timing spans of every stage and study to a JSON file.",
+)
+@click.option(
+    "--cprofile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Dump cProfile statistics to a file, to inspect with pstats or snakeviz.",
+)
+@click.pass_context
+def cli(ctx, profile, metrics_json, cprofile):
+    if profile or metrics_json:
+        metrics.enable()
+    profiler = None
+    if cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def report():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile)
+            click.echo(f"cProfile statistics saved to {cprofile}", err=True)
+        if metrics_json:
+            metrics.write_json(metrics_json)
+            click.echo(f"Metrics saved to {metrics_json}", err=True)
+        if profile:
+            click.echo(metrics.format_summary(metrics.get_spans()), err=True)
+
+    ctx.call_on_close(report)
 
 
 cli.add_command(data)
+cli.add_command(serve)
 
 
 @cli.command()
@@ -50,6 +115,8 @@ def config():
 @cli.command()
 def version():
     """Display the current version of the tool."""
+    import importlib.metadata
+
     try:
         version = importlib.metadata.version("cbiohub")
         click.echo(f"{version}")
@@ -74,20 +141,41 @@ class CustomCommand(click.Command):
 @click.argument("arg3", required=False)
 @click.argument("arg4", required=False)
 @click.argument("arg5", required=False)
-def find(arg1, arg2, arg3, arg4, arg5):
+@cohort_option
+@server_option
+def find(arg1, arg2, arg3, arg4, arg5, cohort, server_url):
     """Find a variant in the combined mutations parquet and return details."""
+    from .analyze import find_variant
+
     if arg1 and arg2 and arg3 and arg4:
         # assuming chrom/pos/start/end
-        exists, unique_ids = find_variant(
-            chrom=arg1, start=arg2, end=arg3, ref=arg4, alt=arg5
-        )
+        query = dict(chrom=arg1, start=arg2, end=arg3, ref=arg4, alt=arg5)
     elif arg1 and arg2:
         # assuming gene/protein_change
-        exists, unique_ids = find_variant(hugo_symbol=arg1, protein_change=arg2)
+        query = dict(gene=arg1, protein_change=arg2)
     else:
         click.echo(click.style("❌ Invalid arguments.", fg="red"))
         return
 
+    server_url = get_server_url(server_url)
+    try:
+        if server_url:
+            response = forward_query(server_url, "find", {**query, "cohort": cohort})
+            if response is None:
+                return
+            exists, unique_ids = response["exists"], response["unique_ids"]
+        elif "gene" in query:
+            exists, unique_ids = find_variant(
+                hugo_symbol=query["gene"],
+                protein_change=query["protein_change"],
+                cohort=cohort,
+            )
+        else:
+            exists, unique_ids = find_variant(**query, cohort=cohort)
+    except ValueError as e:
+        click.echo(click.style(f"❌ {e}", fg="red"))
+        return
+
     if exists:
         studies = set([id.split(":")[0] for id in unique_ids])
         click.echo(
@@ -102,6 +190,56 @@ def find(arg1, arg2, arg3, arg4, arg5):
         click.echo(click.style("❌ Variant not found.", fg="red"))
 
 
+@cli.command(
+    name="find-batch",
+    help="Find all variants in a VCF, MAF or TSV file in the combined mutations. "
+    "TSV files need either chrom, start, end, ref, alt or gene, protein_change columns.",
+)
+@click.argument("variants_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the results to as TSV (default: stdout)",
+)
+@common_options
+@cohort_option
+def find_batch(variants_file, output, processed_dir, cohort):
+    """Find all variants in a file with a single scan of the combined mutations."""
+    from .analyze import find_variants, read_query_variants
+
+    try:
+        variants = read_query_variants(variants_file)
+    except ValueError as e:
+        click.echo(click.style(f"❌ {e}", fg="red"), err=True)
+        return
+
+    try:
+        results = find_variants(variants, processed_dir, cohort=cohort)
+    except ValueError as e:
+        click.echo(click.style(f"❌ {e}", fg="red"), err=True)
+        return
+
+    columns = [name for name in variants.schema.names if name != "query_id"]
+    output.write("\t".join(columns + ["num_samples", "num_studies", "samples"]))
+    output.write("\n")
+
+    found_count = 0
+    for variant, exists, unique_ids in results:
+        found_count += exists
+        studies = set([id.split(":")[0] for id in unique_ids])
+        values = [str(variant.get(col, "")) for col in columns]
+        values += [str(len(unique_ids)), str(len(studies)), ",".join(unique_ids)]
+        output.write("\t".join(values) + "\n")
+
+    click.echo(
+        click.style(
+            f"✅ Found {found_count} of {variants.num_rows} variants.", fg="green"
+        ),
+        err=True,
+    )
+
+
 @cli.command(help="Check how frequently a particular variant occurs per cancer type.")
 @click.argument("chrom")
 @click.argument("start", type=int)
@@ -114,12 +252,50 @@ def find(arg1, arg2, arg3, arg4, arg5):
     help="Clinical attribute to group by (default: CANCER_TYPE)",
 )
 @common_options
-def variant_frequency(chrom, start, end, ref, alt, clinical_attribute, processed_dir):
+@cohort_option
+@server_option
+def variant_frequency(
+    chrom, start, end, ref, alt, clinical_attribute, processed_dir, cohort, server_url
+):
     """Check how frequently a particular variant occurs per cancer type (or
     other clinical sample attributes)."""
-    result = variant_frequency_per_cancer_type(
-        chrom, start, end, ref, alt, clinical_attribute, directory=processed_dir
-    )
+    from tabulate import tabulate
+
+    from .analyze import variant_frequency_per_cancer_type
+
+    server_url = get_server_url(server_url, processed_dir)
+    try:
+        if server_url:
+            response = forward_query(
+                server_url,
+                "variant-frequency",
+                dict(
+                    chrom=chrom,
+                    start=start,
+                    end=end,
+                    ref=ref,
+                    alt=alt,
+                    clinical_attribute=clinical_attribute,
+                    cohort=cohort,
+                ),
+            )
+            if response is None:
+                return
+            result = response["result"]
+        else:
+            result = variant_frequency_per_cancer_type(
+                chrom,
+                start,
+                end,
+                ref,
+                alt,
+                clinical_attribute,
+                directory=processed_dir,
+                cohort=cohort,
+            )
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red"))
+        return
     if result:
         click.echo(
             click.style(f"✅ Variant frequency per {clinical_attribute}:", fg="green")
@@ -131,6 +307,260 @@ def variant_frequency(chrom, start, end, ref, alt, clinical_attribute, processed
         click.echo(click.style("❌ No data found.", fg="red"))
 
 
+@cli.command(
+    help="Check how frequently a gene has a copy-number alteration per cancer type."
+)
+@click.argument("gene")
+@click.option(
+    "--alteration",
+    type=click.Choice(list(CNA_ALTERATIONS)),
+    default="AMP",
+    help="Kind of copy-number alteration (default: AMP)",
+)
+@click.option(
+    "--clinical-attribute",
+    default="CANCER_TYPE",
+    help="Clinical attribute to group by (default: CANCER_TYPE)",
+)
+@common_options
+@cohort_option
+def cna_frequency(gene, alteration, clinical_attribute, processed_dir, cohort):
+    """Check how frequently a gene has a copy-number alteration per cancer type
+    (or other clinical sample attributes)."""
+    from tabulate import tabulate
+
+    from .analyze import cna_frequency_per_cancer_type
+
+    try:
+        result = cna_frequency_per_cancer_type(
+            gene, alteration, clinical_attribute, directory=processed_dir, cohort=cohort
+        )
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red"))
+        return
+    if result:
+        click.echo(
+            click.style(
+                f"✅ {gene} {alteration} frequency per {clinical_attribute}:",
+                fg="green",
+            )
+        )
+        headers = ["Cancer Type", "Count"]
+        click.echo(tabulate(result, headers, tablefmt="plain"))
+    else:
+        click.echo(click.style("❌ No data found.", fg="red"))
+
+
+@cli.command(
+    help="Show the most frequently mutated genes, protein changes or variants."
+)
+@click.option(
+    "--level",
+    type=click.Choice(["gene", "protein_change", "variant"]),
+    default="gene",
+    help="What to count the mutated samples of (default: gene)",
+)
+@click.option(
+    "--clinical-attribute",
+    default=None,
+    help="Clinical attribute to group by, e.g. CANCER_TYPE",
+)
+@click.option(
+    "--value",
+    "attribute_value",
+    default=None,
+    help="Only show this value of the clinical attribute",
+)
+@click.option("--gene", default=None, help="Only show this gene")
+@click.option(
+    "--limit",
+    type=int,
+    default=20,
+    show_default=True,
+    help="Number of rows to show (per attribute value), 0 for all",
+)
+@common_options
+def summary(level, clinical_attribute, attribute_value, gene, limit, processed_dir):
+    """Show the most frequently mutated genes, protein changes or variants,
+    overall or per cancer type (or other clinical sample attributes), from the
+    summary tables built by combine."""
+    from tabulate import tabulate
+
+    from .summaries import SUMMARY_LEVELS, mutation_summary
+
+    try:
+        result = mutation_summary(
+            level,
+            clinical_attribute,
+            attribute_value,
+            gene,
+            limit,
+            directory=processed_dir,
+        )
+    except ValueError as e:
+        click.echo(click.style(str(e), fg="red"))
+        return
+    if result:
+        headers = [
+            *([clinical_attribute] if clinical_attribute else []),
+            *SUMMARY_LEVELS[level],
+            "Samples",
+            "Patients",
+            "Studies",
+            "Frequency",
+        ]
+        click.echo(click.style(f"✅ Most frequently mutated {level}s:", fg="green"))
+        click.echo(tabulate(result, headers, tablefmt="plain", floatfmt=".4f"))
+    else:
+        click.echo(click.style("❌ No data found.", fg="red"))
+
+
+@cli.command(
+    help="Test pairs of genes for co-occurrence or mutual exclusivity of mutations."
+)
+@click.option(
+    "--genes",
+    default=None,
+    help="Comma separated genes to test (default: the most frequently mutated)",
+)
+@click.option(
+    "--top",
+    type=int,
+    default=100,
+    show_default=True,
+    help="Number of most frequently mutated genes to test without --genes",
+)
+@click.option(
+    "--study",
+    "studies",
+    multiple=True,
+    help="Only include samples of this study, can be repeated",
+)
+@click.option(
+    "--filter",
+    "filters",
+    multiple=True,
+    help="Only include samples with a clinical attribute value, e.g. "
+    "CANCER_TYPE=Melanoma, can be repeated",
+)
+@click.option("--workers", type=int, default=1, show_default=True)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the results to as TSV (default: stdout)",
+)
+@common_options
+@cohort_option
+def cooccurrence(genes, top, studies, filters, workers, output, processed_dir, cohort):
+    """Test every pair of genes for co-occurrence or mutual exclusivity of their
+    mutations, with a one-sided Fisher's exact test."""
+    from .cooccurrence import gene_cooccurrence
+
+    clinical_filters = {}
+    for clinical_filter in filters:
+        attribute, sep, value = clinical_filter.partition("=")
+        if not sep:
+            click.echo(
+                click.style(f"❌ Invalid filter {clinical_filter}", fg="red"), err=True
+            )
+            return
+        clinical_filters.setdefault(attribute, []).append(value)
+
+    try:
+        result = gene_cooccurrence(
+            genes=genes.split(",") if genes else None,
+            top=top,
+            studies=list(studies),
+            clinical_filters=clinical_filters,
+            cohort=cohort,
+            workers=workers,
+            directory=processed_dir,
+        )
+    except ValueError as e:
+        click.echo(click.style(f"❌ {e}", fg="red"), err=True)
+        return
+    result.to_csv(output, sep="\t", index=False)
+    click.echo(
+        click.style(f"✅ Tested {len(result)} pairs of genes.", fg="green"), err=True
+    )
+
+
+@cli.command(name="cohort", help="List the samples of a cohort expression.")
+@click.argument("expression")
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the study_id:sample_id of the samples to (default: stdout)",
+)
+@common_options
+def cohort_command(expression, output, processed_dir):
+    """List the samples of a cohort expression like 'CANCER_TYPE=Melanoma AND
+    SAMPLE_TYPE=Metastasis'. Attributes are compared with = or != and combined
+    with AND, OR, NOT and parentheses."""
+    from pathlib import Path
+
+    from .cohort_index import select_cohort
+
+    directory = (
+        Path(processed_dir)
+        if processed_dir
+        else Path(settings.PROCESSED_PATH) / "combined"
+    )
+    try:
+        samples = select_cohort(expression, directory)
+    except ValueError as e:
+        click.echo(click.style(f"❌ {e}", fg="red"), err=True)
+        return
+    for study_id, sample_id in zip(
+        samples["study_id"].to_pylist(), samples["SAMPLE_ID"].to_pylist()
+    ):
+        output.write(f"{study_id}:{sample_id}\n")
+    click.echo(
+        click.style(
+            f"✅ {samples.num_rows} samples in "
+            f"{len(set(samples['study_id'].to_pylist()))} studies.",
+            fg="green",
+        ),
+        err=True,
+    )
+
+
+@cli.command(help="Get the expression of a gene across all samples.")
+@click.argument("gene")
+@click.option(
+    "--profile",
+    default=None,
+    help="Glob pattern of the expression profiles to read, e.g. "
+    "'mrna_seq_v2_rsem_zscores*' (default: all profiles)",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the values to as TSV (default: stdout)",
+)
+@common_options
+def expression(gene, profile, output, processed_dir):
+    """Get the values of a gene in the expression profiles of all studies."""
+    from .expression import get_expression
+
+    df = get_expression(gene, profile, directory=processed_dir)
+    if df.empty:
+        click.echo(click.style("❌ No data found.", fg="red"), err=True)
+        return
+    df.to_csv(output, sep="\t", index=False)
+    click.echo(
+        click.style(
+            f"✅ Found {len(df)} values of {gene} in "
+            f"{df['study_id'].nunique()} studies.",
+            fg="green",
+        ),
+        err=True,
+    )
+
+
 @cli.command(
     help="Convert a gene and protein change to genomic coordinates and count occurrences."
 )
@@ -142,12 +572,26 @@ def variant_frequency(chrom, start, end, ref, alt, clinical_attribute, processed
     help="Directory containing the processed parquet files",
 )
 @common_options
-def convert(gene, protein_change, processed_dir):
+@server_option
+def convert(gene, protein_change, processed_dir, server_url):
     """Convert a gene and protein change to its corresponding genomic coordinates and count occurrences."""
+    from tabulate import tabulate
+
+    from .analyze import get_genomic_coordinates_by_gene_and_protein_change
+
+    server_url = get_server_url(server_url, processed_dir)
     try:
-        results = get_genomic_coordinates_by_gene_and_protein_change(
-            gene, protein_change, directory=processed_dir
-        )
+        if server_url:
+            response = forward_query(
+                server_url, "convert", dict(gene=gene, protein_change=protein_change)
+            )
+            if response is None:
+                return
+            results = response["result"]
+        else:
+            results = get_genomic_coordinates_by_gene_and_protein_change(
+                gene, protein_change, directory=processed_dir
+            )
         if results:
             click.echo(
                 click.style(
@@ -0,0 +1,414 @@
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dynaconf import settings
+
+INDEX_DIR = "cohort_index"
+
+# Column with the dense id of the sample of each row, added by combine to the
+# clinical sample, mutation and copy-number tables. Every study gets a
+# contiguous range of ids, recorded in the combine manifest, so the ids of
+# unchanged studies stay valid in an incremental combine.
+SAMPLE_KEY_COLUMN = "sample_key"
+
+# Clinical sample attributes with a bitmap per value, unless configured with
+# COHORT_ATTRIBUTES. study_id is always indexed.
+COHORT_ATTRIBUTES = [
+    "CANCER_TYPE",
+    "CANCER_TYPE_DETAILED",
+    "ONCOTREE_CODE",
+    "SAMPLE_TYPE",
+]
+
+# Every (study_id, SAMPLE_ID) pair and its dense sample id, the bit it has in
+# the bitmaps. Ids of removed studies leave gaps.
+SAMPLES_SCHEMA = pa.schema(
+    [
+        (SAMPLE_KEY_COLUMN, pa.uint32()),
+        ("study_id", pa.string()),
+        ("SAMPLE_ID", pa.string()),
+    ]
+)
+
+# The bitmap of the samples with each value of an attribute, as packed
+# little-endian 64 bit words
+BITMAPS_SCHEMA = pa.schema(
+    [
+        ("attribute", pa.string()),
+        ("value", pa.string()),
+        ("bitmap", pa.binary()),
+    ]
+)
+
+# Loaded indexes, keyed by directory, see load_cohort_index
+_indexes = {}
+
+
+def get_cohort_attributes():
+    """Return the clinical sample attributes that get bitmaps."""
+    return list(settings.get("COHORT_ATTRIBUTES", COHORT_ATTRIBUTES))
+
+
+def num_words(num_samples):
+    return (num_samples + 63) // 64
+
+
+def to_bitmap(sample_ids, num_samples):
+    """Pack the given dense sample ids into a bitmap."""
+    bitmap = np.zeros(num_words(num_samples), dtype=np.uint64)
+    np.bitwise_or.at(
+        bitmap,
+        sample_ids // 64,
+        np.left_shift(np.uint64(1), (sample_ids % 64).astype(np.uint64)),
+    )
+    return bitmap
+
+
+def from_bitmap(bitmap, num_samples):
+    """Return the dense sample ids set in a bitmap."""
+    bits = np.unpackbits(bitmap.view(np.uint8), bitorder="little")[:num_samples]
+    return np.nonzero(bits)[0]
+
+
+def bitmap_contains(bitmap, sample_keys):
+    """Test which of an Arrow array of sample ids are set in a bitmap.
+
+    Null ids, of samples without clinical data, are never set. Returns a
+    numpy bool array.
+    """
+    valid = pc.is_valid(sample_keys).to_numpy(zero_copy_only=False)
+    ids = pc.fill_null(pc.cast(sample_keys, pa.int64()), 0).to_numpy()
+    words = ids >> 6
+    valid &= words < len(bitmap)
+    words[~valid] = 0
+    bits = (bitmap[words] >> (ids & 63).astype(np.uint64)) & np.uint64(1)
+    return valid & (bits == 1)
+
+
+def study_samples(table):
+    """Return the sorted distinct SAMPLE_IDs of a study's clinical sample table."""
+    if table is None or "SAMPLE_ID" not in table.schema.names:
+        return pa.array([], pa.string())
+    samples = pc.unique(pc.drop_null(pc.cast(table["SAMPLE_ID"], pa.string())))
+    return samples.take(pc.array_sort_indices(samples))
+
+
+def sample_keys(column, samples, first):
+    """Return the dense ids of the samples in column, numbered from first in
+    the order of samples. Samples not in samples get a null id."""
+    index = pc.index_in(pc.cast(column, pa.string()), value_set=samples)
+    return pc.cast(pc.add(index, first), pa.uint32())
+
+
+def build_cohort_index(directory):
+    """Build the cohort index of the combined clinical samples in directory.
+
+    Every (study_id, SAMPLE_ID) has the dense id combine assigned it in the
+    sample_key column, and every value of the indexed attributes a bitmap of
+    its samples. The bitmaps are stored zstd compressed, which shrinks them
+    to little more than their runs.
+    """
+    from .analyze import get_combined_dataset
+
+    directory = Path(directory)
+    index_path = directory / INDEX_DIR
+    if not (
+        (directory / "combined_clinical_sample").is_dir()
+        or (directory / "combined_clinical_sample.parquet").exists()
+    ):
+        if index_path.exists():
+            shutil.rmtree(index_path)
+        return None
+
+    dataset = get_combined_dataset(directory, "combined_clinical_sample")
+    attributes = ["study_id"] + [
+        name for name in get_cohort_attributes() if name in dataset.schema.names
+    ]
+    table = dataset.to_table(
+        columns=list(
+            dict.fromkeys([SAMPLE_KEY_COLUMN, "study_id", "SAMPLE_ID", *attributes])
+        )
+    )
+    table = table.filter(pc.is_valid(table[SAMPLE_KEY_COLUMN]))
+    # a sample listed twice in a study keeps its first row
+    table = table.sort_by([(SAMPLE_KEY_COLUMN, "ascending")])
+    ids = table[SAMPLE_KEY_COLUMN].to_numpy()
+    first = np.ones(table.num_rows, dtype=bool)
+    first[1:] = ids[1:] != ids[:-1]
+    table = table.filter(pa.array(first))
+    ids = ids[first]
+    num_samples = int(ids[-1]) + 1 if len(ids) else 0
+
+    samples = pa.table(
+        [table[SAMPLE_KEY_COLUMN], table["study_id"], table["SAMPLE_ID"]],
+        schema=SAMPLES_SCHEMA,
+    )
+
+    names, values, bitmaps = [], [], []
+    for attribute in attributes:
+        encoded = pc.cast(table[attribute], pa.string()).combine_chunks()
+        encoded = encoded.dictionary_encode()
+        indices = encoded.indices.to_numpy(zero_copy_only=False)
+        valid = encoded.is_valid().to_numpy(zero_copy_only=False)
+        valid_ids = ids[valid]
+        codes = indices[valid]
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(encoded.dictionary) + 1))
+        for code, value in enumerate(encoded.dictionary.to_pylist()):
+            value_ids = valid_ids[order[bounds[code] : bounds[code + 1]]]
+            if len(value_ids) == 0:
+                continue
+            names.append(attribute)
+            values.append(value)
+            bitmaps.append(to_bitmap(value_ids, num_samples).tobytes())
+    bitmap_table = pa.table(
+        [pa.array(names), pa.array(values), pa.array(bitmaps, pa.binary())],
+        schema=BITMAPS_SCHEMA,
+    )
+
+    index_path.mkdir(exist_ok=True)
+    for name, output in [("samples", samples), ("bitmaps", bitmap_table)]:
+        tmp_file = index_path / f"{name}.parquet.tmp"
+        pq.write_table(output, tmp_file, compression="zstd")
+        tmp_file.replace(index_path / f"{name}.parquet")
+    return index_path
+
+
+class CohortIndex:
+    """The dense sample ids and attribute bitmaps of a combined directory."""
+
+    def __init__(self, samples, bitmaps):
+        self.samples = samples
+        self.sample_keys = samples[SAMPLE_KEY_COLUMN].to_numpy()
+        # the number of bits of the bitmaps, ids of removed studies included
+        self.num_samples = int(self.sample_keys[-1]) + 1 if len(self.sample_keys) else 0
+        self.bitmaps = {}
+        for attribute, value, bitmap in zip(
+            bitmaps["attribute"].to_pylist(),
+            bitmaps["value"].to_pylist(),
+            bitmaps["bitmap"].to_pylist(),
+        ):
+            self.bitmaps.setdefault(attribute, {})[value] = np.frombuffer(
+                bitmap, dtype=np.uint64
+            )
+
+    def all(self):
+        """Return the bitmap of all samples."""
+        return to_bitmap(self.sample_keys, self.num_samples)
+
+    def none(self):
+        return np.zeros(num_words(self.num_samples), dtype=np.uint64)
+
+    def attribute_bitmaps(self, attribute):
+        """Return the bitmaps of all values of an attribute."""
+        if attribute not in self.bitmaps:
+            raise ValueError(
+                f"{attribute} is not indexed, choose from "
+                f"{', '.join(sorted(self.bitmaps))} or add it to COHORT_ATTRIBUTES"
+            )
+        return self.bitmaps[attribute]
+
+    def bitmap(self, attribute, value):
+        """Return the bitmap of the samples with a value of an attribute."""
+        return self.attribute_bitmaps(attribute).get(value, self.none())
+
+    def has_value(self, attribute):
+        """Return the bitmap of the samples with any value of an attribute."""
+        bitmap = self.none()
+        for values in self.attribute_bitmaps(attribute).values():
+            bitmap |= values
+        return bitmap
+
+    def to_samples(self, bitmap):
+        """Return the (study_id, SAMPLE_ID) table of the samples in a bitmap."""
+        rows = np.searchsorted(self.sample_keys, from_bitmap(bitmap, self.num_samples))
+        return self.samples.take(pa.array(rows)).select(["study_id", "SAMPLE_ID"])
+
+
+def load_cohort_index(directory):
+    """Load the cohort index of a combined directory, None if it's missing or
+    older than the clinical samples."""
+    directory = Path(directory)
+    index_path = directory / INDEX_DIR
+    clinical = directory / "combined_clinical_sample"
+    clinical_file = (
+        clinical / "_common_metadata"
+        if clinical.is_dir()
+        else directory / "combined_clinical_sample.parquet"
+    )
+    try:
+        index_mtime = (index_path / "bitmaps.parquet").stat().st_mtime_ns
+        if index_mtime < clinical_file.stat().st_mtime_ns:
+            return None
+    except FileNotFoundError:
+        return None
+
+    key = str(directory.resolve())
+    cached = _indexes.get(key)
+    if cached is None or cached[0] != index_mtime:
+        index = CohortIndex(
+            pq.read_table(index_path / "samples.parquet"),
+            pq.read_table(index_path / "bitmaps.parquet"),
+        )
+        cached = (index_mtime, index)
+        _indexes[key] = cached
+    return cached[1]
+
+
+# Tokens of cohort expressions: parentheses, comparisons, quoted strings and
+# words
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:(?P<paren>[()])|(?P<op>!=|=)|"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<word>[^\s()=!"']+))"""
+)
+KEYWORDS = {"AND", "OR", "NOT"}
+
+
+def tokenize(expression):
+    """Split a cohort expression into (kind, text) tokens."""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Invalid cohort expression at {expression[position:]!r}")
+        position = match.end()
+        if match["paren"]:
+            tokens.append(("paren", match["paren"]))
+        elif match["op"]:
+            tokens.append(("op", match["op"]))
+        elif match["dq"] is not None or match["sq"] is not None:
+            tokens.append(
+                ("string", match["dq"] if match["dq"] is not None else match["sq"])
+            )
+        elif match["word"].upper() in KEYWORDS:
+            tokens.append(("keyword", match["word"].upper()))
+        else:
+            tokens.append(("word", match["word"]))
+    return tokens
+
+
+def parse_cohort(expression):
+    """Parse a cohort expression into a tree of tuples.
+
+    Expressions compare clinical attributes with = or != and combine them
+    with AND, OR, NOT and parentheses, e.g. CANCER_TYPE=Melanoma AND
+    SAMPLE_TYPE=Metastasis. Values with spaces can be quoted, or are read up
+    to the next keyword or parenthesis.
+    """
+    tokens = tokenize(expression)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take(kind=None, text=None):
+        nonlocal position
+        token = peek()
+        if (
+            token[0] is None
+            or (kind and token[0] != kind)
+            or (text and token[1] != text)
+        ):
+            expected = text or kind or "more"
+            raise ValueError(
+                f"Invalid cohort expression {expression!r}: expected {expected}"
+            )
+        position += 1
+        return token
+
+    def parse_or():
+        node = parse_and()
+        while peek() == ("keyword", "OR"):
+            take()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() == ("keyword", "AND"):
+            take()
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == ("keyword", "NOT"):
+            take()
+            return ("not", parse_not())
+        if peek() == ("paren", "("):
+            take()
+            node = parse_or()
+            take("paren", ")")
+            return node
+        attribute = take("word")[1]
+        op = take("op")[1]
+        if peek()[0] == "string":
+            value = take()[1]
+        else:
+            words = [take("word")[1]]
+            while peek()[0] == "word":
+                words.append(take()[1])
+            value = " ".join(words)
+        return ("eq" if op == "=" else "ne", attribute, value)
+
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError(
+            f"Invalid cohort expression {expression!r}: unexpected {tokens[position][1]!r}"
+        )
+    return node
+
+
+def evaluate_cohort(node, index):
+    """Evaluate a parsed cohort expression to a bitmap of its samples."""
+    kind = node[0]
+    if kind == "and":
+        return evaluate_cohort(node[1], index) & evaluate_cohort(node[2], index)
+    if kind == "or":
+        return evaluate_cohort(node[1], index) | evaluate_cohort(node[2], index)
+    if kind == "not":
+        return index.all() & ~evaluate_cohort(node[1], index)
+    attribute, value = node[1], node[2]
+    bitmap = index.bitmap(attribute, value)
+    if kind == "eq":
+        return bitmap.copy()
+    # like SQL, samples without a value don't match !=
+    return index.has_value(attribute) & ~bitmap
+
+
+def get_cohort_index(directory):
+    """Return the cohort index of directory, raising ValueError if there's none."""
+    index = load_cohort_index(directory)
+    if index is None:
+        raise ValueError(f"No cohort index in {directory}, run `cbiohub combine` first")
+    return index
+
+
+def select_cohort_bitmap(expression, directory):
+    """Return the bitmap of the dense sample ids of the samples in a cohort.
+
+    Raises ValueError for an invalid expression or when there's no cohort
+    index, run `cbiohub combine` to build it.
+    """
+    index = get_cohort_index(directory)
+    return evaluate_cohort(parse_cohort(expression), index)
+
+
+def select_cohort_keys(expression, directory):
+    """Return the dense sample ids of the samples in a cohort, see
+    select_cohort_bitmap."""
+    index = get_cohort_index(directory)
+    bitmap = evaluate_cohort(parse_cohort(expression), index)
+    return from_bitmap(bitmap, index.num_samples).astype(np.uint32)
+
+
+def select_cohort(expression, directory):
+    """Return the (study_id, SAMPLE_ID) table of the samples in a cohort, see
+    select_cohort_bitmap."""
+    index = get_cohort_index(directory)
+    return index.to_samples(evaluate_cohort(parse_cohort(expression), index))
@@ -0,0 +1,771 @@
+import json
+import shutil
+from pathlib import Path
+
+import click
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from .analyze import (
+    cast_mutation_table,
+    COMBINED_PARTITIONING,
+    MUTATION_COLUMNS,
+    quote_path,
+)
+from .cohort_index import SAMPLE_KEY_COLUMN, sample_keys, study_samples
+from .metrics import span
+from .study import CLINICAL_ATTRIBUTES_KEY, Study
+from .summaries import (
+    PARTIALS_DIR,
+    finalize_summaries,
+    get_summary_attributes,
+    write_study_summaries,
+)
+
+MANIFEST_FILE = "combine_manifest.json"
+MANIFEST_VERSION = 6
+
+# Processed per-study file for each combined table
+COMBINED_TABLES = {
+    "combined_mutations": "data_mutations.parquet",
+    "combined_clinical_patient": "data_clinical_patient.parquet",
+    "combined_clinical_sample": "data_clinical_sample.parquet",
+    "combined_cna": "data_cna.parquet",
+}
+QUARANTINE_TABLE = "quarantined_mutations"
+
+# Column with the sample of each row of the tables that get a SAMPLE_KEY_COLUMN
+SAMPLE_COLUMNS = {
+    "combined_mutations": "Tumor_Sample_Barcode",
+    "combined_clinical_sample": "SAMPLE_ID",
+    "combined_cna": "SAMPLE_ID",
+}
+
+# Tables derived from the wide clinical tables, which have a column for every
+# attribute of every study. The long (EAV) tables have one row per non-empty
+# attribute value, the core tables only the attributes most queries need.
+DERIVED_TABLES = {
+    "combined_clinical_patient_long": ("combined_clinical_patient", "long"),
+    "combined_clinical_patient_core": ("combined_clinical_patient", "core"),
+    "combined_clinical_sample_long": ("combined_clinical_sample", "long"),
+    "combined_clinical_sample_core": ("combined_clinical_sample", "core"),
+}
+CLINICAL_ID_COLUMNS = {
+    "combined_clinical_patient": ["study_id", "PATIENT_ID"],
+    "combined_clinical_sample": [
+        "study_id",
+        "SAMPLE_ID",
+        "PATIENT_ID",
+        SAMPLE_KEY_COLUMN,
+    ],
+}
+CORE_CLINICAL_ATTRIBUTES = {
+    "combined_clinical_patient": [
+        "SEX",
+        "AGE",
+        "RACE",
+        "OS_STATUS",
+        "OS_MONTHS",
+        "DFS_STATUS",
+        "DFS_MONTHS",
+    ],
+    "combined_clinical_sample": [
+        "CANCER_TYPE",
+        "CANCER_TYPE_DETAILED",
+        "ONCOTREE_CODE",
+        "SAMPLE_TYPE",
+        "TMB_NONSYNONYMOUS",
+    ],
+}
+
+COMBINED_DESCRIPTIONS = {
+    "combined_mutations": "✅ Combined mutations",
+    "combined_clinical_patient": "✅ Combined clinical patient data",
+    "combined_clinical_sample": "✅ Combined clinical sample data",
+    "combined_cna": "✅ Combined copy-number data",
+    "combined_clinical_patient_long": "✅ Long format clinical patient data",
+    "combined_clinical_patient_core": "✅ Core clinical patient attributes",
+    "combined_clinical_sample_long": "✅ Long format clinical sample data",
+    "combined_clinical_sample_core": "✅ Core clinical sample attributes",
+    QUARANTINE_TABLE: "⚠️ Quarantined mutations",
+}
+
+# Every table a combine writes, as a file or a fragment dataset
+OUTPUT_TABLES = [*COMBINED_TABLES, *DERIVED_TABLES, QUARANTINE_TABLE]
+
+# Per-study mutation fragments of a fragment combine, split by chromosome
+# partition. The fragments of each partition are merged into a single file
+# sorted by position, the partition's file in combined_mutations.
+MUTATION_FRAGMENTS_DIR = "mutation_fragments"
+PARTITION_FILE = "part-0.parquet"
+
+
+def sort_mutations(table):
+    """Sort mutations by locus so Parquet statistics can prune row groups."""
+    sort_keys = [
+        (col, "ascending")
+        for col in ["Chromosome", "Start_Position"]
+        if col in table.schema.names
+    ]
+    return table.sort_by(sort_keys) if sort_keys else table
+
+
+def merge_sorted_mutations(input_file, output_file, schema, row_group_size):
+    """Sort the mutations of input_file by locus into output_file.
+
+    DuckDB sorts out of core, spilling to a temporary directory next to the
+    output, so memory stays bounded however many studies are combined. The
+    result is streamed back through a ParquetWriter to keep the Arrow schema.
+    input_file can be a glob of files with different columns.
+    """
+    sort_keys = [col for col in ["Chromosome", "Start_Position"] if col in schema.names]
+    order_by = f"ORDER BY {', '.join(sort_keys)}" if sort_keys else ""
+    spill_path = output_file.parent / f"{output_file.name}.spill"
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET temp_directory = '{quote_path(spill_path)}'")
+        con.execute("SET preserve_insertion_order = false")
+        result = con.execute(
+            f"SELECT * FROM read_parquet('{quote_path(input_file)}', "
+            f"union_by_name = true) {order_by}"
+        )
+        # newer DuckDB releases deprecate fetch_record_batch for to_arrow_reader
+        to_arrow_reader = getattr(result, "to_arrow_reader", result.fetch_record_batch)
+        reader = to_arrow_reader(row_group_size)
+        with pq.ParquetWriter(output_file, schema) as writer:
+            for batch in reader:
+                writer.write_table(
+                    conform_to_schema(pa.Table.from_batches([batch]), schema),
+                    row_group_size=row_group_size,
+                )
+    finally:
+        con.close()
+        shutil.rmtree(spill_path, ignore_errors=True)
+
+
+def conform_to_schema(table, schema):
+    """Reorder and cast the columns of a table to a schema, adding null columns
+    for the fields the table doesn't have."""
+    columns = [
+        (
+            table[field.name].cast(field.type)
+            if field.name in table.schema.names
+            else pa.nulls(table.num_rows, field.type)
+        )
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def unify_schemas(schemas):
+    """Unify the schemas of the tables of different studies.
+
+    Columns that have a different type in different studies, e.g. a clinical
+    attribute that is a NUMBER in one study and free text in another, become
+    strings. The clinical attribute metadata of all studies is merged.
+    """
+    types = {}
+    attributes = {}
+    for schema in schemas:
+        for field in schema:
+            if field.name not in types:
+                types[field.name] = field.type
+            elif types[field.name] != field.type:
+                types[field.name] = pa.string()
+        metadata = schema.metadata or {}
+        if CLINICAL_ATTRIBUTES_KEY in metadata:
+            for name, attribute in json.loads(
+                metadata[CLINICAL_ATTRIBUTES_KEY]
+            ).items():
+                attributes.setdefault(name, attribute)
+
+    if not attributes:
+        return pa.schema(list(types.items()))
+    for name, attribute in attributes.items():
+        if types.get(name) == pa.string():
+            attribute["datatype"] = "STRING"
+    return pa.schema(
+        list(types.items()),
+        metadata={CLINICAL_ATTRIBUTES_KEY: json.dumps(attributes).encode()},
+    )
+
+
+def sort_cna(table):
+    """Sort copy-number calls by gene so Parquet statistics can prune row groups."""
+    return table.sort_by([("Hugo_Symbol", "ascending"), ("SAMPLE_ID", "ascending")])
+
+
+def combined_schema(name, input_files):
+    """Compute the schema of a combined table from the Parquet footers of its inputs."""
+    schemas = [pq.read_schema(input_file) for input_file in input_files]
+    if name == "combined_mutations":
+        present = set().union(*(schema.names for schema in schemas))
+        return pa.schema(
+            [(col, dtype) for col, dtype in MUTATION_COLUMNS.items() if col in present]
+        )
+    return unify_schemas(schemas)
+
+
+def derived_schema(derived_name, schema):
+    """Compute the schema of a derived clinical table from its wide table schema.
+
+    The clinical attribute metadata is kept, so the values of the long table
+    can be cast back to the datatype of their attribute.
+    """
+    name, kind = DERIVED_TABLES[derived_name]
+    if kind == "long":
+        fields = [
+            (col, schema.field(col).type if col in schema.names else pa.string())
+            for col in CLINICAL_ID_COLUMNS[name]
+        ]
+        fields += [("attribute", pa.string()), ("value", pa.string())]
+        return pa.schema(fields, metadata=schema.metadata)
+    core = CLINICAL_ID_COLUMNS[name] + CORE_CLINICAL_ATTRIBUTES[name]
+    return pa.schema(
+        [field for field in schema if field.name in core], metadata=schema.metadata
+    )
+
+
+def to_long_table(table, id_columns):
+    """Unpivot a wide clinical table into (ids..., attribute, value) rows.
+
+    Empty values are left out, values are stored as strings.
+    """
+    ids = [col for col in id_columns if col in table.schema.names]
+    parts = []
+    for col in table.schema.names:
+        if col in ids:
+            continue
+        valid = pc.is_valid(table[col])
+        part = table.select(ids).filter(valid)
+        part = part.append_column(
+            "attribute", pa.array([col] * part.num_rows, pa.string())
+        )
+        part = part.append_column(
+            "value", pc.cast(table[col].filter(valid), pa.string())
+        )
+        parts.append(part)
+    if not parts:
+        return pa.schema(
+            [table.schema.field(col) for col in ids]
+            + [("attribute", pa.string()), ("value", pa.string())]
+        ).empty_table()
+    return pa.concat_tables(parts)
+
+
+def derive_tables(name, table):
+    """Return the derived tables of a study's slice of a combined table."""
+    derived = {}
+    for derived_name, (source, kind) in DERIVED_TABLES.items():
+        if source != name:
+            continue
+        if kind == "long":
+            derived_table = to_long_table(table, CLINICAL_ID_COLUMNS[name])
+        else:
+            core = CLINICAL_ID_COLUMNS[name] + CORE_CLINICAL_ATTRIBUTES[name]
+            derived_table = table.select(
+                [col for col in table.schema.names if col in core]
+            )
+        derived[derived_name] = derived_table.replace_schema_metadata(
+            table.schema.metadata
+        )
+    return derived
+
+
+def read_study_samples(study):
+    """Return the sorted distinct samples of a study's clinical sample file."""
+    input_file = study.processed_path / COMBINED_TABLES["combined_clinical_sample"]
+    if not input_file.exists():
+        return study_samples(None)
+    columns = [col for col in ["SAMPLE_ID"] if col in pq.read_schema(input_file).names]
+    return study_samples(pq.read_table(input_file, columns=columns))
+
+
+def add_sample_keys(name, table, samples, first):
+    """Add the dense sample id column to a study's slice of a combined table.
+
+    samples are the study's samples from read_study_samples, numbered from
+    first. Rows of samples without clinical data get a null id.
+    """
+    column = SAMPLE_COLUMNS.get(name)
+    if column is None:
+        return table
+    if column in table.schema.names:
+        ids = sample_keys(table[column], samples, first)
+    else:
+        ids = pa.nulls(table.num_rows, pa.uint32())
+    return table.append_column(SAMPLE_KEY_COLUMN, ids)
+
+
+def combine_files(study_paths, combined_path, row_group_size):
+    """Combine processed studies into single Parquet files, one study at a time.
+
+    The schema of every combined file is computed up front from the Parquet
+    footers, so each study can be written out as soon as it is read and peak
+    memory stays around the size of a single study. The mutations are then
+    sorted by locus across all studies, out of core, so row group statistics
+    prune locus queries.
+    """
+    remove_fragment_layout(combined_path)
+
+    studies = []
+    for study_path in study_paths:
+        study = Study(study_path)
+        if study.ingestion_succeeded():
+            studies.append(study)
+        else:
+            click.echo(f"⚠️ Skipping {study_path} (not successfully processed)")
+
+    schemas = {}
+    for name, file_name in COMBINED_TABLES.items():
+        input_files = [
+            study.processed_path / file_name
+            for study in studies
+            if (study.processed_path / file_name).exists()
+        ]
+        if input_files:
+            schemas[name] = combined_schema(name, input_files)
+    if "combined_mutations" in schemas:
+        # quarantined rows keep their original string values
+        schemas[QUARANTINE_TABLE] = pa.schema(
+            [(field.name, pa.string()) for field in schemas["combined_mutations"]]
+        )
+    for name in SAMPLE_COLUMNS:
+        if name in schemas:
+            schemas[name] = schemas[name].append(
+                pa.field(SAMPLE_KEY_COLUMN, pa.uint32())
+            )
+    for derived_name, (name, kind) in DERIVED_TABLES.items():
+        if name in schemas:
+            schemas[derived_name] = derived_schema(derived_name, schemas[name])
+
+    writers = {}
+    written = set()
+    next_sample_key = 0
+    tmp_files = {name: combined_path / f"{name}.parquet.tmp" for name in schemas}
+    try:
+        for name, schema in schemas.items():
+            writers[name] = pq.ParquetWriter(tmp_files[name], schema)
+
+        with tqdm(total=len(studies), desc="Combining studies", unit="study") as pbar:
+            for study in studies:
+                pbar.set_description(f"Combining {study.name}")
+                with span("combine.study", study.name) as timing:
+                    timing.bytes = sum(
+                        size for size, _ in study_fingerprint(study).values()
+                    )
+                    tables = {}
+                    samples = read_study_samples(study)
+                    first_sample_key = next_sample_key
+                    next_sample_key += len(samples)
+                    for name, file_name in COMBINED_TABLES.items():
+                        input_file = study.processed_path / file_name
+                        if not input_file.exists():
+                            continue
+                        table = pq.read_table(input_file)
+
+                        if name == "combined_mutations":
+                            table, quarantined = cast_mutation_table(table)
+                            if quarantined.num_rows > 0:
+                                click.echo(
+                                    f"⚠️ Quarantined {quarantined.num_rows} mutations in {study.name} with invalid positions or read counts"
+                                )
+                                writers[QUARANTINE_TABLE].write_table(
+                                    conform_to_schema(
+                                        quarantined, schemas[QUARANTINE_TABLE]
+                                    )
+                                )
+                                written.add(QUARANTINE_TABLE)
+                            timing.rows = table.num_rows
+                        elif name == "combined_cna":
+                            table = sort_cna(table)
+                        table = add_sample_keys(name, table, samples, first_sample_key)
+
+                        writers[name].write_table(
+                            conform_to_schema(table, schemas[name]),
+                            row_group_size=row_group_size,
+                        )
+                        written.add(name)
+                        tables[name] = table
+                        for derived_name, derived_table in derive_tables(
+                            name, table
+                        ).items():
+                            writers[derived_name].write_table(
+                                conform_to_schema(derived_table, schemas[derived_name])
+                            )
+                            written.add(derived_name)
+                    write_study_summaries(
+                        study.name,
+                        tables.get("combined_mutations"),
+                        tables.get("combined_clinical_sample"),
+                        combined_path,
+                    )
+                pbar.update(1)
+
+        for writer in writers.values():
+            writer.close()
+        if "combined_mutations" in written:
+            unsorted_file = tmp_files["combined_mutations"].with_suffix(".unsorted")
+            tmp_files["combined_mutations"].replace(unsorted_file)
+            try:
+                with span("combine.sort_mutations"):
+                    merge_sorted_mutations(
+                        unsorted_file,
+                        tmp_files["combined_mutations"],
+                        schemas["combined_mutations"],
+                        row_group_size,
+                    )
+            finally:
+                unsorted_file.unlink(missing_ok=True)
+        for name in schemas:
+            output_file = combined_path / f"{name}.parquet"
+            if name in written:
+                tmp_files[name].replace(output_file)
+                click.echo(
+                    click.style(
+                        f"{COMBINED_DESCRIPTIONS[name]} saved to {output_file}",
+                        fg="yellow" if name == QUARANTINE_TABLE else "green",
+                    )
+                )
+    finally:
+        for writer in writers.values():
+            writer.close()
+        for tmp_file in tmp_files.values():
+            tmp_file.unlink(missing_ok=True)
+
+    if QUARANTINE_TABLE not in written:
+        (combined_path / f"{QUARANTINE_TABLE}.parquet").unlink(missing_ok=True)
+
+    save_summaries(combined_path)
+    # the partials are only kept to update the summaries of a fragment combine
+    shutil.rmtree(combined_path / PARTIALS_DIR, ignore_errors=True)
+
+
+def save_summaries(combined_path):
+    """Sum the partial summaries into the summary tables and report them."""
+    with span("combine.summaries") as timing:
+        rows = finalize_summaries(combined_path)
+        timing.rows = sum(rows.values())
+    if rows:
+        click.echo(
+            click.style(
+                f"✅ Mutation frequency summaries saved to {combined_path} "
+                f"({', '.join(f'{name}: {count}' for name, count in rows.items())})",
+                fg="green",
+            )
+        )
+
+
+def study_fingerprint(study):
+    """Fingerprint the processed files of a study by their size and mtime."""
+    fingerprint = {}
+    for file_name in COMBINED_TABLES.values():
+        file_path = study.processed_path / file_name
+        if file_path.exists():
+            stat = file_path.stat()
+            fingerprint[file_name] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def load_manifest(combined_path, row_group_size):
+    """Load the manifest of a previous fragment combine, if it is compatible."""
+    manifest_file = combined_path / MANIFEST_FILE
+    if manifest_file.exists():
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if (
+            manifest.get("version") == MANIFEST_VERSION
+            and manifest.get("row_group_size") == row_group_size
+            and manifest.get("summary_attributes") == get_summary_attributes()
+        ):
+            return manifest
+    return None
+
+
+def save_manifest(combined_path, manifest):
+    """Atomically write the combine manifest."""
+    manifest_file = combined_path / MANIFEST_FILE
+    tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp_file.replace(manifest_file)
+
+
+def remove_fragment_layout(combined_path):
+    """Remove all fragment datasets and the manifest from a combined folder."""
+    for name in [*OUTPUT_TABLES, PARTIALS_DIR, MUTATION_FRAGMENTS_DIR]:
+        dataset_path = combined_path / name
+        if dataset_path.is_dir():
+            shutil.rmtree(dataset_path)
+    (combined_path / MANIFEST_FILE).unlink(missing_ok=True)
+
+
+def remove_study_fragments(combined_path, entry):
+    """Remove the fragments a study contributed to the combined datasets."""
+    for relative_path in entry["files"]:
+        fragment = combined_path / relative_path
+        fragment.unlink(missing_ok=True)
+        # clean up partition directories that are now empty
+        parent = fragment.parent
+        if parent.name.count("=") == 1 and not any(parent.iterdir()):
+            parent.rmdir()
+
+
+def mutation_partitions(entry):
+    """Return the chromosome partitions a study has mutation fragments in."""
+    return {
+        Path(relative_path).parent.name
+        for relative_path in entry["files"]
+        if relative_path.startswith(f"{MUTATION_FRAGMENTS_DIR}/")
+    }
+
+
+def compact_mutation_partitions(combined_path, partitions, row_group_size):
+    """Merge the study fragments of each partition into the partition's file.
+
+    The merged file is sorted by position, so a lookup reads one footer and
+    the row groups its statistics don't rule out, however many studies have
+    mutations on the chromosome.
+    """
+    for partition in sorted(partitions):
+        fragments_path = combined_path / MUTATION_FRAGMENTS_DIR / partition
+        partition_path = combined_path / "combined_mutations" / partition
+        fragments = sorted(fragments_path.glob("*.parquet"))
+        if not fragments:
+            shutil.rmtree(partition_path, ignore_errors=True)
+            continue
+        schema = unify_schemas([pq.read_schema(fragment) for fragment in fragments])
+        partition_path.mkdir(parents=True, exist_ok=True)
+        tmp_file = partition_path / f"{PARTITION_FILE}.tmp"
+        try:
+            merge_sorted_mutations(
+                fragments_path / "*.parquet", tmp_file, schema, row_group_size
+            )
+            tmp_file.replace(partition_path / PARTITION_FILE)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+
+
+def write_fragment(table, combined_path, relative_path, row_group_size=None):
+    """Write one fragment of a combined dataset and return its relative path."""
+    fragment = combined_path / relative_path
+    fragment.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, fragment, row_group_size=row_group_size)
+    return str(relative_path)
+
+
+def write_study_fragments(study, combined_path, row_group_size, first_sample_key):
+    """Write a study's slice of every combined dataset as separate fragments.
+
+    Mutations are split into one fragment per chromosome partition, sorted by
+    position, under MUTATION_FRAGMENTS_DIR; see compact_mutation_partitions.
+    The study's samples are numbered from first_sample_key. Returns the
+    manifest entry describing what was written.
+    """
+    samples = read_study_samples(study)
+    entry = {
+        "fingerprint": study_fingerprint(study),
+        "files": [],
+        "rows": {},
+        "sample_keys": [first_sample_key, len(samples)],
+    }
+    fragment_name = f"{study.name}.parquet"
+    tables = {}
+
+    for name, file_name in COMBINED_TABLES.items():
+        input_file = study.processed_path / file_name
+        if not input_file.exists():
+            continue
+        table = pq.read_table(input_file)
+        tables[name] = table
+
+        if name == "combined_cna":
+            table = add_sample_keys(name, sort_cna(table), samples, first_sample_key)
+            entry["files"].append(
+                write_fragment(
+                    table,
+                    combined_path,
+                    f"{name}/{fragment_name}",
+                    row_group_size=row_group_size,
+                )
+            )
+            entry["rows"][name] = table.num_rows
+            continue
+
+        if name != "combined_mutations":
+            table = add_sample_keys(name, table, samples, first_sample_key)
+            entry["files"].append(
+                write_fragment(table, combined_path, f"{name}/{fragment_name}")
+            )
+            entry["rows"][name] = table.num_rows
+            for derived_name, derived_table in derive_tables(name, table).items():
+                entry["files"].append(
+                    write_fragment(
+                        derived_table,
+                        combined_path,
+                        f"{derived_name}/{fragment_name}",
+                    )
+                )
+                entry["rows"][derived_name] = derived_table.num_rows
+            continue
+
+        table, quarantined = cast_mutation_table(table)
+        tables[name] = table
+        if quarantined.num_rows > 0:
+            click.echo(
+                f"⚠️ Quarantined {quarantined.num_rows} mutations in {study.name} with invalid positions or read counts"
+            )
+            entry["files"].append(
+                write_fragment(
+                    quarantined, combined_path, f"{QUARANTINE_TABLE}/{fragment_name}"
+                )
+            )
+            entry["rows"][QUARANTINE_TABLE] = quarantined.num_rows
+        entry["rows"][name] = table.num_rows
+        table = add_sample_keys(name, table, samples, first_sample_key)
+
+        chromosome_index = table.schema.get_field_index("Chromosome")
+        if chromosome_index < 0:
+            continue
+        for chrom in table["Chromosome"].unique().to_pylist():
+            if chrom is None:
+                partition = table.filter(table["Chromosome"].is_null())
+                chrom = "__HIVE_DEFAULT_PARTITION__"
+            else:
+                partition = table.filter(pc.equal(table["Chromosome"], chrom))
+            # the chromosome is stored in the directory name instead
+            partition = sort_mutations(partition).remove_column(chromosome_index)
+            entry["files"].append(
+                write_fragment(
+                    partition,
+                    combined_path,
+                    f"{MUTATION_FRAGMENTS_DIR}/Chromosome={chrom}/{fragment_name}",
+                    row_group_size=row_group_size,
+                )
+            )
+
+    entry["files"].extend(
+        write_study_summaries(
+            study.name,
+            tables.get("combined_mutations"),
+            tables.get("combined_clinical_sample"),
+            combined_path,
+        )
+    )
+    return entry
+
+
+def write_common_metadata(combined_path, name):
+    """Store the unified schema of all fragments in the dataset's _common_metadata.
+
+    Readers use it as the dataset schema, because the fragments of different
+    studies don't necessarily have the same columns.
+    """
+    dataset_path = combined_path / name
+    fragments = sorted(dataset_path.rglob("*.parquet")) if dataset_path.is_dir() else []
+    if not fragments:
+        if dataset_path.is_dir():
+            shutil.rmtree(dataset_path)
+        return
+
+    schemas = [pq.read_schema(fragment) for fragment in fragments]
+    partition_schema = COMBINED_PARTITIONING.get(name)
+    if partition_schema is not None:
+        schemas.insert(0, partition_schema)
+    pq.write_metadata(unify_schemas(schemas), dataset_path / "_common_metadata")
+
+
+def combine_fragments(study_paths, combined_path, row_group_size, incremental):
+    """Combine processed studies into datasets of per-study fragments.
+
+    When incremental, only studies whose processed files changed since the last
+    combine are rewritten, and removed studies have their fragments dropped.
+    Only the chromosome partitions of combined_mutations these studies have
+    mutations in are merged again.
+    """
+    manifest = load_manifest(combined_path, row_group_size) if incremental else None
+    if manifest is None:
+        remove_fragment_layout(combined_path)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "row_group_size": row_group_size,
+            "summary_attributes": get_summary_attributes(),
+            "studies": {},
+            "stale_partitions": [],
+        }
+    # only keep one layout around
+    for name in OUTPUT_TABLES:
+        (combined_path / f"{name}.parquet").unlink(missing_ok=True)
+
+    studies = manifest["studies"]
+    # partitions to merge again, kept in the manifest until they are so that
+    # an interrupted combine still merges them when it resumes
+    stale_partitions = set(manifest["stale_partitions"])
+    # changed studies get a new range of sample ids after those in use
+    next_sample_key = max(
+        (sum(entry["sample_keys"]) for entry in studies.values()), default=0
+    )
+    seen = set()
+    updated_count = 0
+    unchanged_count = 0
+
+    with tqdm(total=len(study_paths), desc="Combining studies", unit="study") as pbar:
+        for study_path in study_paths:
+            study = Study(study_path)
+            pbar.set_description(f"Combining {study.name}")
+
+            if not study.ingestion_succeeded():
+                click.echo(f"⚠️ Skipping {study_path} (not successfully processed)")
+                pbar.update(1)
+                continue
+
+            seen.add(study.name)
+            entry = studies.get(study.name)
+            if entry is not None and entry["fingerprint"] == study_fingerprint(study):
+                unchanged_count += 1
+                pbar.update(1)
+                continue
+
+            if entry is not None:
+                stale_partitions |= mutation_partitions(entry)
+                remove_study_fragments(combined_path, entry)
+            with span("combine.study", study.name) as timing:
+                studies[study.name] = write_study_fragments(
+                    study, combined_path, row_group_size, next_sample_key
+                )
+                next_sample_key += studies[study.name]["sample_keys"][1]
+                timing.rows = studies[study.name]["rows"].get("combined_mutations")
+                timing.bytes = sum(
+                    size for size, _ in studies[study.name]["fingerprint"].values()
+                )
+            stale_partitions |= mutation_partitions(studies[study.name])
+            manifest["stale_partitions"] = sorted(stale_partitions)
+            # save after every study so an interrupted combine can resume
+            save_manifest(combined_path, manifest)
+            updated_count += 1
+            pbar.update(1)
+
+    removed = sorted(set(studies) - seen)
+    for study_name in removed:
+        stale_partitions |= mutation_partitions(studies[study_name])
+        remove_study_fragments(combined_path, studies.pop(study_name))
+
+    with span("combine.compact"):
+        compact_mutation_partitions(combined_path, stale_partitions, row_group_size)
+    manifest["stale_partitions"] = []
+
+    for name in OUTPUT_TABLES:
+        write_common_metadata(combined_path, name)
+    save_manifest(combined_path, manifest)
+    save_summaries(combined_path)
+
+    click.echo(
+        click.style(
+            f"✅ Combined {updated_count} changed studies into {combined_path} "
+            f"({unchanged_count} unchanged, {len(removed)} removed)",
+            fg="green",
+        )
+    )
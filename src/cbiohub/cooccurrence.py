@@ -0,0 +1,408 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from dynaconf import settings
+
+from .analyze import (
+    get_clinical_columns,
+    get_cohort_join,
+    get_connection,
+    quote_identifier,
+)
+from .metrics import span
+
+# Memory used for the intersections of one block of genes, which bounds the
+# number of genes per block
+BLOCK_BYTES = 64 * 1024 * 1024
+
+# Genes analyzed when none are given: the most frequently mutated in the cohort
+DEFAULT_TOP_GENES = 100
+
+# Relative size of the next term at which the sum of a tail stops
+CONVERGENCE = 1e-15
+
+RESULT_COLUMNS = [
+    "gene_a",
+    "gene_b",
+    "neither",
+    "a_not_b",
+    "b_not_a",
+    "both",
+    "log2_odds_ratio",
+    "p_value",
+    "q_value",
+    "tendency",
+]
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:  # numpy < 2.0
+    _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        counts = _BYTE_COUNTS[words.view(np.uint8)]
+        return counts.reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+class MutationMatrix:
+    """Packed gene x sample bitset of which samples have a mutation in a gene.
+
+    Row i of bits has bit s set when sample s is mutated in genes[i], with the
+    samples packed 64 to a word.
+    """
+
+    def __init__(self, genes, samples, bits):
+        self.genes = genes
+        self.samples = samples
+        self.bits = bits
+
+    @property
+    def num_samples(self):
+        return len(self.samples)
+
+    def counts(self):
+        """Return the number of mutated samples of every gene."""
+        return popcount(self.bits).sum(axis=1, dtype=np.int64)
+
+    def select(self, indices):
+        """Return the matrix of only the genes at indices."""
+        return MutationMatrix(
+            [self.genes[i] for i in indices], self.samples, self.bits[indices]
+        )
+
+
+def get_cohort_query(con, directory, studies=None, clinical_filters=None, cohort=None):
+    """Return the SQL selecting the (study_id, SAMPLE_ID, sample_key) of a cohort
+    and its parameters.
+
+    The cohort is all samples in the combined clinical sample table, limited to
+    studies, to the samples whose clinical attributes have one of the values
+    in clinical_filters (attribute: value or list of values) and to the
+    samples of a cohort expression, see cohort_index.py.
+    """
+    conditions = []
+    params = []
+    if studies:
+        conditions.append(f"study_id IN ({', '.join('?' for _ in studies)})")
+        params.extend(studies)
+    if clinical_filters:
+        columns = get_clinical_columns(con, "clinical_sample")
+        for attribute, values in clinical_filters.items():
+            if attribute not in columns:
+                raise ValueError(f"Unknown clinical attribute: {attribute}")
+            if isinstance(values, str):
+                values = [values]
+            conditions.append(
+                f"CAST({quote_identifier(attribute)} AS VARCHAR) "
+                f"IN ({', '.join('?' for _ in values)})"
+            )
+            params.extend(str(value) for value in values)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cohort_join = get_cohort_join(con, directory, cohort, "clinical_sample")
+    return (
+        "SELECT DISTINCT study_id, SAMPLE_ID, clinical_sample.sample_key "
+        f"FROM clinical_sample {cohort_join} {where}",
+        params,
+    )
+
+
+def build_mutation_matrix(
+    directory, genes=None, studies=None, clinical_filters=None, cohort=None
+):
+    """Build the packed mutation matrix of a cohort from the combined tables.
+
+    Samples of the cohort without any mutation are included as columns of
+    zeros, so they count towards the unaltered samples. With genes, only those
+    genes are included.
+    """
+    con = get_connection(directory)
+    try:
+        cohort_query, params = get_cohort_query(
+            con, directory, studies, clinical_filters, cohort
+        )
+        samples = con.execute(
+            f"""
+            SELECT study_id || ':' || SAMPLE_ID
+            FROM ({cohort_query})
+            ORDER BY study_id, SAMPLE_ID
+            """,
+            params,
+        ).fetchall()
+
+        gene_filter = ""
+        gene_params = []
+        if genes:
+            gene_filter = f"WHERE m.Hugo_Symbol IN ({', '.join('?' for _ in genes)})"
+            gene_params = list(genes)
+        mutated = con.execute(
+            f"""
+            WITH cohort AS (
+                SELECT sample_key,
+                    row_number() OVER (ORDER BY study_id, SAMPLE_ID) - 1 AS sample
+                FROM ({cohort_query})
+            )
+            SELECT DISTINCT m.Hugo_Symbol AS gene, cohort.sample
+            FROM mutations m
+            JOIN cohort ON m.sample_key = cohort.sample_key
+            {gene_filter}
+            """,
+            params + gene_params,
+        ).fetchnumpy()
+    finally:
+        con.close()
+
+    gene_index, gene_names = pd.factorize(mutated["gene"], sort=True)
+    sample_index = np.asarray(mutated["sample"], dtype=np.int64)
+    bits = np.zeros((len(gene_names), (len(samples) + 63) // 64), dtype=np.uint64)
+    np.bitwise_or.at(
+        bits,
+        (gene_index, sample_index // 64),
+        np.left_shift(np.uint64(1), (sample_index % 64).astype(np.uint64)),
+    )
+    return MutationMatrix(
+        [str(gene) for gene in gene_names], [row[0] for row in samples], bits
+    )
+
+
+def log_factorials(n):
+    """Return log(k!) for k = 0..n."""
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def hypergeometric_tail(k, draws, successes, population, log_fact, upper):
+    """Return P(X >= k) if upper else P(X <= k) for hypergeometric X.
+
+    X is the number of successes in draws samples without replacement from a
+    population with successes successes. All arguments but log_fact and upper
+    are arrays of the same shape. The tail is summed with the ratio of
+    consecutive probabilities, away from the mode so the terms only shrink,
+    which makes it a one-sided Fisher's exact test.
+    """
+    k = k.astype(np.int64)
+    low = np.maximum(0, draws + successes - population)
+    high = np.minimum(draws, successes)
+    mode = np.floor((draws + 1) * (successes + 1) / (population + 2)).astype(np.int64)
+
+    # sum away from the mode, taking the complement when k is on the far side
+    if upper:
+        direct = k > mode
+        start = np.where(direct, k, k - 1)
+    else:
+        direct = k < mode
+        start = np.where(direct, k, k + 1)
+    # step up when summing P(X >= start), down when summing P(X <= start)
+    step_up = direct == upper
+    start = np.clip(start, low, high)
+
+    def log_choose(n, r):
+        return log_fact[n] - log_fact[r] - log_fact[n - r]
+
+    term = np.exp(
+        log_choose(successes, start)
+        + log_choose(population - successes, draws - start)
+        - log_choose(population, draws)
+    )
+    total = term.copy()
+    # only the sums that haven't converged yet are kept, compacted
+    index = np.nonzero(np.where(step_up, start < high, start > low))[0]
+    up = step_up[index]
+    c = start[index].astype(np.float64)
+    d = draws[index].astype(np.float64)
+    s = successes[index].astype(np.float64)
+    rest = (population[index] - successes[index] - draws[index]).astype(np.float64)
+    limit = np.where(up, high[index], low[index]).astype(np.float64)
+    current_term = term[index]
+    current_total = total[index]
+    while len(index):
+        # P(c + 1) / P(c) going up, P(c - 1) / P(c) going down
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(
+                up,
+                (s - c) * (d - c) / ((c + 1) * (rest + c + 1)),
+                c * (rest + c) / ((s - c + 1) * (d - c + 1)),
+            )
+        current_term *= ratio
+        current_total += current_term
+        c += np.where(up, 1.0, -1.0)
+        still = (c != limit) & (current_term > current_total * CONVERGENCE)
+        if not still.all():
+            total[index] = current_total
+            index = index[still]
+            up, c, d, s, rest, limit = (
+                up[still],
+                c[still],
+                d[still],
+                s[still],
+                rest[still],
+                limit[still],
+            )
+            current_term = current_term[still]
+            current_total = current_total[still]
+    total[index] = current_total
+
+    tail = np.where(direct, total, 1.0 - total)
+    # k outside of the support
+    if upper:
+        tail = np.where(k <= low, 1.0, np.where(k > high, 0.0, tail))
+    else:
+        tail = np.where(k >= high, 1.0, np.where(k < low, 0.0, tail))
+    return np.clip(tail, 0.0, 1.0)
+
+
+def benjamini_hochberg(p_values):
+    """Return the Benjamini-Hochberg adjusted q-values of p-values."""
+    count = len(p_values)
+    if count == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * count / np.arange(1, count + 1)
+    q_values = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty(count)
+    result[order] = np.minimum(q_values, 1.0)
+    return result
+
+
+def block_cooccurrence(bits, counts, log_fact, start, stop):
+    """Test the genes of rows start..stop against all later genes.
+
+    Returns the indices of both genes of each pair, the number of samples
+    mutated in both, the log2 odds ratio and the one-sided p-value.
+    """
+    num_genes = len(bits)
+    num_samples = len(log_fact) - 1
+    block = bits[start:stop]
+    others = bits[start:]
+    intersections = popcount(block[:, None, :] & others[None, :, :]).sum(
+        axis=2, dtype=np.int64
+    )
+    rows, cols = np.nonzero(
+        np.arange(start, stop)[:, None] < np.arange(start, num_genes)[None, :]
+    )
+    gene_a = rows + start
+    gene_b = cols + start
+    both = intersections[rows, cols]
+
+    a_not_b = counts[gene_a] - both
+    b_not_a = counts[gene_b] - both
+    neither = num_samples - both - a_not_b - b_not_a
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log2_odds_ratio = np.log2(
+            (both.astype(np.float64) * neither) / (a_not_b * b_not_a)
+        )
+
+    # test in the direction of the tendency, +inf and -inf included. The odds
+    # ratio is undefined (NaN) when a gene is mutated in no or every sample,
+    # those pairs have no tendency and get a p-value of 1
+    cooccurring = log2_odds_ratio > 0
+    args = (
+        counts[gene_b],
+        counts[gene_a],
+        np.full(len(both), num_samples, dtype=np.int64),
+        log_fact,
+    )
+    p_value = np.where(
+        cooccurring,
+        hypergeometric_tail(both, *args, upper=True),
+        hypergeometric_tail(both, *args, upper=False),
+    )
+    p_value[np.isnan(log2_odds_ratio)] = 1.0
+    return gene_a, gene_b, both, log2_odds_ratio, p_value
+
+
+def pairwise_cooccurrence(matrix, workers=1):
+    """Compute co-occurrence statistics of every pair of genes in matrix.
+
+    The pairs are tested in blocks of genes, in parallel over workers threads
+    (numpy releases the GIL for the array operations). Returns a DataFrame
+    with the 2x2 table of each pair, the log2 odds ratio and the p-value of a
+    one-sided Fisher's exact test in the direction of the tendency, with
+    Benjamini-Hochberg q-values. Pairs with an undefined odds ratio have no
+    tendency (None).
+    """
+    num_genes, num_words = matrix.bits.shape
+    counts = matrix.counts()
+    log_fact = log_factorials(matrix.num_samples)
+    block_size = max(1, BLOCK_BYTES // max(1, num_genes * num_words * 8))
+    blocks = [
+        (start, min(start + block_size, num_genes))
+        for start in range(0, num_genes, block_size)
+    ]
+    with span("cooccurrence.pairs") as timing:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(
+                executor.map(
+                    lambda block: block_cooccurrence(
+                        matrix.bits, counts, log_fact, *block
+                    ),
+                    blocks,
+                )
+            )
+        if results:
+            gene_a, gene_b, both, log2_odds_ratio, p_value = (
+                np.concatenate(arrays) for arrays in zip(*results)
+            )
+        else:
+            gene_a = gene_b = both = np.empty(0, dtype=np.int64)
+            log2_odds_ratio = p_value = np.empty(0)
+        q_value = benjamini_hochberg(p_value)
+        timing.rows = len(both)
+
+    genes = np.array(matrix.genes, dtype=object)
+    tendency = np.where(
+        log2_odds_ratio > 0, "Co-occurrence", "Mutual exclusivity"
+    ).astype(object)
+    tendency[np.isnan(log2_odds_ratio)] = None
+    a_not_b = counts[gene_a] - both
+    b_not_a = counts[gene_b] - both
+    return pd.DataFrame(
+        {
+            "gene_a": genes[gene_a],
+            "gene_b": genes[gene_b],
+            "neither": matrix.num_samples - both - a_not_b - b_not_a,
+            "a_not_b": a_not_b,
+            "b_not_a": b_not_a,
+            "both": both,
+            "log2_odds_ratio": log2_odds_ratio,
+            "p_value": p_value,
+            "q_value": q_value,
+            "tendency": tendency,
+        },
+        columns=RESULT_COLUMNS,
+    ).sort_values(["p_value", "gene_a", "gene_b"], ignore_index=True)
+
+
+def gene_cooccurrence(
+    genes=None,
+    top=DEFAULT_TOP_GENES,
+    studies=None,
+    clinical_filters=None,
+    cohort=None,
+    workers=1,
+    directory=None,
+):
+    """Test every pair of genes for co-occurrence or mutual exclusivity of
+    their mutations.
+
+    Without genes, the top most frequently mutated genes of the cohort are
+    used. The cohort is restricted to studies, clinical_filters and a cohort
+    expression, see get_cohort_query. Returns a DataFrame as described in
+    pairwise_cooccurrence.
+    """
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    with span("cooccurrence.matrix") as timing:
+        matrix = build_mutation_matrix(
+            directory, genes, studies, clinical_filters, cohort
+        )
+        timing.rows = len(matrix.genes)
+    if not genes and top and len(matrix.genes) > top:
+        counts = matrix.counts()
+        # most mutated first, ties by gene name
+        order = sorted(range(len(counts)), key=lambda i: (-counts[i], matrix.genes[i]))
+        matrix = matrix.select(sorted(order[:top]))
+    return pairwise_cooccurrence(matrix, workers)
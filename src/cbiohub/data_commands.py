@@ -1,6 +1,14 @@
+import os
+import shutil
 import click
-from tqdm import tqdm
 from pathlib import Path
+from dynaconf import settings
+from . import metrics
+from .defaults import MUTATION_ROW_GROUP_SIZE
+from .discovery import discover_studies, duplicate_study_names
+
+# pyarrow, duckdb and the modules using them are imported inside the commands,
+# so the cli starts quickly
 
 
 @click.group()
@@ -9,24 +17,106 @@ def data():
     pass
 
 
+def _init_worker(processed_path, record_metrics):
+    """Make sure worker processes use the same processed path as the parent,
+    and record metrics if the parent does."""
+    settings.PROCESSED_PATH = processed_path
+    if record_metrics:
+        metrics.enable()
+
+
+def _ingest_study(study_path):
+    """Ingest a single study and return a (name, status, error) tuple.
+
+    Runs in a worker process when ingesting in parallel, so any exception is
+    caught and reported back instead of aborting the whole run.
+    """
+    from .study import Study
+
+    study = Study(study_path)
+    try:
+        if study.is_processed():
+            return study.name, "already_processed", None
+        if not study.check_integrity():
+            return study.name, "missing_files", None
+        with metrics.span("ingest.study", study.name):
+            if study.create_parquets():
+                return study.name, "processed", None
+        return study.name, "error", None
+    except Exception as e:
+        return study.name, "error", f"{type(e).__name__}: {e}"
+
+
+def _ingest_study_with_metrics(study_path):
+    """Ingest a study in a worker process, returning the spans it recorded
+    alongside the result so the parent can collect them."""
+    metrics.clear()
+    result = _ingest_study(study_path)
+    return result, metrics.get_spans()
+
+
+def _ingest_studies(study_paths, workers):
+    """Yield ingest results for all studies, in parallel if workers > 1."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if workers <= 1:
+        for study_path in study_paths:
+            yield _ingest_study(study_path)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(settings.PROCESSED_PATH, metrics.is_enabled()),
+    ) as executor:
+        futures = {
+            executor.submit(_ingest_study_with_metrics, study_path): study_path
+            for study_path in study_paths
+        }
+        for future in as_completed(futures):
+            try:
+                result, spans = future.result()
+                metrics.record(spans)
+                yield result
+            except Exception as e:
+                # the worker process itself died (e.g. OOM killed)
+                yield futures[future].name, "error", f"{type(e).__name__}: {e}"
+
+
 @data.command()
 @click.argument("folder_name", type=click.Path(exists=True))
-def ingest(folder_name):
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of studies to ingest in parallel (0 uses all CPUs).",
+)
+def ingest(folder_name, workers):
     """Ingest studies from the given folder and create Parquet files."""
+    from tqdm import tqdm
+
     folder_path = Path(folder_name)
+    if workers == 0:
+        workers = os.cpu_count() or 1
 
     if folder_path.is_dir():
-        # Check if the folder contains multiple studies or a single study
-        study_paths = [
-            p for p in folder_path.iterdir() if p.is_dir() and Study.is_study(p)
-        ]
+        # The folder can be a single study, or contain studies at any depth
+        with metrics.span("ingest.discovery"):
+            study_paths = discover_studies(folder_path)
         if not study_paths:
-            # Single study
-            if Study.is_study(folder_path):
-                study_paths = [folder_path]
-            else:
-                click.echo(f"No valid studies found in {folder_name}.")
-                return
+            click.echo(f"No valid studies found in {folder_name}.")
+            return
+        duplicates = duplicate_study_names(study_paths)
+        if duplicates:
+            raise click.ClickException(
+                "Studies with the same directory name would overwrite each "
+                "other's processed files: "
+                + "; ".join(
+                    f"{name} ({', '.join(str(path) for path in paths)})"
+                    for name, paths in sorted(duplicates.items())
+                )
+            )
 
         processed_count = 0
         already_processed_count = 0
@@ -38,32 +128,31 @@ def ingest(folder_name):
 
         with tqdm(
             total=len(study_paths), desc="Processing studies", unit="study"
-        ) as pbar:
-            for study_path in study_paths:
-                study = Study(study_path)
-                pbar.set_description(f"Processing {study.name}")
-                if study.is_processed():
+        ) as pbar, metrics.span("ingest"):
+            for name, status, error in _ingest_studies(study_paths, workers):
+                pbar.set_description(f"Processed {name}")
+                if status == "already_processed":
                     already_processed_count += 1
-                    pbar.update(1)
-                    continue
-
-                if study.check_integrity():
-                    if study.create_parquets():
-                        processed_count += 1
-                    else:
-                        click.echo(
-                            f"⚠️ Skipped study {study.name} due to errors during Parquet creation."
-                        )
-                        skipped_due_to_errors_count += 1
-                        skipped_due_to_errors_studies.append(study.name)
+                elif status == "processed":
+                    processed_count += 1
+                elif status == "missing_files":
+                    click.echo(f"⚠️ Skipped study {name} due to missing required files.")
+                    skipped_due_to_missing_files_count += 1
+                    skipped_due_to_missing_files_studies.append(name)
                 else:
                     click.echo(
-                        f"⚠️ Skipped study {study.name} due to missing required files."
+                        f"⚠️ Skipped study {name} due to errors during Parquet creation."
+                        + (f" ({error})" if error else "")
                     )
-                    skipped_due_to_missing_files_count += 1
-                    skipped_due_to_missing_files_studies.append(study.name)
+                    skipped_due_to_errors_count += 1
+                    skipped_due_to_errors_studies.append(name)
                 pbar.update(1)
 
+        # workers finish in arbitrary order, report the studies in input order
+        study_order = {p.name: i for i, p in enumerate(study_paths)}
+        skipped_due_to_errors_studies.sort(key=study_order.get)
+        skipped_due_to_missing_files_studies.sort(key=study_order.get)
+
         click.echo(
             click.style(
                 f"✅ Finished processing {processed_count} studies.", fg="green"
@@ -109,8 +198,35 @@ def ingest(folder_name):
     default=None,
     help="Optional output directory for combined files.",
 )
-def combine(output_dir):
+@click.option(
+    "--partition/--no-partition",
+    default=False,
+    help="Write the combined tables as datasets of per-study fragments, with "
+    "the mutations in one file per chromosome sorted by position. Incremental "
+    "combines rewrite the chromosome files a changed study has mutations in.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only recombine studies that changed since the last combine "
+    "(implies --partition).",
+)
+@click.option(
+    "--row-group-size",
+    type=int,
+    default=MUTATION_ROW_GROUP_SIZE,
+    show_default=True,
+    help="Number of rows per row group in the combined mutations.",
+)
+def combine(output_dir, partition, incremental, row_group_size):
     """Combine all processed studies into a single combined processed study."""
+    from .analyze import create_catalog
+    from .combine import combine_files, combine_fragments
+    from .cohort_index import build_cohort_index
+    from .expression import link_expression_files
+    from .variant_index import build_variant_index
+
     processed_studies_path = Path(settings.PROCESSED_PATH) / "studies"
     combined_path = (
         Path(output_dir) if output_dir else Path(settings.PROCESSED_PATH) / "combined"
@@ -118,123 +234,37 @@ def combine(output_dir):
 
     combined_path.mkdir(parents=True, exist_ok=True)
 
-    mutation_tables = []
-    clinical_patient_tables = []
-    clinical_sample_tables = []
-
-    study_paths = [p for p in processed_studies_path.iterdir() if p.is_dir()]
-
-    with tqdm(total=len(study_paths), desc="Loading studies", unit="study") as pbar:
-        for study_path in processed_studies_path.iterdir():
-            if study_path.is_dir():
-                study = Study(study_path)
-
-                if not study.is_processed():
-                    click.echo(f"⚠️ Skipping {study_path} (not successfully processed)")
-                    pbar.update(1)
-                    continue
-
-                mutation_file = study.processed_path / "data_mutations.parquet"
-                clinical_patient_file = (
-                    study.processed_path / "data_clinical_patient.parquet"
-                )
-                clinical_sample_file = (
-                    study.processed_path / "data_clinical_sample.parquet"
-                )
-
-                if mutation_file.exists():
-                    table = pq.read_table(mutation_file)
-                    # Select only specific columns and adjust their types
-                    columns_to_include = MUTATION_COLUMNS
-
-                    # Filter out columns that do not exist in the table schema
-                    existing_columns = {
-                        col: dtype
-                        for col, dtype in columns_to_include.items()
-                        if col in table.schema.names
-                    }
-
-                    table = table.select(list(existing_columns.keys()))
-                    table = table.cast(pa.schema(existing_columns))
-                    mutation_tables.append(table)
-                if clinical_patient_file.exists():
-                    clinical_patient_tables.append(pq.read_table(clinical_patient_file))
-                if clinical_sample_file.exists():
-                    clinical_sample_tables.append(pq.read_table(clinical_sample_file))
-
-                pbar.update(1)
-
-    if mutation_tables:
-        start_time = time.time()
-        combined_mutations = pa.concat_tables(mutation_tables, promote=True)
-        concat_time = time.time() - start_time
-
-        click.echo(
-            click.style(f"⏱️ Concatenation time: {concat_time} seconds", fg="green")
-        )
-
-        start_time = time.time()
-        pq.write_table(combined_mutations, combined_path / "combined_mutations.parquet")
-        write_time = time.time() - start_time
-
-        click.echo(
-            click.style(
-                f"✅ Combined mutations saved to {combined_path / 'combined_mutations.parquet'}",
-                fg="green",
-            )
-        )
-        click.echo(click.style(f"⏱️ Write time: {write_time} seconds", fg="green"))
-
-    if clinical_patient_tables:
-        start_time = time.time()
-        combined_clinical_patient = pa.concat_tables(
-            clinical_patient_tables, promote=True
-        )
-        concat_time = time.time() - start_time
-
-        click.echo(
-            click.style(f"⏱️ Concatenation time: {concat_time} seconds", fg="green")
-        )
-
-        start_time = time.time()
-        pq.write_table(
-            combined_clinical_patient,
-            combined_path / "combined_clinical_patient.parquet",
-        )
-        write_time = time.time() - start_time
+    study_paths = sorted(p for p in processed_studies_path.iterdir() if p.is_dir())
+    with metrics.span("combine"):
+        if partition or incremental:
+            combine_fragments(study_paths, combined_path, row_group_size, incremental)
+        else:
+            combine_files(study_paths, combined_path, row_group_size)
 
+    with metrics.span("combine.expression"):
+        expression_count = link_expression_files(study_paths, combined_path)
+    if expression_count:
         click.echo(
             click.style(
-                f"✅ Combined clinical patient data saved to {combined_path / 'combined_clinical_patient.parquet'}",
+                f"✅ {expression_count} expression files linked to "
+                f"{combined_path / 'expression'}",
                 fg="green",
             )
         )
-        click.echo(click.style(f"⏱️ Write time: {write_time} seconds", fg="green"))
 
-    if clinical_sample_tables:
-        start_time = time.time()
-        combined_clinical_sample = pa.concat_tables(
-            clinical_sample_tables, promote=True
-        )
-        concat_time = time.time() - start_time
-
-        click.echo(
-            click.style(f"⏱️ Concatenation time: {concat_time} seconds", fg="green")
-        )
+    with metrics.span("combine.variant_index"):
+        index_path = build_variant_index(combined_path)
+    if index_path:
+        click.echo(click.style("✅ Variant index saved", fg="green"))
 
-        start_time = time.time()
-        pq.write_table(
-            combined_clinical_sample, combined_path / "combined_clinical_sample.parquet"
-        )
-        write_time = time.time() - start_time
+    with metrics.span("combine.cohort_index"):
+        cohort_index_path = build_cohort_index(combined_path)
+    if cohort_index_path:
+        click.echo(click.style("✅ Cohort index saved", fg="green"))
 
-        click.echo(
-            click.style(
-                f"✅ Combined clinical sample data saved to {combined_path / 'combined_clinical_sample.parquet'}",
-                fg="green",
-            )
-        )
-        click.echo(click.style(f"⏱️ Write time: {write_time} seconds", fg="green"))
+    with metrics.span("combine.catalog"):
+        catalog_file = create_catalog(combined_path)
+    click.echo(click.style(f"✅ DuckDB catalog saved to {catalog_file}", fg="green"))
 
 
 @data.command()
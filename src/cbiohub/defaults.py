@@ -0,0 +1,15 @@
+# Defaults and choices the cli shows in its help, kept here without any heavy
+# imports so the commands can use them without importing the modules that
+# apply them
+
+# Rows per row group in the combined mutations, kept small enough that point
+# lookups only have to decode a fraction of a chromosome
+MUTATION_ROW_GROUP_SIZE = 64 * 1024
+
+# Discrete copy-number values of each kind of alteration
+CNA_ALTERATIONS = {
+    "AMP": [2],
+    "GAIN": [1],
+    "HETLOSS": [-1],
+    "HOMDEL": [-2],
+}
@@ -0,0 +1,143 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dynaconf import settings
+
+STUDY_FILE = "meta_study.txt"
+CATALOG_FILE = "study_catalog.json"
+CATALOG_VERSION = 1
+
+# Directories scanned concurrently, os.scandir releases the GIL
+DISCOVERY_WORKERS = 8
+
+
+def catalog_path():
+    """Return the path of the persisted study catalog."""
+    return Path(settings.PROCESSED_PATH).expanduser() / CATALOG_FILE
+
+
+def load_catalog():
+    """Load the study catalog, returning an empty one if missing or outdated."""
+    try:
+        with open(catalog_path()) as f:
+            catalog = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": CATALOG_VERSION, "roots": {}}
+    if catalog.get("version") != CATALOG_VERSION:
+        return {"version": CATALOG_VERSION, "roots": {}}
+    return catalog
+
+
+def save_catalog(catalog):
+    """Atomically write the study catalog."""
+    path = catalog_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(path.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(catalog, f)
+    tmp_file.replace(path)
+
+
+def directory_entry(directory, cached):
+    """Return whether a directory is a study and its subdirectories.
+
+    The listing of an earlier scan in cached is reused when the directory's
+    mtime didn't change, as its entries are then the same. Hidden directories
+    (like .git) are skipped. Returns None if the directory can't be read.
+    """
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+    entry = cached.get(directory)
+    if entry is not None and entry["mtime_ns"] == mtime_ns:
+        return entry
+
+    is_study = False
+    subdirs = []
+    try:
+        with os.scandir(directory) as it:
+            for dir_entry in it:
+                if dir_entry.name == STUDY_FILE:
+                    is_study = True
+                elif not dir_entry.name.startswith(".") and dir_entry.is_dir(
+                    follow_symlinks=False
+                ):
+                    subdirs.append(dir_entry.name)
+    except OSError:
+        return None
+    # the subdirectories of a study are never scanned, so don't store them
+    return {
+        "mtime_ns": mtime_ns,
+        "study": is_study,
+        "subdirs": [] if is_study else sorted(subdirs),
+    }
+
+
+def scan_directory(path, cached):
+    """Find the studies below path.
+
+    Descending stops at directories with a meta_study.txt, so the (many) files
+    in studies are never listed. Returns the study paths and the entries of
+    all directories scanned, to be stored in the catalog.
+    """
+    studies = []
+    entries = {}
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        entry = directory_entry(directory, cached)
+        if entry is None:
+            continue
+        entries[directory] = entry
+        if entry["study"]:
+            studies.append(directory)
+        else:
+            stack.extend(os.path.join(directory, name) for name in entry["subdirs"])
+    return studies, entries
+
+
+def discover_studies(base_path, use_catalog=True, workers=DISCOVERY_WORKERS):
+    """Return the paths of all studies in or below base_path, sorted.
+
+    A study is a directory with a meta_study.txt. The top-level directories
+    are scanned in parallel. When use_catalog is set the directory listings are
+    cached in a catalog in PROCESSED_PATH, so later runs only list the
+    directories that changed.
+    """
+    base_path = str(Path(base_path).expanduser().resolve())
+    catalog = load_catalog() if use_catalog else None
+    cached = catalog["roots"].get(base_path, {}) if catalog else {}
+
+    entry = directory_entry(base_path, cached)
+    if entry is None:
+        return []
+    entries = {base_path: entry}
+    studies = [base_path] if entry["study"] else []
+
+    paths = [os.path.join(base_path, name) for name in entry["subdirs"]]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for sub_studies, sub_entries in executor.map(
+            lambda path: scan_directory(path, cached), paths
+        ):
+            studies.extend(sub_studies)
+            entries.update(sub_entries)
+
+    if catalog is not None and entries != cached:
+        catalog["roots"][base_path] = entries
+        save_catalog(catalog)
+    return [Path(study) for study in sorted(studies)]
+
+
+def duplicate_study_names(study_paths):
+    """Return {name: paths} for the study directory names used more than once.
+
+    Processed studies are stored under their directory name, so nested studies
+    with the same name would overwrite each other.
+    """
+    paths_by_name = {}
+    for study_path in study_paths:
+        paths_by_name.setdefault(study_path.name, []).append(study_path)
+    return {name: paths for name, paths in paths_by_name.items() if len(paths) > 1}
@@ -0,0 +1,146 @@
+import fnmatch
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+from dynaconf import settings
+
+from .frames import to_pandas
+from .metrics import span
+from .study import EXPRESSION_SAMPLES_KEY, Study
+
+# Directory of the expression files in the combined directory, with a
+# subdirectory <study_id>/<profile>.arrow per study
+EXPRESSION_DIR = "expression"
+
+EXPRESSION_SCHEMA = pa.schema(
+    [
+        ("study_id", pa.string()),
+        ("profile", pa.string()),
+        ("SAMPLE_ID", pa.string()),
+        ("Hugo_Symbol", pa.string()),
+        ("Entrez_Gene_Id", pa.string()),
+        ("value", pa.float32()),
+    ]
+)
+
+
+def open_expression(path):
+    """Memory-map an expression Arrow file.
+
+    Returns the table with a row per gene and the sample ids of the values.
+    Nothing is read from disk until columns are accessed.
+    """
+    with pa.memory_map(str(path)) as source:
+        table = ipc.open_file(source).read_all()
+    samples = json.loads(table.schema.metadata[EXPRESSION_SAMPLES_KEY])
+    return table, samples
+
+
+def read_gene(path, gene):
+    """Read the values of a gene across all samples from an expression file.
+
+    gene is a Hugo symbol or an Entrez gene id. Only the gene columns and the
+    values of the matching rows are read, each row being one contiguous range
+    of the file. Returns a list of (Hugo_Symbol, Entrez_Gene_Id, samples,
+    values) tuples, more than one if the gene occurs in several rows.
+    """
+    table, samples = open_expression(path)
+    matches = pc.or_(
+        pc.fill_null(pc.equal(table.column("Hugo_Symbol"), gene), False),
+        pc.fill_null(pc.equal(table.column("Entrez_Gene_Id"), str(gene)), False),
+    )
+    rows = []
+    for index in pc.indices_nonzero(matches).to_pylist():
+        values = table.column("values")[index].values
+        rows.append(
+            (
+                table.column("Hugo_Symbol")[index].as_py(),
+                table.column("Entrez_Gene_Id")[index].as_py(),
+                samples,
+                values,
+            )
+        )
+    return rows
+
+
+def read_expression(files, gene, profile=None):
+    """Read the values of a gene from (study_id, path) expression files.
+
+    profile is a glob pattern the profile names are matched against, the
+    name of the file without the .arrow suffix. Returns a long format
+    DataFrame with a row per sample and profile.
+    """
+    tables = []
+    for study_id, path in files:
+        path = Path(path)
+        if profile is not None and not fnmatch.fnmatch(path.stem, profile):
+            continue
+        for hugo_symbol, entrez_gene_id, samples, values in read_gene(path, gene):
+            count = len(samples)
+            tables.append(
+                pa.table(
+                    [
+                        pa.array([study_id] * count, pa.string()),
+                        pa.array([path.stem] * count, pa.string()),
+                        pa.array(samples, pa.string()),
+                        pa.array([hugo_symbol] * count, pa.string()),
+                        pa.array([entrez_gene_id] * count, pa.string()),
+                        values,
+                    ],
+                    schema=EXPRESSION_SCHEMA,
+                )
+            )
+    if not tables:
+        return to_pandas(EXPRESSION_SCHEMA.empty_table())
+    return to_pandas(pa.concat_tables(tables))
+
+
+def link_expression_files(study_paths, combined_path):
+    """Collect the expression files of the processed studies in combined_path.
+
+    Like combine, studies that weren't successfully processed are left out.
+    Files are hard linked where possible, so the large matrices aren't copied.
+    Returns the number of expression files.
+    """
+    expression_path = combined_path / EXPRESSION_DIR
+    shutil.rmtree(expression_path, ignore_errors=True)
+    count = 0
+    for study_path in study_paths:
+        if not Study(study_path).ingestion_succeeded():
+            continue
+        for source in sorted((study_path / "expression").glob("*.arrow")):
+            target = expression_path / study_path.name / source.name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            count += 1
+    return count
+
+
+def get_expression(gene, profile=None, directory=None):
+    """Get the values of a gene across the samples of all combined studies.
+
+    profile is a glob pattern of the profiles to read, e.g.
+    "mrna_seq_v2_rsem_zscores*". Returns a DataFrame with study_id, profile,
+    SAMPLE_ID, Hugo_Symbol, Entrez_Gene_Id and value columns.
+    """
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    files = [
+        (path.parent.name, path)
+        for path in sorted((directory / EXPRESSION_DIR).glob("*/*.arrow"))
+    ]
+    with span("query.get_expression") as timing:
+        df = read_expression(files, gene, profile)
+        timing.rows = len(df)
+    return df
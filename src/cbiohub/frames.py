@@ -0,0 +1,66 @@
+import pandas as pd
+import pyarrow as pa
+from dynaconf import settings
+
+# Low-cardinality string columns that are read as dictionaries, so they end up
+# as categoricals in pandas instead of one Python string per row
+DICTIONARY_COLUMNS = [
+    "study_id",
+    "Chromosome",
+    "Hugo_Symbol",
+    "Reference_Allele",
+    "Tumor_Seq_Allele1",
+    "Tumor_Seq_Allele2",
+    "Variant_Classification",
+    "Variant_Type",
+    "CANCER_TYPE",
+    "CANCER_TYPE_DETAILED",
+    "ONCOTREE_CODE",
+    "SAMPLE_TYPE",
+    "SEX",
+]
+
+# Ways string columns can be represented in pandas, set with STRING_DTYPE:
+# - categorical: DICTIONARY_COLUMNS as categoricals, nullable integers and
+#   booleans
+# - arrow: every column backed by Arrow (pd.ArrowDtype, e.g. string[pyarrow])
+# - default: whatever pyarrow's to_pandas does by default
+STRING_DTYPES = ["categorical", "arrow", "default"]
+
+
+def get_string_dtype():
+    """Return the configured representation of string columns in pandas."""
+    string_dtype = settings.get("STRING_DTYPE", "categorical")
+    if string_dtype not in STRING_DTYPES:
+        raise ValueError(
+            f"Unknown string dtype: {string_dtype}, choose from {', '.join(STRING_DTYPES)}"
+        )
+    return string_dtype
+
+
+def get_dictionary_columns(names):
+    """Return the columns of names that should be read as dictionaries."""
+    if get_string_dtype() != "categorical":
+        return []
+    return [col for col in DICTIONARY_COLUMNS if col in names]
+
+
+def to_pandas(table):
+    """Convert an Arrow table to a DataFrame using the configured string dtype."""
+    string_dtype = get_string_dtype()
+    if string_dtype == "arrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    if string_dtype == "categorical":
+        for col in get_dictionary_columns(table.schema.names):
+            index = table.schema.get_field_index(col)
+            if pa.types.is_string(table.schema.field(index).type):
+                table = table.set_column(
+                    index, col, table.column(index).dictionary_encode()
+                )
+        return table.to_pandas(
+            types_mapper={
+                pa.int64(): pd.Int64Dtype(),
+                pa.bool_(): pd.BooleanDtype(),
+            }.get
+        )
+    return table.to_pandas()
@@ -0,0 +1,235 @@
+import contextlib
+import json
+import re
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Spans are only recorded once enabled, e.g. by `cbiohub --profile`
+_enabled = False
+_spans = []
+_lock = threading.Lock()
+# Spans that haven't finished, whose peak_rss is still being measured
+_open_spans = []
+
+# Linux resets the peak resident memory (VmHWM) of a process to its current
+# resident memory when "5" is written to clear_refs
+CLEAR_REFS_FILE = "/proc/self/clear_refs"
+STATUS_FILE = "/proc/self/status"
+
+
+class Span:
+    """Timing of one stage, optionally for a single study.
+
+    Code inside the span can set rows and bytes to the amount of data the
+    stage handled. peak_rss is the peak resident memory of the process while
+    the span was open, on platforms that can reset the peak (Linux). Elsewhere
+    it is None and max_rss_so_far, the peak resident memory of the process
+    from its start to the end of the span, is recorded instead.
+    """
+
+    def __init__(self, stage, study=None):
+        self.stage = stage
+        self.study = study
+        self.rows = None
+        self.bytes = None
+        self.start = None
+        self.seconds = None
+        self.peak_rss = None
+        self.max_rss_so_far = None
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "study": self.study,
+            "start": self.start,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_rss": self.peak_rss,
+            "max_rss_so_far": self.max_rss_so_far,
+        }
+
+
+def enable():
+    """Start recording spans."""
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def max_rss_so_far():
+    """Return the peak resident memory of the process since it started in
+    bytes, or since the last reset_peak_rss on Linux."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak resident memory of the process to its current resident
+    memory. Returns False if the platform doesn't support it."""
+    try:
+        with open(CLEAR_REFS_FILE, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_since_reset():
+    """Return the peak resident memory since the last reset_peak_rss in bytes."""
+    try:
+        with open(STATUS_FILE) as f:
+            match = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) * 1024 if match else None
+
+
+def _update_open_spans():
+    """Fold the peak since the last reset into the spans that are open.
+
+    Every span resets the peak when it starts, so the spans open now were
+    open for the whole time since the last reset. Call with _lock held.
+    """
+    peak = peak_rss_since_reset()
+    for s in _open_spans:
+        if s.peak_rss is not None and peak is not None:
+            s.peak_rss = max(s.peak_rss, peak)
+
+
+@contextlib.contextmanager
+def span(stage, study=None):
+    """Time the code in the with block as a stage, when recording is enabled."""
+    current = Span(stage, study)
+    if not _enabled:
+        yield current
+        return
+    with _lock:
+        _update_open_spans()
+        # spans on platforms that can't reset the peak keep peak_rss None
+        current.peak_rss = 0 if reset_peak_rss() else None
+        _open_spans.append(current)
+        _update_open_spans()
+    current.start = time.time()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        if current.peak_rss is None:
+            current.max_rss_so_far = max_rss_so_far()
+        with _lock:
+            _update_open_spans()
+            _open_spans.remove(current)
+            _spans.append(current.to_dict())
+
+
+def get_spans():
+    """Return the recorded spans as dicts, in the order they finished."""
+    with _lock:
+        return list(_spans)
+
+
+def record(spans):
+    """Add spans recorded elsewhere, e.g. in an ingest worker process."""
+    with _lock:
+        _spans.extend(spans)
+
+
+def clear():
+    with _lock:
+        _spans.clear()
+
+
+def summarize(spans):
+    """Aggregate spans per stage into (stage, count, seconds, rows, bytes,
+    peak_rss) rows, slowest stage first. peak_rss is None if no span of the
+    stage measured it."""
+    stages = {}
+    for s in spans:
+        count, seconds, rows, size, rss = stages.get(s["stage"], (0, 0.0, 0, 0, None))
+        if s.get("peak_rss") is not None:
+            rss = max(rss or 0, s["peak_rss"])
+        stages[s["stage"]] = (
+            count + 1,
+            seconds + s["seconds"],
+            rows + (s["rows"] or 0),
+            size + (s["bytes"] or 0),
+            rss,
+        )
+    return sorted(
+        ((stage, *values) for stage, values in stages.items()),
+        key=lambda row: row[2],
+        reverse=True,
+    )
+
+
+def slowest_studies(spans, limit=10):
+    """Return (study, seconds) for the studies that took longest in total.
+
+    Only the "*.study" stages are counted, as the finer grained stages of a
+    study are nested in them.
+    """
+    studies = {}
+    for s in spans:
+        if s["study"] is not None and s["stage"].endswith(".study"):
+            studies[s["study"]] = studies.get(s["study"], 0.0) + s["seconds"]
+    return sorted(studies.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def format_summary(spans):
+    """Format a table of the time spent per stage and the slowest studies."""
+    from tabulate import tabulate
+
+    rows = [
+        (
+            stage,
+            count,
+            f"{seconds:.3f}",
+            rows,
+            size,
+            "" if rss is None else f"{rss / 2**20:.0f}",
+        )
+        for stage, count, seconds, rows, size, rss in summarize(spans)
+    ]
+    lines = [
+        tabulate(
+            rows,
+            ["Stage", "Count", "Seconds", "Rows", "Bytes", "Peak RSS (MB)"],
+            tablefmt="plain",
+        )
+    ]
+    studies = slowest_studies(spans)
+    if studies:
+        lines.append("")
+        lines.append(
+            tabulate(
+                [(study, f"{seconds:.3f}") for study, seconds in studies],
+                ["Slowest studies", "Seconds"],
+                tablefmt="plain",
+            )
+        )
+    return "\n".join(lines)
+
+
+def write_json(path):
+    """Write the recorded spans and their summary per stage to a JSON file."""
+    spans = get_spans()
+    summary = [
+        dict(zip(["stage", "count", "seconds", "rows", "bytes", "peak_rss"], row))
+        for row in summarize(spans)
+    ]
+    with open(path, "w") as f:
+        json.dump({"spans": spans, "summary": summary}, f, indent=2)
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from dynaconf import settings
+
+# Tables a combine writes that queries read, as a single file or a fragment
+# dataset
+FINGERPRINT_TABLES = [
+    "combined_mutations",
+    "combined_clinical_patient",
+    "combined_clinical_patient_long",
+    "combined_clinical_patient_core",
+    "combined_clinical_sample",
+    "combined_clinical_sample_long",
+    "combined_clinical_sample_core",
+    "combined_cna",
+    "summary_samples",
+    "summary_samples_by_attribute",
+    "summary_gene",
+    "summary_gene_by_attribute",
+    "summary_protein_change",
+    "summary_protein_change_by_attribute",
+    "summary_variant",
+    "summary_variant_by_attribute",
+]
+
+# Files written at the end of a combine, a change in any of them invalidates
+# the cached results for that combined directory
+FINGERPRINT_FILES = [
+    *(f"{name}.parquet" for name in FINGERPRINT_TABLES),
+    *(f"{name}/_common_metadata" for name in FINGERPRINT_TABLES),
+    "cohort_index/samples.parquet",
+    "cohort_index/bitmaps.parquet",
+]
+
+# Settings that change which attributes combine indexes and summarizes
+FINGERPRINT_SETTINGS = ["COHORT_ATTRIBUTES", "SUMMARY_ATTRIBUTES"]
+
+
+def combined_fingerprint(directory):
+    """Fingerprint the combined tables in directory by size and mtime, and the
+    settings they were built with."""
+    parts = []
+    for file_name in FINGERPRINT_FILES:
+        try:
+            stat = (directory / file_name).stat()
+        except FileNotFoundError:
+            continue
+        parts.append(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}")
+    for name in FINGERPRINT_SETTINGS:
+        parts.append(f"{name}:{json.dumps(settings.get(name), default=str)}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+class QueryCache:
+    """LRU cache of query results with an optional on-disk tier.
+
+    Keys include the fingerprint of the combined directory the query ran
+    against, so results are invalidated automatically by a new combine. Disk
+    entries are stored per combined directory and fingerprint under
+    PROCESSED_PATH/query_cache. When a directory gets a new fingerprint, the
+    entries of its older fingerprints are removed, those of other directories
+    are kept.
+
+    Results are lists of rows, every call returns its own copy of the list.
+    """
+
+    def __init__(self, maxsize=1024, disk_path=None):
+        self.maxsize = maxsize
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, name, directory, args, compute):
+        """Return the cached result of a query, computing it on a miss."""
+        directory = Path(directory).resolve()
+        fingerprint = combined_fingerprint(directory)
+        key = json.dumps([name, str(directory), fingerprint, args])
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+
+        result = self._read_disk(directory, fingerprint, key)
+        if result is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._store(key, list(result))
+            return result
+
+        result = compute()
+        with self._lock:
+            self.misses += 1
+            self._store(key, list(result))
+        self._write_disk(directory, fingerprint, key, result)
+        return result
+
+    def _store(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _directory_path(self, directory):
+        directory_hash = hashlib.sha256(str(directory).encode()).hexdigest()[:16]
+        return self.disk_path / directory_hash
+
+    def _disk_file(self, directory, fingerprint, key):
+        key_hash = hashlib.sha256(key.encode()).hexdigest()
+        return self._directory_path(directory) / fingerprint / f"{key_hash}.json"
+
+    def _read_disk(self, directory, fingerprint, key):
+        if self.disk_path is None:
+            return None
+        try:
+            with open(self._disk_file(directory, fingerprint, key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry["key"] != key:
+            return None
+        return [tuple(row) for row in entry["result"]]
+
+    def _write_disk(self, directory, fingerprint, key, result):
+        if self.disk_path is None:
+            return
+        disk_file = self._disk_file(directory, fingerprint, key)
+        if not disk_file.parent.exists():
+            # a new combine of this directory, drop the results of its older
+            # combines
+            directory_path = disk_file.parent.parent
+            if directory_path.exists():
+                for old in directory_path.iterdir():
+                    if old.name != fingerprint:
+                        shutil.rmtree(old, ignore_errors=True)
+            disk_file.parent.mkdir(parents=True, exist_ok=True)
+        # unique per thread and process, as other servers may share the cache
+        tmp_file = disk_file.with_name(
+            f"{disk_file.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump({"key": key, "result": result}, f)
+            tmp_file.replace(disk_file)
+        except OSError:
+            # the directory was evicted by a concurrent writer, the result
+            # just isn't cached on disk
+            tmp_file.unlink(missing_ok=True)
+
+    def clear(self):
+        """Remove all cached results and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if self.disk_path is not None and self.disk_path.exists():
+            shutil.rmtree(self.disk_path)
+
+    def info(self):
+        """Return the hit/miss counters and the size of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+_query_cache = None
+
+
+def get_query_cache():
+    """Return the process wide query cache, configured from the settings."""
+    global _query_cache
+    if _query_cache is None:
+        disk_path = None
+        if settings.get("QUERY_CACHE_DISK", False):
+            disk_path = Path(settings.PROCESSED_PATH).expanduser() / "query_cache"
+        _query_cache = QueryCache(
+            maxsize=settings.get("QUERY_CACHE_SIZE", 1024), disk_path=disk_path
+        )
+    return _query_cache
+
+
+def query_cache_info():
+    """Return the hit/miss counters of the query cache."""
+    return get_query_cache().info()
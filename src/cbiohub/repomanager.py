@@ -1,7 +1,7 @@
 from pathlib import Path
 from dynaconf import settings
-from study import Study
-import glob
+from .discovery import discover_studies
+from .study import Study
 
 
 class RepoManager:
@@ -11,25 +11,22 @@ class RepoManager:
 
     def _load_studies(self):
         """Load all studies from the base directory based on the presence of meta_study.txt."""
-        studies = []
-        for study_path in glob.glob(str(self.base_path / "**"), recursive=True):
-            if (
-                Path(study_path).is_dir()
-                and (Path(study_path) / "meta_study.txt").exists()
-            ):
-                studies.append(Study(Path(study_path)))
+        studies = {}
+        for study_path in discover_studies(self.base_path):
+            # the first study found wins if the same name occurs twice
+            studies.setdefault(study_path.name, Study(study_path))
         return studies
 
     def list_studies(self):
         """List all study directories."""
-        return [study.study_path.name for study in self.studies]
+        return list(self.studies)
 
     def get_study(self, study_name):
         """Get a specific study by name."""
-        for study in self.studies:
-            if study.study_path.name == study_name:
-                return study
-        raise FileNotFoundError(f"Study {study_name} not found.")
+        try:
+            return self.studies[study_name]
+        except KeyError:
+            raise FileNotFoundError(f"Study {study_name} not found.")
 
 
 # Example usage
@@ -0,0 +1,294 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+import stat
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import click
+from dynaconf import settings
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Seconds a forwarded CLI request waits for the server
+CLIENT_TIMEOUT = 300
+
+
+def handle_find(directory, params):
+    """Find a variant by genomic coordinates or gene and protein change."""
+    from .analyze import find_variant
+
+    exists, unique_ids = find_variant(
+        chrom=params.get("chrom"),
+        start=params.get("start"),
+        end=params.get("end"),
+        ref=params.get("ref"),
+        alt=params.get("alt"),
+        hugo_symbol=params.get("gene"),
+        protein_change=params.get("protein_change"),
+        directory=directory,
+        cohort=params.get("cohort"),
+    )
+    return {"exists": bool(exists), "unique_ids": list(unique_ids)}
+
+
+def handle_variant_frequency(directory, params):
+    """Count a variant per value of a clinical sample attribute."""
+    from .analyze import variant_frequency_per_cancer_type
+
+    try:
+        args = [params[key] for key in ["chrom", "start", "end", "ref", "alt"]]
+    except KeyError as e:
+        raise ValueError(f"Missing parameter: {e.args[0]}")
+    result = variant_frequency_per_cancer_type(
+        *args,
+        params.get("clinical_attribute", "CANCER_TYPE"),
+        directory=directory,
+        cohort=params.get("cohort"),
+    )
+    return {"result": [list(row) for row in result]}
+
+
+def handle_convert(directory, params):
+    """Convert a gene and protein change to genomic coordinates."""
+    from .analyze import get_genomic_coordinates_by_gene_and_protein_change
+
+    try:
+        gene, protein_change = params["gene"], params["protein_change"]
+    except KeyError as e:
+        raise ValueError(f"Missing parameter: {e.args[0]}")
+    result = get_genomic_coordinates_by_gene_and_protein_change(
+        gene, protein_change, directory=directory
+    )
+    return {"result": [list(row) for row in result]}
+
+
+def handle_status(directory, params):
+    """Report the directory being served and the query cache counters."""
+    from .query_cache import query_cache_info
+
+    return {"directory": str(directory), "query_cache": query_cache_info()}
+
+
+ENDPOINTS = {
+    "/find": handle_find,
+    "/variant-frequency": handle_variant_frequency,
+    "/convert": handle_convert,
+    "/status": handle_status,
+}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Answer the JSON endpoints, parameters are passed in the query string
+    or as a JSON object in the body of a POST."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.respond(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self.send_json(400, {"error": f"Invalid JSON body: {e}"})
+            return
+        self.respond(url.path, params)
+
+    def respond(self, path, params):
+        handler = ENDPOINTS.get(path)
+        if handler is None:
+            self.send_json(404, {"error": f"Unknown endpoint: {path}"})
+            return
+        try:
+            self.send_json(200, handler(self.server.directory, params))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # the client address of a Unix socket connection is an empty string
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        super().server_bind()
+        # attributes BaseHTTPRequestHandler expects from an HTTPServer
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def warm_up(directory):
+    """Open the DuckDB connection and load the variant indexes of directory."""
+    from .analyze import get_connection
+    from .variant_index import INDEX_KEYS, load_variant_index
+
+    con = get_connection(directory)
+    con.close()
+    for kind in INDEX_KEYS:
+        load_variant_index(directory, kind)
+
+
+def remove_stale_socket(socket_path):
+    """Remove the socket a server left behind at socket_path.
+
+    Raises ValueError if socket_path is not a socket, or if a server still
+    accepts connections on it.
+    """
+    try:
+        mode = socket_path.lstat().st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            socket_path.unlink(missing_ok=True)
+            return
+    raise ValueError(f"A server is already listening on {socket_path}")
+
+
+def create_server(directory, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """Create a threaded server answering queries on the combined directory.
+
+    Listens on a Unix socket if socket_path is given, on host:port otherwise.
+    Raises ValueError if socket_path is in use.
+    """
+    if socket_path is not None:
+        socket_path = Path(socket_path)
+        remove_stale_socket(socket_path)
+        server = ThreadingUnixHTTPServer(str(socket_path), RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.directory = Path(directory)
+    server.quiet = False
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def get_server_url(server_url=None, processed_dir=None):
+    """Return the server to forward to, from the argument or SERVER_URL setting.
+
+    Queries on an explicit processed_dir run locally, as the server answers
+    from its own directory, so SERVER_URL is ignored and combining them with
+    a server_url is a usage error.
+    """
+    if processed_dir:
+        if server_url:
+            raise click.UsageError("--server can't be combined with --processed-dir")
+        return None
+    return server_url or settings.get("SERVER_URL") or None
+
+
+def query_server(server_url, endpoint, params):
+    """Send a query to a running `cbiohub serve` and return its JSON response.
+
+    server_url is either http://host:port or unix:///path/to/socket. Raises
+    ValueError for queries the server rejected, and OSError if the server
+    can't be reached.
+    """
+    url = urlsplit(server_url)
+    if url.scheme == "unix":
+        connection = UnixHTTPConnection(url.path, timeout=CLIENT_TIMEOUT)
+    elif url.scheme == "http":
+        connection = http.client.HTTPConnection(url.netloc, timeout=CLIENT_TIMEOUT)
+    else:
+        raise ValueError(f"Unsupported server URL: {server_url}")
+
+    params = {key: value for key, value in params.items() if value is not None}
+    try:
+        connection.request("GET", f"/{endpoint}?{urlencode(params)}")
+        response = connection.getresponse()
+        body = json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(body.get("error", f"Server returned {response.status}"))
+    return body
+
+
+@click.command()
+@click.option(
+    "--processed-dir",
+    default=None,
+    help="Directory containing the processed parquet files",
+)
+@click.option("--host", default=DEFAULT_HOST, show_default=True)
+@click.option("--port", type=int, default=DEFAULT_PORT, show_default=True)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on a Unix socket instead of host:port.",
+)
+@click.option("--quiet", is_flag=True, default=False, help="Don't log requests.")
+def serve(processed_dir, host, port, socket_path, quiet):
+    """Serve find, variant-frequency and convert queries as JSON over HTTP.
+
+    The DuckDB connection, variant indexes and query cache stay warm between
+    requests. Other cbiohub commands forward to the server with --server or
+    the SERVER_URL setting.
+    """
+    directory = (
+        Path(processed_dir)
+        if processed_dir
+        else Path(os.path.expanduser(settings.PROCESSED_PATH)) / "combined"
+    )
+    warm_up(directory)
+    try:
+        server = create_server(directory, host, port, socket_path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    server.quiet = quiet
+
+    url = (
+        f"unix://{Path(socket_path).resolve()}"
+        if socket_path
+        else f"http://{host}:{port}"
+    )
+    click.echo(click.style(f"✅ Serving {directory} on {url}", fg="green"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path:
+            Path(socket_path).unlink(missing_ok=True)
@@ -1,10 +1,574 @@
+import io
 import os
+import fnmatch
+import hashlib
+import subprocess
 from pathlib import Path
-import pandas as pd
+import json
+import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from dynaconf import (
     settings,
 )  # Assuming settings is a module with PROCESSED_PATH defined
 
+from .frames import get_dictionary_columns, to_pandas
+from .metrics import span
+
+# Size of the blocks read from the TSV files, each block becomes one record
+# batch so this bounds the memory used during conversion
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+# A '#' comment line, with its line break
+COMMENT_LINE = re.compile(rb"^#[^\n]*(\n|$)", re.MULTILINE)
+
+# Same strings pandas.read_csv treats as missing values
+NULL_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+
+# Arrow types for the datatypes in the header of cBioPortal clinical files
+CLINICAL_DATATYPES = {
+    "STRING": pa.string(),
+    "NUMBER": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+}
+
+# Key in the Parquet schema metadata under which the clinical attribute
+# metadata from the header rows is stored as JSON
+CLINICAL_ATTRIBUTES_KEY = b"cbioportal_attributes"
+
+# Gene columns of copy-number files, all other columns are samples
+CNA_GENE_COLUMNS = ["Hugo_Symbol", "Entrez_Gene_Id"]
+CNA_SCHEMA = pa.schema(
+    [
+        ("Hugo_Symbol", pa.string()),
+        ("Entrez_Gene_Id", pa.string()),
+        ("SAMPLE_ID", pa.string()),
+        ("value", pa.float32()),
+        ("study_id", pa.string()),
+    ]
+)
+
+# Gene x sample matrices of continuous values, e.g. mRNA expression z-scores
+EXPRESSION_FILE_PATTERNS = ["data_mrna_seq_*.txt", "data_methylation_*.txt"]
+# Sample ids of an expression file, stored as JSON in the Arrow schema metadata
+EXPRESSION_SAMPLES_KEY = b"cbioportal_samples"
+
+# Size, mtime and content hash of the input files of a processed study
+INPUT_MANIFEST_FILE = "input_manifest.json"
+
+# Files at least this large are looked up in the git index before hashing
+GIT_INDEX_MIN_SIZE = 16 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def read_header(file_path):
+    """Return the leading '#' comment lines and the column names of a TSV file.
+
+    Also returns the number of blank lines before the column names, to pass as
+    skip_rows to the Arrow CSV reader of the file's CommentLines.
+    """
+    comment_lines = []
+    skip_rows = 0
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("#"):
+                comment_lines.append(line.rstrip("\r\n"))
+            elif line.strip():
+                return comment_lines, line.rstrip("\r\n").split("\t"), skip_rows
+            else:
+                skip_rows += 1
+    return comment_lines, [], 0
+
+
+class CommentLines(io.RawIOBase):
+    """Binary stream of a TSV file without its '#' comment lines.
+
+    pandas dropped comment lines anywhere in a file with comment="#", Arrow
+    would read a comment line after the header as data. The file is read in
+    chunks of whole lines, and only chunks holding a comment line are
+    rewritten, so files without them pass through at the speed of a read.
+    """
+
+    def __init__(self, file_path, chunk_size=CSV_BLOCK_SIZE):
+        self.file = open(file_path, "rb")
+        self.chunk_size = chunk_size
+        # the incomplete last line of the chunk read last
+        self.partial = b""
+        self.buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk and not self.partial:
+                return 0
+            lines = self.partial + chunk
+            end = len(lines) if not chunk else lines.rfind(b"\n") + 1
+            lines, self.partial = lines[:end], lines[end:]
+            if lines.startswith(b"#") or b"\n#" in lines:
+                lines = COMMENT_LINE.sub(b"", lines)
+            self.buffer = memoryview(lines)
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class ShortRows:
+    """Invalid row handler that pads rows with missing trailing fields.
+
+    pandas filled missing trailing fields with NaN, but Arrow can only skip
+    or reject an invalid row. Short rows are skipped and kept here, and
+    take() reads them back padded with empty fields, which are nulls. Rows
+    with too many fields are still an error, as they were with pandas.
+    """
+
+    def __init__(self, column_names, convert_options):
+        self.column_names = column_names
+        self.convert_options = convert_options
+        self.rows = []
+
+    def __call__(self, row):
+        if row.actual_columns > row.expected_columns:
+            return "error"
+        self.rows.append(row.text.rstrip("\r"))
+        return "skip"
+
+    def take(self):
+        """Return the short rows kept so far as record batches."""
+        if not self.rows:
+            return []
+        rows, self.rows = self.rows, []
+        num_columns = len(self.column_names)
+        text = "".join(
+            row + "\t" * (num_columns - 1 - row.count("\t")) + "\n" for row in rows
+        )
+        return pacsv.read_csv(
+            io.BytesIO(text.encode()),
+            read_options=pacsv.ReadOptions(column_names=self.column_names),
+            parse_options=pacsv.ParseOptions(delimiter="\t"),
+            convert_options=self.convert_options,
+        ).to_batches()
+
+    def batches(self, reader):
+        """Yield the batches of reader, each followed by its padded short rows."""
+        for batch in reader:
+            yield batch
+            yield from self.take()
+        yield from self.take()
+
+
+def stream_tsv_to_parquet(file_path, output_file, study_id, block_size=None):
+    """Convert a TSV file to Parquet one record batch at a time.
+
+    All columns are read as strings and a study_id column is appended, and
+    '#' comment lines are skipped anywhere in the file. The output is written
+    to a temporary file first so an interrupted conversion never leaves a
+    partial Parquet file. Returns the number of rows written.
+    """
+    comment_lines, column_names, skip_rows = read_header(file_path)
+    if not column_names:
+        raise pa.ArrowInvalid(f"No header line found in {file_path}")
+
+    convert_options = pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in column_names},
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    short_rows = ShortRows(column_names, convert_options)
+    with CommentLines(file_path) as stream:
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(
+                skip_rows=skip_rows, block_size=block_size or CSV_BLOCK_SIZE
+            ),
+            parse_options=pacsv.ParseOptions(
+                delimiter="\t", invalid_row_handler=short_rows
+            ),
+            convert_options=convert_options,
+        )
+
+        # replace any study_id column already in the file
+        keep = [i for i, name in enumerate(reader.schema.names) if name != "study_id"]
+        fields = [reader.schema.field(i) for i in keep]
+        schema = pa.schema(fields + [pa.field("study_id", pa.string())])
+
+        num_rows = 0
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        try:
+            with pq.ParquetWriter(tmp_file, schema) as writer:
+                for batch in short_rows.batches(reader):
+                    columns = [batch.column(i) for i in keep]
+                    columns.append(pa.array([study_id] * batch.num_rows, pa.string()))
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(columns, schema=schema)
+                    )
+                    num_rows += batch.num_rows
+            tmp_file.replace(output_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+    return num_rows
+
+
+def cna_tsv_to_parquet(file_path, output_file, study_id, block_size=None):
+    """Convert a discrete copy-number matrix to a sparse long format Parquet file.
+
+    The gene x sample matrix is read one block of genes at a time, and only
+    the non-zero calls are kept as (Hugo_Symbol, Entrez_Gene_Id, SAMPLE_ID,
+    value, study_id) rows, sorted by gene within each block. Returns the
+    number of rows written.
+    """
+    comment_lines, column_names, skip_rows = read_header(file_path)
+    if not column_names:
+        raise pa.ArrowInvalid(f"No header line found in {file_path}")
+    gene_columns = [name for name in CNA_GENE_COLUMNS if name in column_names]
+    if not gene_columns:
+        raise pa.ArrowInvalid(f"No Hugo_Symbol or Entrez_Gene_Id column in {file_path}")
+    samples = [name for name in column_names if name not in CNA_GENE_COLUMNS]
+
+    convert_options = pacsv.ConvertOptions(
+        column_types={
+            name: pa.string() if name in CNA_GENE_COLUMNS else pa.float32()
+            for name in column_names
+        },
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    short_rows = ShortRows(column_names, convert_options)
+    with CommentLines(file_path) as stream:
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(
+                skip_rows=skip_rows, block_size=block_size or CSV_BLOCK_SIZE
+            ),
+            parse_options=pacsv.ParseOptions(
+                delimiter="\t", invalid_row_handler=short_rows
+            ),
+            convert_options=convert_options,
+        )
+
+        num_rows = 0
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        try:
+            with pq.ParquetWriter(tmp_file, CNA_SCHEMA) as writer:
+                for batch in short_rows.batches(reader):
+                    genes = {
+                        name: (
+                            batch.column(name)
+                            if name in gene_columns
+                            else pa.nulls(batch.num_rows, pa.string())
+                        )
+                        for name in CNA_GENE_COLUMNS
+                    }
+                    parts = []
+                    for sample in samples:
+                        values = batch.column(sample)
+                        nonzero = pc.fill_null(pc.not_equal(values, 0), False)
+                        count = pc.sum(nonzero).as_py() or 0
+                        if count == 0:
+                            continue
+                        parts.append(
+                            pa.table(
+                                [
+                                    genes["Hugo_Symbol"].filter(nonzero),
+                                    genes["Entrez_Gene_Id"].filter(nonzero),
+                                    pa.array([sample] * count, pa.string()),
+                                    values.filter(nonzero),
+                                    pa.array([study_id] * count, pa.string()),
+                                ],
+                                schema=CNA_SCHEMA,
+                            )
+                        )
+                    if parts:
+                        table = pa.concat_tables(parts).sort_by(
+                            [("Hugo_Symbol", "ascending"), ("SAMPLE_ID", "ascending")]
+                        )
+                        writer.write_table(table)
+                        num_rows += table.num_rows
+            tmp_file.replace(output_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+    return num_rows
+
+
+def expression_tsv_to_arrow(file_path, output_file, block_size=None):
+    """Convert an expression matrix to a gene-major Arrow IPC file.
+
+    Each row has the Hugo_Symbol and Entrez_Gene_Id of a gene and a values
+    column with the float32 values of all samples, so the values of one gene
+    are stored contiguously. Memory-mapping the file then reads a gene across
+    all samples with a single seek. The matrix is converted one block of genes
+    at a time; the sample ids are stored in the schema metadata. Returns the
+    number of genes written.
+    """
+    comment_lines, column_names, skip_rows = read_header(file_path)
+    if not column_names:
+        raise pa.ArrowInvalid(f"No header line found in {file_path}")
+    gene_columns = [name for name in CNA_GENE_COLUMNS if name in column_names]
+    if not gene_columns:
+        raise pa.ArrowInvalid(f"No Hugo_Symbol or Entrez_Gene_Id column in {file_path}")
+    samples = [name for name in column_names if name not in CNA_GENE_COLUMNS]
+
+    convert_options = pacsv.ConvertOptions(
+        column_types={
+            name: pa.string() if name in CNA_GENE_COLUMNS else pa.float32()
+            for name in column_names
+        },
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    short_rows = ShortRows(column_names, convert_options)
+    with CommentLines(file_path) as stream:
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(
+                skip_rows=skip_rows, block_size=block_size or CSV_BLOCK_SIZE
+            ),
+            parse_options=pacsv.ParseOptions(
+                delimiter="\t", invalid_row_handler=short_rows
+            ),
+            convert_options=convert_options,
+        )
+        schema = pa.schema(
+            [
+                ("Hugo_Symbol", pa.string()),
+                ("Entrez_Gene_Id", pa.string()),
+                ("values", pa.list_(pa.float32(), len(samples))),
+            ],
+            metadata={EXPRESSION_SAMPLES_KEY: json.dumps(samples)},
+        )
+
+        num_rows = 0
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        try:
+            with ipc.new_file(tmp_file, schema) as writer:
+                for batch in short_rows.batches(reader):
+                    # missing values become NaN in the gene-major matrix
+                    matrix = np.empty((batch.num_rows, len(samples)), dtype=np.float32)
+                    for i, sample in enumerate(samples):
+                        matrix[:, i] = batch.column(sample).to_numpy(
+                            zero_copy_only=False
+                        )
+                    values = pa.FixedSizeListArray.from_arrays(
+                        pa.array(matrix.ravel()), len(samples)
+                    )
+                    genes = [
+                        (
+                            batch.column(name)
+                            if name in gene_columns
+                            else pa.nulls(batch.num_rows, pa.string())
+                        )
+                        for name in CNA_GENE_COLUMNS
+                    ]
+                    writer.write_batch(pa.record_batch([*genes, values], schema=schema))
+                    num_rows += batch.num_rows
+            tmp_file.replace(output_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+    return num_rows
+
+
+def parse_clinical_header(comment_lines, column_names):
+    """Parse the attribute metadata in the '#' header rows of a clinical file.
+
+    The four rows hold the display name, description, datatype and priority of
+    each attribute. Returns an empty dict if the rows are missing or malformed.
+    """
+    rows = [line[1:].split("\t") for line in comment_lines[:4]]
+    if len(rows) < 4 or any(len(row) != len(column_names) for row in rows):
+        return {}
+    return {
+        name: {
+            "display_name": rows[0][i],
+            "description": rows[1][i],
+            "datatype": rows[2][i].strip().upper(),
+            "priority": rows[3][i].strip(),
+        }
+        for i, name in enumerate(column_names)
+    }
+
+
+def clinical_tsv_to_parquet(file_path, output_file, study_id):
+    """Convert a clinical file to Parquet with typed columns.
+
+    Columns are typed using the datatype header row (NUMBER as float,
+    BOOLEAN as bool), and the attribute metadata is kept in the Parquet schema
+    metadata. A column with values that don't fit its declared datatype is
+    kept as string. Clinical files are small, so they are read at once.
+    Returns the number of rows written.
+    """
+    comment_lines, column_names, skip_rows = read_header(file_path)
+    if not column_names:
+        raise pa.ArrowInvalid(f"No header line found in {file_path}")
+    attributes = parse_clinical_header(comment_lines, column_names)
+
+    convert_options = pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in column_names},
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    short_rows = ShortRows(column_names, convert_options)
+    with CommentLines(file_path) as stream:
+        table = pacsv.read_csv(
+            stream,
+            read_options=pacsv.ReadOptions(skip_rows=skip_rows),
+            parse_options=pacsv.ParseOptions(
+                delimiter="\t", invalid_row_handler=short_rows
+            ),
+            convert_options=convert_options,
+        )
+    table = pa.Table.from_batches(
+        table.to_batches() + short_rows.take(), schema=table.schema
+    )
+
+    for name, attribute in attributes.items():
+        dtype = CLINICAL_DATATYPES.get(attribute["datatype"], pa.string())
+        index = table.schema.get_field_index(name)
+        if dtype == pa.string() or index < 0:
+            continue
+        try:
+            values = pc.cast(pc.utf8_trim_whitespace(table[name]), dtype)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            print(
+                f"Study {study_id} has {attribute['datatype']} attribute {name} "
+                "with invalid values, keeping it as string"
+            )
+            attribute["datatype"] = "STRING"
+            continue
+        table = table.set_column(index, name, values)
+
+    if "study_id" in table.schema.names:
+        table = table.drop_columns(["study_id"])
+    table = table.append_column(
+        "study_id", pa.array([study_id] * table.num_rows, pa.string())
+    )
+    table = table.replace_schema_metadata(
+        {CLINICAL_ATTRIBUTES_KEY: json.dumps(attributes).encode()}
+    )
+
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    try:
+        pq.write_table(table, tmp_file)
+        tmp_file.replace(output_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    return table.num_rows
+
+
+def git_blob_id(file_path):
+    """Hash a file the way git hashes blobs, so ids from the git index match."""
+    h = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def git_index_blob_ids(directory, file_names):
+    """Return the blob ids in the git index of the unmodified files in directory.
+
+    Files that are untracked, or whose stat info differs from the index, are
+    left out. Returns an empty dict when directory isn't in a git repository.
+    """
+    try:
+        listed = subprocess.run(
+            ["git", "-C", str(directory), "ls-files", "-s", "-z", "--", *file_names],
+            capture_output=True,
+            check=True,
+        ).stdout
+        modified = subprocess.run(
+            ["git", "-C", str(directory), "diff-files", "--relative", "--name-only"]
+            + ["-z", "--", *file_names],
+            capture_output=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+
+    modified = set(modified.decode().split("\0"))
+    blob_ids = {}
+    for record in listed.decode().split("\0"):
+        if "\t" not in record:
+            continue
+        info, name = record.split("\t", 1)
+        if name not in modified:
+            # "<mode> <blob id> <stage>"
+            blob_ids[name] = info.split()[1]
+    return blob_ids
+
+
+def is_expression_file(file_name):
+    """Check if a file name is that of an expression matrix."""
+    return any(
+        fnmatch.fnmatch(file_name, pattern) for pattern in EXPRESSION_FILE_PATTERNS
+    )
+
+
+def fingerprint_files(directory, file_names, previous=None):
+    """Fingerprint files as {file_name: {"size", "mtime_ns", "hash"}}.
+
+    The hash of a file whose size and mtime match its entry in previous is
+    reused without reading the file. Otherwise large files take their blob id
+    from the git index if they're unmodified there, as after a fresh clone, and
+    anything else is hashed. Missing files are left out.
+    """
+    previous = previous or {}
+    fingerprint = {}
+    to_hash = []
+    for file_name in file_names:
+        try:
+            stat = (directory / file_name).stat()
+        except FileNotFoundError:
+            continue
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": None}
+        old = previous.get(file_name)
+        if old and (old["size"], old["mtime_ns"]) == (entry["size"], entry["mtime_ns"]):
+            entry["hash"] = old["hash"]
+        else:
+            to_hash.append(file_name)
+        fingerprint[file_name] = entry
+
+    large = [
+        name for name in to_hash if fingerprint[name]["size"] >= GIT_INDEX_MIN_SIZE
+    ]
+    blob_ids = git_index_blob_ids(directory, large) if large else {}
+    for file_name in to_hash:
+        fingerprint[file_name]["hash"] = blob_ids.get(file_name) or git_blob_id(
+            directory / file_name
+        )
+    return fingerprint
+
 
 class Study:
     def __init__(self, study_path: Path):
@@ -14,9 +578,11 @@ class Study:
         self.sample_data_file = "data_clinical_sample.txt"
         self.patient_data_file = "data_clinical_patient.txt"
         self.mutation_data_file = "data_mutations.txt"
+        self.cna_data_file = "data_cna.txt"
         self.sample_df = None
         self.patient_df = None
         self.mutation_df = None
+        self.cna_df = None
 
     @classmethod
     def is_study(cls, path):
@@ -54,6 +620,15 @@ class Study:
             file_name = self.patient_data_file
         elif file_type == "mutation":
             file_name = self.mutation_data_file
+        elif file_type == "cna":
+            file_name = self.cna_data_file
+        elif file_type == "expression":
+            file_names = self.expression_files()
+            if not file_names:
+                raise FileNotFoundError(
+                    f"No expression files found in study {self.study_path}."
+                )
+            return [self.study_path / file_name for file_name in file_names]
         else:
             raise ValueError(f"Unknown file type: {file_type}")
 
@@ -65,6 +640,99 @@ class Study:
 
         return [file_path]
 
+    def expression_files(self):
+        """List the names of the expression matrices in the study directory."""
+        try:
+            names = sorted(entry.name for entry in os.scandir(self.study_path))
+        except FileNotFoundError:
+            return []
+        return [name for name in names if is_expression_file(name)]
+
+    def expression_input_files(self):
+        """List the names of the expression matrices in the study directory,
+        and of those the last ingest read, so removed matrices are noticed."""
+        manifest = self.load_input_manifest() or {}
+        return sorted(
+            set(self.expression_files())
+            | {name for name in manifest if is_expression_file(name)}
+        )
+
+    def expression_output_file(self, file_name):
+        """Return the Arrow file an expression matrix is converted to."""
+        profile = file_name.removeprefix("data_").removesuffix(".txt")
+        return self.processed_path / "expression" / f"{profile}.arrow"
+
+    def create_expression(self, file_name):
+        """Convert an expression matrix to a memory-mappable Arrow file."""
+        file_path = self.get_file(file_name)
+        output_file = self.expression_output_file(file_name)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with span("ingest.expression", self.name) as timing:
+                timing.rows = expression_tsv_to_arrow(file_path, output_file)
+                timing.bytes = file_path.stat().st_size
+        except pa.ArrowInvalid as e:
+            print(f"Parse error in study {self.name} for file {file_name}: {e}")
+            return False
+        return True
+
+    def create_expressions(self):
+        """Convert all expression matrices, removing those of deleted files.
+
+        Expression data is optional, so a matrix that fails to convert is left
+        out without failing the study.
+        """
+        expression_path = self.processed_path / "expression"
+        outputs = set()
+        for file_name in self.expression_files():
+            if self.create_expression(file_name):
+                outputs.add(self.expression_output_file(file_name))
+        if expression_path.is_dir():
+            for output_file in expression_path.glob("*.arrow"):
+                if output_file not in outputs:
+                    output_file.unlink()
+
+    def get_expression(self, gene, profile=None):
+        """Get the values of a gene across the samples of the study.
+
+        profile is a glob pattern of the expression profiles to read, e.g.
+        "mrna_seq_*zscores*" (default: all profiles).
+        """
+        from .expression import read_expression
+
+        expression_path = self.processed_path / "expression"
+        file_names = self.expression_input_files()
+        changed = self.changed_input_files(file_names)
+        if changed is None:
+            # no manifest to compare with, compare mtimes instead
+            outputs = {self.expression_output_file(name): name for name in file_names}
+            changed = [
+                name
+                for output_file, name in outputs.items()
+                if not output_file.exists()
+                or (self.study_path / name).stat().st_mtime
+                > output_file.stat().st_mtime
+            ]
+            if expression_path.is_dir():
+                changed += [
+                    output_file.name
+                    for output_file in expression_path.glob("*.arrow")
+                    if output_file not in outputs
+                ]
+        if not expression_path.is_dir() or changed:
+            fingerprint = fingerprint_files(self.study_path, file_names)
+            self.create_expressions()
+            manifest = self.load_input_manifest()
+            if manifest is not None:
+                for file_name in file_names:
+                    manifest.pop(file_name, None)
+                self.save_input_manifest({**manifest, **fingerprint})
+        return read_expression(
+            [(self.name, path) for path in sorted(expression_path.glob("*.arrow"))],
+            gene,
+            profile,
+        )
+
     def get_file(self, file_name):
         """Get a specific file in the study directory."""
         file_path = self.study_path / file_name
@@ -82,6 +750,8 @@ class Study:
             file_name = self.patient_data_file
         elif file_type == "mutation":
             file_name = self.mutation_data_file
+        elif file_type == "cna":
+            file_name = self.cna_data_file
         else:
             raise ValueError(f"Unknown file type: {file_type}")
 
@@ -92,21 +762,23 @@ class Study:
             )
 
         try:
-            # Read the data file into a DataFrame
-            df = pd.read_csv(
-                file_path, sep="\t", comment="#", low_memory=False, dtype=str
-            )
-            # add study_id as a column
-            df["study_id"] = self.name
-
             # Define the output directory and file path
             output_dir = self.processed_path
             output_dir.mkdir(parents=True, exist_ok=True)
             output_file = output_dir / file_name.replace(".txt", ".parquet")
 
-            # Write the DataFrame to a Parquet file
-            df.to_parquet(output_file)
-        except pd.errors.ParserError as e:
+            # Convert the data file into a Parquet file, adding study_id as a
+            # column
+            with span(f"ingest.{file_type}", self.name) as timing:
+                if file_type in ("sample", "patient"):
+                    rows = clinical_tsv_to_parquet(file_path, output_file, self.name)
+                elif file_type == "cna":
+                    rows = cna_tsv_to_parquet(file_path, output_file, self.name)
+                else:
+                    rows = stream_tsv_to_parquet(file_path, output_file, self.name)
+                timing.rows = rows
+                timing.bytes = file_path.stat().st_size
+        except pa.ArrowInvalid as e:
             print(f"Parse error in study {self.name} for file {file_name}: {e}")
             return False
         return True
@@ -122,23 +794,42 @@ class Study:
         elif file_type == "mutation":
             file_name = self.mutation_data_file
             df_attr = "mutation_df"
+        elif file_type == "cna":
+            file_name = self.cna_data_file
+            df_attr = "cna_df"
         else:
             raise ValueError(f"Unknown file type: {file_type}")
 
         file_path = self.study_path / file_name
-        output_dir = Path(settings.PROCESSED_PATH) / self.name
-        output_file = output_dir / file_name.replace(".txt", ".parquet")
+        output_file = self.processed_path / file_name.replace(".txt", ".parquet")
+        if not file_path.exists():
+            # don't serve the data of a deleted file
+            output_file.unlink(missing_ok=True)
+            raise FileNotFoundError(
+                f"File {file_name} not found in study {self.study_path}."
+            )
 
         # Check if the Parquet file needs to be created or updated
-        if (
-            not output_file.exists()
-            or file_path.stat().st_mtime > output_file.stat().st_mtime
-        ):
-            self.create_parquet(file_type)
+        if not output_file.exists():
+            changed = True
+        else:
+            changed = self.changed_input_files([file_name])
+            if changed is None:
+                changed = file_path.stat().st_mtime > output_file.stat().st_mtime
+        if changed:
+            fingerprint = fingerprint_files(self.study_path, [file_name])
+            if self.create_parquet(file_type):
+                manifest = self.load_input_manifest()
+                if manifest is not None:
+                    self.save_input_manifest({**manifest, **fingerprint})
 
         # Load the DataFrame from the Parquet file if not already loaded
         if getattr(self, df_attr) is None:
-            setattr(self, df_attr, pd.read_parquet(output_file))
+            dictionary_columns = get_dictionary_columns(
+                pq.read_schema(output_file).names
+            )
+            table = pq.read_table(output_file, read_dictionary=dictionary_columns)
+            setattr(self, df_attr, to_pandas(table))
 
         return getattr(self, df_attr)
 
@@ -154,35 +845,121 @@ class Study:
         """Get the DataFrame for the mutation data."""
         return self.get_parquet("mutation")
 
+    def get_cna_df(self):
+        """Get the DataFrame for the non-zero copy-number calls."""
+        return self.get_parquet("cna")
+
     def create_parquets(self):
         """Create Parquet files for sample, patient, and mutation data in the PROCESSED_PATH folder."""
+        # fingerprint the inputs before converting them, so a file that changes
+        # during the conversion is converted again by the next ingest
+        fingerprint = fingerprint_files(
+            self.study_path, self.input_files(), self.load_input_manifest()
+        )
+        # a failed ingest doesn't leave the outputs of the last one marked as
+        # a success
+        success_file = self.processed_path / "ingestion_success.txt"
+        success_file.unlink(missing_ok=True)
         success = True
         success &= self.create_parquet("sample")
         success &= self.create_parquet("patient")
         success &= self.create_parquet("mutation")
 
+        # copy-number data is optional, a study without it or with an invalid
+        # file is still ingested
+        cna_output = self.processed_path / self.cna_data_file.replace(
+            ".txt", ".parquet"
+        )
+        if (self.study_path / self.cna_data_file).exists():
+            if not self.create_parquet("cna"):
+                cna_output.unlink(missing_ok=True)
+        else:
+            cna_output.unlink(missing_ok=True)
+
+        self.create_expressions()
+
         if success:
+            self.save_input_manifest(fingerprint)
             # Create a success indicator file
-            success_file = self.processed_path / "ingestion_success.txt"
             success_file.touch()
         return success
 
+    def input_files(self):
+        """List the names of the files in the study directory ingest reads."""
+        return [
+            self.sample_data_file,
+            self.patient_data_file,
+            self.mutation_data_file,
+            self.cna_data_file,
+            *self.expression_input_files(),
+            "meta_study.txt",
+        ]
+
+    def load_input_manifest(self):
+        """Load the fingerprint of the input files at the last ingest, if any."""
+        try:
+            with open(self.processed_path / INPUT_MANIFEST_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_input_manifest(self, manifest):
+        manifest_file = self.processed_path / INPUT_MANIFEST_FILE
+        tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        tmp_file.replace(manifest_file)
+
+    def changed_input_files(self, file_names):
+        """Return the input files whose content changed since the last ingest.
+
+        Files the last ingest read that were deleted since count as changed,
+        files that don't exist and weren't read are ignored. When only the
+        mtimes changed, e.g. after a fresh git clone, the manifest is updated
+        so the next check doesn't have to hash again. Returns None if there's
+        no manifest to compare with.
+        """
+        manifest = self.load_input_manifest()
+        if manifest is None:
+            return None
+        current = fingerprint_files(self.study_path, file_names, manifest)
+        changed = [
+            file_name
+            for file_name in file_names
+            if manifest.get(file_name, {}).get("hash")
+            != current.get(file_name, {}).get("hash")
+        ]
+        unchanged = {
+            name: entry for name, entry in current.items() if name not in changed
+        }
+        if any(manifest.get(name) != entry for name, entry in unchanged.items()):
+            self.save_input_manifest({**manifest, **unchanged})
+        return changed
+
+    def ingestion_succeeded(self):
+        """Check if the last ingest of the study succeeded.
+
+        Unlike is_processed this doesn't compare with the input files, so it
+        works on the processed study directories combine reads, which don't
+        have them.
+        """
+        return (self.processed_path / "ingestion_success.txt").exists()
+
     def is_processed(self):
         """Check if the study has already been processed."""
         success_file = self.processed_path / "ingestion_success.txt"
-        if not success_file.exists():
+        if not self.ingestion_succeeded():
             return False
 
-        # Check if any source file is newer than the success indicator file
-        source_files = [
-            self.study_path / self.sample_data_file,
-            self.study_path / self.patient_data_file,
-            self.study_path / self.mutation_data_file,
-            self.study_path / "meta_study.txt",
-        ]
+        # Check if the content of any source file changed since the ingest
+        changed = self.changed_input_files(self.input_files())
+        if changed is not None:
+            return not changed
 
+        # Processed before input manifests existed, compare mtimes instead
         success_file_mtime = success_file.stat().st_mtime
-        for source_file in source_files:
+        for file_name in self.input_files():
+            source_file = self.study_path / file_name
             if (
                 source_file.exists()
                 and source_file.stat().st_mtime > success_file_mtime
@@ -202,3 +979,7 @@ class Study:
     def create_mutation_parquet(self):
         """Create a Parquet file for the mutation data."""
         self.create_parquet("mutation")
+
+    def create_cna_parquet(self):
+        """Create a Parquet file for the copy-number data."""
+        self.create_parquet("cna")
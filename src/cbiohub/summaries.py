@@ -0,0 +1,345 @@
+import shutil
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dynaconf import settings
+
+from .analyze import get_connection, get_views, quote_identifier, quote_path
+from .metrics import span
+from .query_cache import get_query_cache
+from .variant_index import INDEX_KEYS
+
+# Per-study partial summaries, summed into the summary tables at the end of a
+# combine. Sample and patient ids are unique within a study, so the distinct
+# counts of different studies add up.
+PARTIALS_DIR = "summary_partials"
+
+# Columns identifying a row of each level of the mutation summaries
+SUMMARY_LEVELS = {
+    "gene": ["Hugo_Symbol"],
+    "protein_change": INDEX_KEYS["protein_change"],
+    "variant": INDEX_KEYS["coordinates"],
+}
+
+# Clinical sample attributes the summaries are grouped by, unless configured
+# with SUMMARY_ATTRIBUTES
+SUMMARY_ATTRIBUTES = [
+    "CANCER_TYPE",
+    "CANCER_TYPE_DETAILED",
+    "ONCOTREE_CODE",
+    "SAMPLE_TYPE",
+]
+
+COUNT_COLUMNS = ["num_samples", "num_patients", "num_studies"]
+
+# All summary tables and their key columns. summary_samples and
+# summary_samples_by_attribute count all samples, the denominators of the
+# mutation frequencies.
+SUMMARY_TABLES = {
+    "summary_samples": [],
+    "summary_samples_by_attribute": ["attribute", "attribute_value"],
+    **{f"summary_{level}": keys for level, keys in SUMMARY_LEVELS.items()},
+    **{
+        f"summary_{level}_by_attribute": ["attribute", "attribute_value", *keys]
+        for level, keys in SUMMARY_LEVELS.items()
+    },
+}
+
+
+def get_summary_attributes():
+    """Return the clinical sample attributes the summaries are grouped by."""
+    return list(settings.get("SUMMARY_ATTRIBUTES", SUMMARY_ATTRIBUTES))
+
+
+def count_distinct(table, keys, sample_column):
+    """Count the distinct samples and patients per keys in one study's table."""
+    aggregations = [(sample_column, "count_distinct"), ("PATIENT_ID", "count_distinct")]
+    counts = table.group_by(keys, use_threads=False).aggregate(aggregations)
+    counts = counts.rename_columns(
+        [
+            (
+                "num_samples"
+                if name == f"{sample_column}_count_distinct"
+                else "num_patients" if name == "PATIENT_ID_count_distinct" else name
+            )
+            for name in counts.schema.names
+        ]
+    )
+    num_studies = pa.array([1] * counts.num_rows, pa.int64())
+    return counts.select(keys + COUNT_COLUMNS[:2]).append_column(
+        "num_studies", num_studies
+    )
+
+
+def by_attribute(table, keys, sample_column, attributes):
+    """Count per keys and value of each clinical attribute, in long format."""
+    tables = []
+    for attribute in attributes:
+        if attribute not in table.schema.names:
+            continue
+        values = pc.cast(table[attribute], pa.string())
+        grouped = table.select([sample_column, "PATIENT_ID", *keys]).append_column(
+            "attribute_value", values
+        )
+        counts = count_distinct(grouped, ["attribute_value", *keys], sample_column)
+        tables.append(
+            counts.add_column(
+                0, "attribute", pa.array([attribute] * counts.num_rows, pa.string())
+            )
+        )
+    return tables
+
+
+def study_summaries(mutations, samples, attributes):
+    """Compute the partial summary tables of a single study.
+
+    mutations is the study's (cast) mutation table and samples its clinical
+    sample table, either may be None. Returns a dict of summary name to table.
+    """
+    summaries = {}
+    if samples is not None and "SAMPLE_ID" in samples.schema.names:
+        samples = samples.select(
+            [
+                name
+                for name in ["SAMPLE_ID", "PATIENT_ID", *attributes]
+                if name in samples.schema.names
+            ]
+        )
+        if "PATIENT_ID" not in samples.schema.names:
+            samples = samples.append_column(
+                "PATIENT_ID", pa.nulls(samples.num_rows, pa.string())
+            )
+        summaries["summary_samples"] = [count_distinct(samples, [], "SAMPLE_ID")]
+        summaries["summary_samples_by_attribute"] = by_attribute(
+            samples, [], "SAMPLE_ID", attributes
+        )
+    else:
+        samples = None
+
+    if mutations is not None and "Tumor_Sample_Barcode" in mutations.schema.names:
+        levels = {
+            level: keys
+            for level, keys in SUMMARY_LEVELS.items()
+            if all(key in mutations.schema.names for key in keys)
+        }
+        columns = {"Tumor_Sample_Barcode"}.union(*levels.values())
+        mutations = mutations.select(
+            [name for name in mutations.schema.names if name in columns]
+        )
+        if samples is not None:
+            mutations = mutations.join(
+                samples,
+                keys="Tumor_Sample_Barcode",
+                right_keys="SAMPLE_ID",
+                join_type="left outer",
+                use_threads=False,
+            )
+        else:
+            mutations = mutations.append_column(
+                "PATIENT_ID", pa.nulls(mutations.num_rows, pa.string())
+            )
+        for level, keys in levels.items():
+            summaries[f"summary_{level}"] = [
+                count_distinct(mutations, keys, "Tumor_Sample_Barcode")
+            ]
+            summaries[f"summary_{level}_by_attribute"] = by_attribute(
+                mutations, keys, "Tumor_Sample_Barcode", attributes
+            )
+
+    return {
+        name: pa.concat_tables(tables)
+        for name, tables in summaries.items()
+        if tables and sum(table.num_rows for table in tables)
+    }
+
+
+def write_study_summaries(study_name, mutations, samples, combined_path):
+    """Write the partial summaries of a study, returning their relative paths."""
+    files = []
+    for name, table in study_summaries(
+        mutations, samples, get_summary_attributes()
+    ).items():
+        relative_path = f"{PARTIALS_DIR}/{name}/{study_name}.parquet"
+        partial = combined_path / relative_path
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, partial)
+        files.append(relative_path)
+    return files
+
+
+def finalize_summaries(combined_path):
+    """Sum the partial summaries of all studies into the summary tables.
+
+    DuckDB aggregates the partials out of core, so memory stays bounded even
+    for the variant level. Summary tables without partials are removed.
+    Returns the number of rows of each summary table written.
+    """
+    partials_path = combined_path / PARTIALS_DIR
+    rows = {}
+    con = duckdb.connect()
+    try:
+        for name, keys in SUMMARY_TABLES.items():
+            output_file = combined_path / f"{name}.parquet"
+            partials = sorted((partials_path / name).glob("*.parquet"))
+            if not partials:
+                output_file.unlink(missing_ok=True)
+                continue
+            files = ", ".join(f"'{quote_path(path)}'" for path in partials)
+            key_columns = "".join(f"{quote_identifier(key)}, " for key in keys)
+            group_by = (
+                f"GROUP BY {', '.join(quote_identifier(key) for key in keys)}"
+                if keys
+                else ""
+            )
+            # most common first within each attribute value, so the top rows
+            # of a group are at the start of its range
+            order_by = [key for key in keys if key in ("attribute", "attribute_value")]
+            tmp_file = combined_path / f"{name}.parquet.tmp"
+            con.execute(
+                f"""
+                COPY (
+                    SELECT {key_columns}
+                        SUM(num_samples)::BIGINT AS num_samples,
+                        SUM(num_patients)::BIGINT AS num_patients,
+                        SUM(num_studies)::BIGINT AS num_studies
+                    FROM read_parquet([{files}], union_by_name = true)
+                    {group_by}
+                    ORDER BY {"".join(f"{key}, " for key in order_by)}num_samples DESC
+                ) TO '{quote_path(tmp_file)}' (FORMAT PARQUET)
+                """
+            )
+            tmp_file.replace(output_file)
+            rows[name] = pq.read_metadata(output_file).num_rows
+    finally:
+        con.close()
+    return rows
+
+
+def remove_summaries(combined_path):
+    """Remove the summary tables and partial summaries of a combined folder."""
+    shutil.rmtree(combined_path / PARTIALS_DIR, ignore_errors=True)
+    for name in SUMMARY_TABLES:
+        (combined_path / f"{name}.parquet").unlink(missing_ok=True)
+
+
+def mutation_summary(
+    level="gene",
+    clinical_attribute=None,
+    attribute_value=None,
+    gene=None,
+    limit=20,
+    directory=None,
+):
+    """Return the most frequently mutated genes, protein changes or variants.
+
+    Answered from the summary tables combine writes, without scanning the
+    mutations. With a clinical_attribute the top limit rows of every value of
+    the attribute (e.g. per cancer type) are returned, or only those of
+    attribute_value. Each row has the attribute value (if grouped), the level's
+    key columns, num_samples, num_patients, num_studies and the frequency among
+    all samples of the group.
+    """
+    if level not in SUMMARY_LEVELS:
+        raise ValueError(
+            f"Unknown level: {level}, choose from {', '.join(SUMMARY_LEVELS)}"
+        )
+    if gene is not None and "Hugo_Symbol" not in SUMMARY_LEVELS[level]:
+        raise ValueError(f"Can't filter the {level} summary by gene")
+    if attribute_value is not None and clinical_attribute is None:
+        raise ValueError("An attribute value needs a clinical attribute")
+    if directory is None:
+        directory = Path(settings.PROCESSED_PATH) / "combined"
+    else:
+        directory = Path(directory)
+
+    args = [level, clinical_attribute, attribute_value, gene, limit]
+    return get_query_cache().get_or_compute(
+        "mutation_summary",
+        directory,
+        args,
+        lambda: _mutation_summary(directory, *args),
+    )
+
+
+def _mutation_summary(
+    directory, level, clinical_attribute, attribute_value, gene, limit
+):
+    keys = ", ".join(f"s.{quote_identifier(key)}" for key in SUMMARY_LEVELS[level])
+    counts = "s.num_samples, s.num_patients, s.num_studies"
+    conditions = []
+    params = []
+    if clinical_attribute is None:
+        table = f"summary_{level}"
+        select = f"{keys}, {counts}, s.num_samples / t.num_samples AS frequency"
+        join = "CROSS JOIN summary_samples t"
+        top = ""
+    else:
+        table = f"summary_{level}_by_attribute"
+        select = (
+            f"s.attribute_value, {keys}, {counts}, "
+            "s.num_samples / t.num_samples AS frequency"
+        )
+        join = (
+            "LEFT JOIN summary_samples_by_attribute t "
+            "ON t.attribute = s.attribute "
+            "AND t.attribute_value IS NOT DISTINCT FROM s.attribute_value"
+        )
+        conditions.append("s.attribute = ?")
+        params.append(clinical_attribute)
+        if attribute_value is not None:
+            conditions.append("s.attribute_value = ?")
+            params.append(attribute_value)
+        top = (
+            "QUALIFY row_number() OVER "
+            "(PARTITION BY s.attribute_value ORDER BY s.num_samples DESC) <= ?"
+            if limit
+            else ""
+        )
+    if gene is not None:
+        conditions.append("s.Hugo_Symbol = ?")
+        params.append(gene)
+
+    con = get_connection(directory)
+    try:
+        views = get_views(con)
+        if table not in views:
+            raise ValueError(
+                f"No {table} table in {directory}, run `cbiohub combine` first"
+            )
+        if clinical_attribute is not None:
+            attributes = [
+                row[0]
+                for row in con.execute(
+                    "SELECT DISTINCT attribute FROM summary_samples_by_attribute"
+                ).fetchall()
+            ]
+            if clinical_attribute not in attributes:
+                raise ValueError(
+                    f"{clinical_attribute} is not summarized, choose from "
+                    f"{', '.join(sorted(attributes))} or add it to SUMMARY_ATTRIBUTES"
+                )
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order_by = "s.attribute_value, " if clinical_attribute else ""
+        if top:
+            params.append(limit)
+        query = f"""
+        SELECT {select}
+        FROM {table} s
+        {join}
+        {where}
+        {top}
+        ORDER BY {order_by}s.num_samples DESC
+        """
+        if limit and not top:
+            query += " LIMIT ?"
+            params.append(limit)
+        with span("query.mutation_summary") as timing:
+            result = con.execute(query, params).fetchall()
+            timing.rows = len(result)
+    finally:
+        con.close()
+    return result
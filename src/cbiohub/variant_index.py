@@ -0,0 +1,344 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+INDEX_DIR = "variant_index"
+
+# Columns hashed into the key of each index
+INDEX_KEYS = {
+    "coordinates": [
+        "Chromosome",
+        "Start_Position",
+        "End_Position",
+        "Reference_Allele",
+        "Tumor_Seq_Allele2",
+    ],
+    "protein_change": ["Hugo_Symbol", "HGVSp_Short"],
+}
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("key_hash", pa.uint64()),
+        ("file", pa.uint32()),
+        ("row_group", pa.uint32()),
+        ("row", pa.uint32()),
+    ]
+)
+
+# Per-fragment hashes of the mutation keys, reused by later combines as long
+# as their fragment is unchanged
+SEGMENTS_DIR = "segments"
+
+# Loaded indexes, keyed by index file, see load_variant_index
+_indexes = {}
+
+# 64 bit FNV-1a
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def hash_strings(array):
+    """Hash every string of an Arrow array with FNV-1a, as a numpy uint64 array.
+
+    The bytes at the same position of all strings are hashed at once, dropping
+    strings as they end, so the work is linear in the total number of bytes.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    array = pc.cast(array, pa.large_string())
+    _, offsets, data = array.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int64)[
+        array.offset : array.offset + len(array) + 1
+    ]
+    data = np.frombuffer(data, dtype=np.uint8) if data is not None else None
+    hashes = np.full(len(array), FNV_OFFSET, dtype=np.uint64)
+    positions = offsets[:-1].copy()
+    ends = offsets[1:]
+    active = np.nonzero(positions < ends)[0]
+    while active.size:
+        hashes[active] = (hashes[active] ^ data[positions[active]]) * FNV_PRIME
+        positions[active] += 1
+        active = active[positions[active] < ends[active]]
+    return hashes
+
+
+def hash_keys(columns):
+    """Hash the rows of the key columns, returning the hashes and a mask of the
+    rows without null values."""
+    strings = [pc.cast(column, pa.string()) for column in columns]
+    joined = pc.binary_join_element_wise(*strings, "\x1f")
+    return hash_strings(joined), pc.is_valid(joined).to_numpy(zero_copy_only=False)
+
+
+def hash_key(values):
+    """Hash the values of a variant key to an unsigned 64 bit integer."""
+    hashes, _ = hash_keys(
+        [pa.array([None if value is None else str(value)]) for value in values]
+    )
+    return int(hashes[0])
+
+
+def mutation_files(directory):
+    """List the Parquet files of the combined mutations, relative to directory."""
+    dataset_path = directory / "combined_mutations"
+    if dataset_path.is_dir():
+        return sorted(
+            str(path.relative_to(directory)) for path in dataset_path.rglob("*.parquet")
+        )
+    if (directory / "combined_mutations.parquet").exists():
+        return ["combined_mutations.parquet"]
+    return []
+
+
+def mutations_mtime(directory):
+    """Return the mtime of the file written last by a combine of the mutations."""
+    dataset_path = directory / "combined_mutations"
+    if dataset_path.is_dir():
+        return (dataset_path / "_common_metadata").stat().st_mtime_ns
+    return (directory / "combined_mutations.parquet").stat().st_mtime_ns
+
+
+def partition_values(relative_path):
+    """Return the Hive partition values encoded in a fragment's path."""
+    return dict(
+        part.split("=", 1) for part in Path(relative_path).parent.parts if "=" in part
+    )
+
+
+def key_columns(table, keys, partition):
+    """Return the key columns of a row group as Arrow arrays."""
+    columns = []
+    for key in keys:
+        if key in partition:
+            columns.append(pa.repeat(pa.scalar(partition[key]), table.num_rows))
+        elif key in table.schema.names:
+            columns.append(table[key])
+        else:
+            columns.append(pa.nulls(table.num_rows, pa.string()))
+    return columns
+
+
+def segment_schema(size, mtime_ns):
+    """Return the schema of the hashed keys of a fragment of the given size and
+    mtime."""
+    return pa.schema(
+        [("row_group", pa.uint32()), ("row", pa.uint32())]
+        + [(kind, pa.uint64()) for kind in INDEX_KEYS],
+        metadata={b"size": str(size).encode(), b"mtime_ns": str(mtime_ns).encode()},
+    )
+
+
+def write_segment(directory, relative_path, segment_file, schema):
+    """Hash the keys of every mutation of a fragment into a segment file.
+
+    Keys with a null value are stored as null. Row groups are hashed and
+    written one at a time, so memory stays bounded by a row group.
+    """
+    parquet_file = pq.ParquetFile(directory / relative_path)
+    partition = partition_values(relative_path)
+    columns = [
+        col
+        for keys in INDEX_KEYS.values()
+        for col in keys
+        if col in parquet_file.schema_arrow.names
+    ]
+    segment_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = segment_file.with_name(segment_file.name + ".tmp")
+    with pa.OSFile(str(tmp_file), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for row_group in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(
+                    row_group, columns=list(dict.fromkeys(columns))
+                )
+                num_rows = table.num_rows
+                arrays = [
+                    pa.array(np.full(num_rows, row_group, dtype=np.uint32)),
+                    pa.array(np.arange(num_rows, dtype=np.uint32)),
+                ]
+                for keys in INDEX_KEYS.values():
+                    hashes, valid = hash_keys(key_columns(table, keys, partition))
+                    arrays.append(pa.array(hashes, mask=~valid))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    tmp_file.replace(segment_file)
+
+
+def update_segments(directory, files):
+    """Hash the fragments that changed since the last combine.
+
+    Returns the path and [relative_path, size, mtime_ns] of every fragment's
+    segment. Segments of fragments that no longer exist are removed.
+    """
+    segments_path = directory / INDEX_DIR / SEGMENTS_DIR
+    segments = []
+    for relative_path in files:
+        stat = (directory / relative_path).stat()
+        segment_file = segments_path / f"{relative_path}.arrow"
+        schema = segment_schema(stat.st_size, stat.st_mtime_ns)
+        try:
+            current = pa.ipc.open_file(pa.memory_map(str(segment_file))).schema
+        except (FileNotFoundError, pa.ArrowInvalid):
+            current = None
+        if current is None or current.metadata != schema.metadata:
+            write_segment(directory, relative_path, segment_file, schema)
+        segments.append((segment_file, [relative_path, stat.st_size, stat.st_mtime_ns]))
+
+    keep = {segment_file for segment_file, _ in segments}
+    for segment_file in list(segments_path.rglob("*.arrow")):
+        if segment_file not in keep:
+            segment_file.unlink()
+            if not any(segment_file.parent.iterdir()):
+                segment_file.parent.rmdir()
+    return segments
+
+
+def build_variant_index(directory):
+    """Build the variant key indexes for the combined mutations in directory.
+
+    For each kind of key in INDEX_KEYS an Arrow IPC file is written with the
+    hashed key of every mutation and its file, row group and row, sorted by
+    hash. The files can be memory-mapped so lookups don't need to load them.
+    Only fragments that changed since the last combine are hashed again, the
+    others reuse their segment.
+    """
+    directory = Path(directory)
+    index_path = directory / INDEX_DIR
+    files = mutation_files(directory)
+    if not files:
+        if index_path.exists():
+            shutil.rmtree(index_path)
+        return None
+
+    segments = update_segments(directory, files)
+    file_stats = [stats for _, stats in segments]
+    index_files = [index_path / f"{kind}.arrow" for kind in INDEX_KEYS]
+    try:
+        unchanged = all(
+            json.loads(
+                pa.ipc.open_file(pa.memory_map(str(index_file))).schema.metadata[
+                    b"files"
+                ]
+            )
+            == file_stats
+            for index_file in index_files
+        )
+    except (FileNotFoundError, pa.ArrowInvalid, KeyError):
+        unchanged = False
+    if unchanged:
+        # mark the index as up to date with the rewritten dataset metadata
+        for index_file in index_files:
+            os.utime(index_file)
+        return index_path
+
+    metadata = {b"files": json.dumps(file_stats).encode()}
+    for kind, index_file in zip(INDEX_KEYS, index_files):
+        hashes, file_ids, row_groups, rows = [], [], [], []
+        for file_id, (segment_file, _) in enumerate(segments):
+            segment = pa.ipc.open_file(pa.memory_map(str(segment_file))).read_all()
+            valid = segment.filter(pc.is_valid(segment[kind]))
+            hashes.append(valid[kind].to_numpy())
+            file_ids.append(np.full(valid.num_rows, file_id, dtype=np.uint32))
+            row_groups.append(valid["row_group"].to_numpy())
+            rows.append(valid["row"].to_numpy())
+        hashes = np.concatenate(hashes)
+        order = np.argsort(hashes, kind="stable")
+        table = pa.Table.from_arrays(
+            [
+                pa.array(hashes[order]),
+                pa.array(np.concatenate(file_ids)[order]),
+                pa.array(np.concatenate(row_groups)[order]),
+                pa.array(np.concatenate(rows)[order]),
+            ],
+            schema=INDEX_SCHEMA.with_metadata(metadata),
+        )
+        tmp_file = index_path / f"{kind}.arrow.tmp"
+        with pa.OSFile(str(tmp_file), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        tmp_file.replace(index_file)
+    return index_path
+
+
+def load_variant_index(directory, kind):
+    """Memory-map a variant index, returning None if it's missing or out of date."""
+    index_file = directory / INDEX_DIR / f"{kind}.arrow"
+    try:
+        index_mtime = index_file.stat().st_mtime_ns
+        if index_mtime < mutations_mtime(directory):
+            return None
+    except FileNotFoundError:
+        return None
+
+    cached = _indexes.get(index_file)
+    if cached is None or cached[0] != index_mtime:
+        table = pa.ipc.open_file(pa.memory_map(str(index_file))).read_all()
+        hashes = table["key_hash"].combine_chunks().to_numpy()
+        files = json.loads(table.schema.metadata[b"files"])
+        cached = (index_mtime, hashes, table, files)
+        _indexes[index_file] = cached
+    return cached[1:]
+
+
+def lookup_variant_index(directory, kind, values):
+    """Find the locations of the mutations matching a variant key.
+
+    Returns a list of (relative_path, row_group, rows) tuples, or None when no
+    valid index is available and the caller has to scan instead. As keys are
+    hashed the rows can contain false positives, so callers should still
+    filter them.
+    """
+    index = load_variant_index(directory, kind)
+    if index is None:
+        return None
+    hashes, table, files = index
+
+    key_hash = np.uint64(hash_key(values))
+    start = int(np.searchsorted(hashes, key_hash, side="left"))
+    end = int(np.searchsorted(hashes, key_hash, side="right"))
+    matches = table.slice(start, end - start).to_pydict()
+
+    locations = {}
+    for file_id, row_group, row in zip(
+        matches["file"], matches["row_group"], matches["row"]
+    ):
+        locations.setdefault((file_id, row_group), []).append(row)
+
+    result = []
+    for (file_id, row_group), rows in sorted(locations.items()):
+        relative_path, size, mtime = files[file_id]
+        try:
+            stat = (directory / relative_path).stat()
+        except FileNotFoundError:
+            return None
+        if stat.st_size != size or stat.st_mtime_ns != mtime:
+            return None
+        result.append((relative_path, row_group, rows))
+    return result
+
+
+def read_indexed_rows(directory, locations, columns):
+    """Read the rows at the given index locations into a single table."""
+    tables = []
+    for relative_path, row_group, rows in locations:
+        parquet_file = pq.ParquetFile(directory / relative_path)
+        partition = partition_values(relative_path)
+        file_columns = [
+            col for col in columns if col in parquet_file.schema_arrow.names
+        ]
+        table = parquet_file.read_row_group(row_group, columns=file_columns).take(rows)
+        for col in columns:
+            if col in partition:
+                table = table.append_column(
+                    col, pa.array([partition[col]] * table.num_rows, pa.string())
+                )
+            elif col not in table.schema.names:
+                table = table.append_column(col, pa.nulls(table.num_rows))
+        tables.append(table.select(columns))
+    if not tables:
+        return None
+    return pa.concat_tables(tables, promote_options="default")
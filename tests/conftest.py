@@ -0,0 +1,34 @@
+import pytest
+from dynaconf import settings
+
+from benchmarks.synthetic import SCALES, generate_datahub
+
+
+@pytest.fixture(scope="session", params=["files", "fragments"])
+def combined(request, tmp_path_factory):
+    """Ingest and combine a tiny synthetic datahub, in both combined layouts.
+
+    Returns the combined directory.
+    """
+    from cbiohub.data_commands import data
+
+    work_path = tmp_path_factory.mktemp(request.param)
+    datahub_path = work_path / "datahub"
+    processed_path = work_path / "processed"
+    generate_datahub(datahub_path, seed=0, **SCALES["tiny"])
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "PROCESSED_PATH", str(processed_path), False)
+        data.main(["ingest", str(datahub_path)], standalone_mode=False)
+        combine_args = ["--partition"] if request.param == "fragments" else []
+        data.main(["combine", *combine_args], standalone_mode=False)
+        yield processed_path / "combined"
+
+
+@pytest.fixture(params=["index", "scan"])
+def use_index(request, monkeypatch):
+    """Run a query test with the variant index, and with scans only."""
+    from cbiohub import analyze
+
+    if request.param == "scan":
+        monkeypatch.setattr(analyze, "lookup_variant_index", lambda *args: None)
+    return request.param == "index"
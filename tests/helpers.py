@@ -0,0 +1,61 @@
+import duckdb
+
+
+def read_table(directory, name):
+    """Return the SQL source of a combined table, in either layout."""
+    path = directory / name
+    if path.is_dir():
+        return f"read_parquet('{path}/**/*.parquet', hive_partitioning = true)"
+    return f"read_parquet('{path}.parquet')"
+
+
+def query(directory, sql):
+    """Run sql against DuckDB scans of the combined tables in directory."""
+    con = duckdb.connect()
+    try:
+        con.execute(
+            f"CREATE VIEW mutations AS "
+            f"SELECT * FROM {read_table(directory, 'combined_mutations')}"
+        )
+        con.execute(
+            f"CREATE VIEW clinical_sample AS "
+            f"SELECT * FROM {read_table(directory, 'combined_clinical_sample')}"
+        )
+        return con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+
+def expected_samples(directory, where, cohort_where=None):
+    """The study_id:sample ids of the mutations matching where, by a scan."""
+    cohort_join = ""
+    if cohort_where is not None:
+        cohort_join = f"""
+        SEMI JOIN (SELECT * FROM clinical_sample WHERE {cohort_where}) AS c
+        ON c.study_id = m.study_id AND c.SAMPLE_ID = m.Tumor_Sample_Barcode
+        """
+    rows = query(
+        directory,
+        f"SELECT m.study_id || ':' || m.Tumor_Sample_Barcode "
+        f"FROM mutations AS m {cohort_join} WHERE {where}",
+    )
+    return sorted(row[0] for row in rows)
+
+
+def study_samples(study_path):
+    """The sample ids in the clinical sample file of a study."""
+    lines = (study_path / "data_clinical_sample.txt").read_text().splitlines()
+    rows = [line.split("\t") for line in lines if not line.startswith("#")]
+    index = rows[0].index("SAMPLE_ID")
+    return [row[index] for row in rows[1:]]
+
+
+def write_matrix(path, samples, rows):
+    """Write a gene x sample matrix, rows are (Hugo_Symbol, Entrez_Gene_Id,
+    values) with a value for every sample."""
+    lines = ["\t".join(["Hugo_Symbol", "Entrez_Gene_Id", *samples])]
+    lines += [
+        "\t".join([symbol, entrez, *map(str, values)])
+        for symbol, entrez, values in rows
+    ]
+    path.write_text("\n".join(lines) + "\n")
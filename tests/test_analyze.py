@@ -0,0 +1,85 @@
+import pyarrow as pa
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.synthetic import HOTSPOTS
+from cbiohub.analyze import (
+    cast_mutation_table,
+    find_variant,
+    find_variants,
+    normalize_chromosome,
+    normalize_query_variant,
+    read_query_variants,
+)
+from cbiohub.cli import cli
+
+
+def test_chr_prefix_is_stripped_on_both_sides():
+    table = pa.table(
+        {
+            "Chromosome": ["chr1", "CHR2", "3", "X", None],
+            "Start_Position": ["1", "2", "3", "4", "5"],
+        }
+    )
+    typed, quarantined = cast_mutation_table(table)
+    assert typed["Chromosome"].to_pylist() == ["1", "2", "3", "X", None]
+    assert quarantined.num_rows == 0
+
+    assert normalize_chromosome("chr17") == "17"
+    assert normalize_chromosome("Chr17") == "17"
+    assert normalize_chromosome(17) == "17"
+    row = normalize_query_variant(
+        0,
+        {
+            "Chromosome": "chr17",
+            "Start_Position": "7577120",
+            "End_Position": "7577120",
+            "Reference_Allele": "C",
+            "Tumor_Seq_Allele2": "T",
+        },
+    )
+    assert row["Chromosome"] == "17"
+
+
+def test_find_batch(combined, tmp_path):
+    variants_file = tmp_path / "variants.tsv"
+    rows = [
+        (f"chr{chrom}", str(start), str(start), ref, alt)
+        for _, chrom, start, ref, alt, _ in HOTSPOTS
+    ]
+    rows.append(("1", "1", "1", "A", "T"))
+    variants_file.write_text(
+        "chrom\tstart\tend\tref\talt\n" + "".join("\t".join(r) + "\n" for r in rows)
+    )
+
+    output_file = tmp_path / "found.tsv"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "find-batch",
+            str(variants_file),
+            "--output",
+            str(output_file),
+            "--processed-dir",
+            str(combined),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    lines = output_file.read_text().splitlines()
+    assert len(lines) == len(rows) + 1
+    for (chrom, start, end, ref, alt), line in zip(rows, lines[1:]):
+        _, samples = find_variant(
+            chrom=chrom, start=start, end=end, ref=ref, alt=alt, directory=combined
+        )
+        values = line.split("\t")
+        assert int(values[-3]) == len(samples)
+        assert sorted(filter(None, values[-1].split(","))) == sorted(samples)
+
+
+def test_find_batch_with_an_invalid_cohort(combined, tmp_path):
+    variants_file = tmp_path / "variants.tsv"
+    variants_file.write_text("chrom\tstart\tend\tref\talt\n17\t1\t1\tA\tT\n")
+    variants = read_query_variants(variants_file)
+    # the cohort is checked before the results are iterated
+    with pytest.raises(ValueError, match="not indexed"):
+        find_variants(variants, combined, cohort="NOT_AN_ATTRIBUTE=1")
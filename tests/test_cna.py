@@ -0,0 +1,135 @@
+import duckdb
+import pyarrow.parquet as pq
+import pytest
+from click.testing import CliRunner
+from dynaconf import settings
+
+from benchmarks.synthetic import generate_datahub
+from cbiohub.analyze import cna_frequency_per_cancer_type
+from cbiohub.cli import cli
+from cbiohub.data_commands import data
+from cbiohub.study import cna_tsv_to_parquet
+from helpers import read_table, study_samples, write_matrix
+
+
+def test_only_non_zero_calls_are_stored(tmp_path):
+    path = tmp_path / "data_cna.txt"
+    write_matrix(
+        path,
+        ["S1", "S2", "S3"],
+        [("KRAS", "3845", [0, 2, "NA"]), ("BRAF", "673", [-2, 0, 1])]
+        + [(f"G{i}", str(i), [0, 0, 0]) for i in range(100)],
+    )
+    rows = cna_tsv_to_parquet(path, tmp_path / "out.parquet", "study", block_size=64)
+    assert rows == 3
+    table = pq.read_table(tmp_path / "out.parquet")
+    assert sorted(zip(*table.to_pydict().values())) == [
+        ("BRAF", "673", "S1", -2.0, "study"),
+        ("BRAF", "673", "S3", 1.0, "study"),
+        ("KRAS", "3845", "S2", 2.0, "study"),
+    ]
+
+
+@pytest.fixture(scope="module", params=["files", "fragments"])
+def cna_combined(request, tmp_path_factory):
+    """A combined hub of two studies with copy-number calls for two genes."""
+    work_path = tmp_path_factory.mktemp(f"cna_{request.param}")
+    for i, study_path in enumerate(
+        generate_datahub(
+            work_path / "hub", studies=2, samples=30, mutations_per_sample=1
+        )
+    ):
+        samples = study_samples(study_path)
+        write_matrix(
+            study_path / "data_cna.txt",
+            samples,
+            [
+                ("ERBB2", "2064", [(j + i) % 5 - 2 for j in range(len(samples))]),
+                ("CDKN2A", "1029", [-2 if j % 3 else 0 for j in range(len(samples))]),
+            ],
+        )
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "PROCESSED_PATH", str(work_path / "processed"))
+        data.main(["ingest", str(work_path / "hub")], standalone_mode=False)
+        combine_args = ["--partition"] if request.param == "fragments" else []
+        data.main(["combine", *combine_args], standalone_mode=False)
+    return work_path / "processed" / "combined"
+
+
+def cna_query(directory, sql):
+    """Run sql against DuckDB scans of the combined cna and clinical tables."""
+    con = duckdb.connect()
+    try:
+        con.execute(
+            f"CREATE VIEW cna AS SELECT * FROM {read_table(directory, 'combined_cna')}"
+        )
+        con.execute(
+            f"CREATE VIEW clinical_sample AS "
+            f"SELECT * FROM {read_table(directory, 'combined_clinical_sample')}"
+        )
+        return con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+
+def test_combined_cna(cna_combined):
+    # 4 of every 5 ERBB2 and 2 of every 3 CDKN2A calls are non-zero
+    assert cna_query(
+        cna_combined, "SELECT Hugo_Symbol, COUNT(*) FROM cna GROUP BY ALL ORDER BY 1"
+    ) == [("CDKN2A", 40), ("ERBB2", 48)]
+    # every call has the sample_key of its sample
+    unmatched = cna_query(
+        cna_combined,
+        """
+        SELECT COUNT(*) FROM cna
+        ANTI JOIN clinical_sample AS c
+        ON c.study_id = cna.study_id AND c.SAMPLE_ID = cna.SAMPLE_ID
+        AND c.sample_key = cna.sample_key
+        """,
+    )
+    assert unmatched == [(0,)]
+
+
+@pytest.mark.parametrize("alteration,values", [("AMP", "2"), ("HOMDEL", "-2")])
+@pytest.mark.parametrize("cohort", [None, "study_id=synthetic_1"])
+def test_cna_frequency(cna_combined, alteration, values, cohort):
+    where = "" if cohort is None else "AND cna.study_id = 'synthetic_1'"
+    expected = cna_query(
+        cna_combined,
+        f"""
+        SELECT c.CANCER_TYPE, COUNT(*) FROM cna
+        JOIN clinical_sample AS c
+        ON c.study_id = cna.study_id AND c.SAMPLE_ID = cna.SAMPLE_ID
+        WHERE cna.Hugo_Symbol = 'ERBB2' AND cna.value IN ({values}) {where}
+        GROUP BY ALL
+        """,
+    )
+    result = cna_frequency_per_cancer_type(
+        "ERBB2", alteration, directory=cna_combined, cohort=cohort
+    )
+    assert expected
+    assert sorted(result) == sorted(expected)
+
+
+def test_cna_frequency_command(cna_combined):
+    result = CliRunner().invoke(
+        cli,
+        ["cna-frequency", "CDKN2A", "--processed-dir", str(cna_combined)],
+    )
+    assert result.exit_code == 0, result.output
+    assert "No data found" in result.output
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "cna-frequency",
+            "CDKN2A",
+            "--alteration",
+            "HOMDEL",
+            "--processed-dir",
+            str(cna_combined),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    counts = [int(line.split()[-1]) for line in result.output.splitlines()[2:]]
+    assert sum(counts) == 40
@@ -0,0 +1,121 @@
+import pytest
+
+from benchmarks.synthetic import HOTSPOTS
+from cbiohub.analyze import find_variant, variant_frequency_per_cancer_type
+from cbiohub.cohort_index import parse_cohort, select_cohort
+from helpers import expected_samples, query
+
+COHORTS = {
+    "CANCER_TYPE=Melanoma": "CANCER_TYPE = 'Melanoma'",
+    "CANCER_TYPE=Melanoma AND SAMPLE_TYPE=Metastasis": (
+        "CANCER_TYPE = 'Melanoma' AND SAMPLE_TYPE = 'Metastasis'"
+    ),
+    "CANCER_TYPE=Non-Small Cell Lung Cancer OR ONCOTREE_CODE=GBM": (
+        "CANCER_TYPE = 'Non-Small Cell Lung Cancer' OR ONCOTREE_CODE = 'GBM'"
+    ),
+    "NOT (SAMPLE_TYPE=Primary OR CANCER_TYPE='Breast Cancer')": (
+        "NOT (SAMPLE_TYPE = 'Primary' OR CANCER_TYPE = 'Breast Cancer')"
+    ),
+    "SAMPLE_TYPE!=Primary": "SAMPLE_TYPE != 'Primary'",
+}
+
+
+def test_parse_cohort():
+    assert parse_cohort("CANCER_TYPE=Melanoma") == ("eq", "CANCER_TYPE", "Melanoma")
+    assert parse_cohort(
+        "CANCER_TYPE=Non-Small Cell Lung Cancer and not SAMPLE_TYPE != 'Primary'"
+    ) == (
+        "and",
+        ("eq", "CANCER_TYPE", "Non-Small Cell Lung Cancer"),
+        ("not", ("ne", "SAMPLE_TYPE", "Primary")),
+    )
+    # AND binds tighter than OR
+    assert parse_cohort('A=1 OR B=2 AND (C=3 OR D="4 5")') == (
+        "or",
+        ("eq", "A", "1"),
+        ("and", ("eq", "B", "2"), ("or", ("eq", "C", "3"), ("eq", "D", "4 5"))),
+    )
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "",
+        "   ",
+        "CANCER_TYPE",
+        "CANCER_TYPE=",
+        "=Melanoma",
+        "CANCER_TYPE Melanoma",
+        "CANCER_TYPE=Melanoma AND",
+        "CANCER_TYPE=Melanoma OR OR SAMPLE_TYPE=Primary",
+        "(CANCER_TYPE=Melanoma",
+        "CANCER_TYPE=Melanoma)",
+        'CANCER_TYPE="Melanoma',
+        "CANCER_TYPE==Melanoma",
+        "CANCER_TYPE!Melanoma",
+        "NOT",
+    ],
+)
+def test_parse_cohort_errors(expression):
+    with pytest.raises(ValueError, match="Invalid cohort expression"):
+        parse_cohort(expression)
+
+
+@pytest.mark.parametrize("cohort", list(COHORTS))
+def test_cohort_samples(combined, cohort):
+    expected = query(
+        combined,
+        f"SELECT study_id, SAMPLE_ID FROM clinical_sample WHERE {COHORTS[cohort]}",
+    )
+    samples = select_cohort(cohort, combined)
+    assert expected
+    assert sorted(zip(*samples.to_pydict().values())) == sorted(expected)
+
+
+@pytest.mark.parametrize("cohort", list(COHORTS))
+def test_find_variant_in_cohort(combined, use_index, cohort):
+    for _, chrom, start, ref, alt, _ in HOTSPOTS:
+        expected = expected_samples(
+            combined,
+            f"Chromosome = '{chrom}' AND Start_Position = {start} "
+            f"AND Reference_Allele = '{ref}' AND Tumor_Seq_Allele2 = '{alt}'",
+            COHORTS[cohort],
+        )
+        exists, samples = find_variant(
+            chrom=chrom,
+            start=start,
+            end=start,
+            ref=ref,
+            alt=alt,
+            directory=combined,
+            cohort=cohort,
+        )
+        assert exists == bool(expected)
+        assert sorted(samples) == expected
+
+
+@pytest.mark.parametrize("cohort", list(COHORTS))
+def test_variant_frequency_in_cohort(combined, cohort):
+    _, chrom, start, ref, alt, _ = HOTSPOTS[0]
+    expected = query(
+        combined,
+        f"""
+        SELECT c.CANCER_TYPE, COUNT(*)
+        FROM mutations AS m
+        JOIN clinical_sample AS c
+        ON c.study_id = m.study_id AND c.SAMPLE_ID = m.Tumor_Sample_Barcode
+        WHERE ({COHORTS[cohort]})
+        AND m.Chromosome = '{chrom}' AND m.Start_Position = {start}
+        AND m.Reference_Allele = '{ref}' AND m.Tumor_Seq_Allele2 = '{alt}'
+        GROUP BY c.CANCER_TYPE
+        """,
+    )
+    result = variant_frequency_per_cancer_type(
+        chrom, start, start, ref, alt, "CANCER_TYPE", combined, cohort=cohort
+    )
+    assert dict(result) == dict(expected)
+
+
+def test_unknown_cohort_attribute(combined):
+    with pytest.raises(ValueError, match="not indexed"):
+        select_cohort("NOT_AN_ATTRIBUTE=1", combined)
@@ -0,0 +1,189 @@
+import json
+import shutil
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from dynaconf import settings
+
+from benchmarks.synthetic import generate_datahub
+from cbiohub.analyze import CATALOG_FILE, cast_mutation_table
+from cbiohub.data_commands import data
+from cbiohub.study import read_header
+from cbiohub.summaries import SUMMARY_TABLES
+from helpers import query, read_table
+
+
+def make_datahub(path, studies=2):
+    return generate_datahub(
+        path, studies=studies, samples=20, mutations_per_sample=5, seed=0
+    )
+
+
+def add_mutations(study_path, *mutations):
+    """Append mutations, given as dicts of some of their values, to a study."""
+    path = study_path / "data_mutations.txt"
+    _, column_names, _ = read_header(path)
+    with open(path, "a") as f:
+        for mutation in mutations:
+            values = {"Chromosome": "17", "Reference_Allele": "C", **mutation}
+            f.write("\t".join(values.get(name, "") for name in column_names) + "\n")
+
+
+def run(processed_path, monkeypatch, *args):
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(processed_path))
+    data.main(list(args), standalone_mode=False)
+    return processed_path / "combined"
+
+
+def test_cast_mutation_table():
+    table = pa.table(
+        {
+            "Chromosome": ["chr1", "2", "X", "3"],
+            "Start_Position": ["10", " 20 ", "1.5", "40"],
+            "t_ref_count": ["1", None, "3", "four"],
+            "study_id": ["s", "s", "s", "s"],
+        }
+    )
+    typed, quarantined = cast_mutation_table(table)
+    assert typed.to_pydict() == {
+        "Chromosome": ["1", "2"],
+        "Start_Position": [10, 20],
+        "t_ref_count": [1, None],
+        "study_id": ["s", "s"],
+    }
+    assert typed.schema.field("Start_Position").type == pa.int64()
+    assert quarantined.to_pydict() == {
+        "Chromosome": ["X", "3"],
+        "Start_Position": ["1.5", "40"],
+        "t_ref_count": ["3", "four"],
+        "study_id": ["s", "s"],
+    }
+
+
+@pytest.mark.parametrize("layout", [[], ["--partition"]])
+def test_invalid_mutations_are_quarantined(tmp_path, monkeypatch, layout):
+    study_paths = make_datahub(tmp_path / "hub")
+    add_mutations(
+        study_paths[1],
+        dict(Tumor_Sample_Barcode="S1_0", Start_Position="7577120.5", t_alt_count="2"),
+        dict(Tumor_Sample_Barcode="S1_1", Start_Position="7577120", t_alt_count="x"),
+    )
+    run(tmp_path / "processed", monkeypatch, "ingest", str(tmp_path / "hub"))
+    combined = run(tmp_path / "processed", monkeypatch, "combine", *layout)
+
+    assert query(
+        combined,
+        f"SELECT Tumor_Sample_Barcode, Start_Position, t_alt_count "
+        f"FROM {read_table(combined, 'quarantined_mutations')}",
+    ) == [("S1_0", "7577120.5", "2"), ("S1_1", "7577120", "x")]
+    assert query(
+        combined,
+        "SELECT COUNT(*) FROM mutations "
+        "WHERE Tumor_Sample_Barcode IN ('S1_0', 'S1_1') "
+        "AND Start_Position = 7577120",
+    ) == [(0,)]
+    assert query(combined, "SELECT COUNT(*) FROM mutations") == [(200,)]
+
+
+def mutation_rows(combined):
+    return query(
+        combined,
+        "SELECT study_id, Tumor_Sample_Barcode, Chromosome, Start_Position, "
+        "End_Position, Reference_Allele, Tumor_Seq_Allele2, t_alt_count "
+        "FROM mutations ORDER BY ALL",
+    )
+
+
+def summary_rows(combined, name):
+    return query(combined, f"SELECT * FROM '{combined / name}.parquet' ORDER BY ALL")
+
+
+def check_partitions(combined):
+    """Each chromosome is a single file sorted by position."""
+    for partition in (combined / "combined_mutations").iterdir():
+        if partition.is_dir():
+            assert [path.name for path in partition.iterdir()] == ["part-0.parquet"]
+            positions = pq.read_table(
+                partition / "part-0.parquet", columns=["Start_Position"]
+            )["Start_Position"].to_pylist()
+            assert positions == sorted(positions)
+
+
+def check_sample_keys(combined):
+    """Every sample has its own key, shared by its mutations."""
+    samples = query(
+        combined,
+        "SELECT study_id, SAMPLE_ID, sample_key FROM clinical_sample",
+    )
+    assert len({key for _, _, key in samples}) == len(samples)
+    assert (
+        query(
+            combined,
+            """
+        SELECT COUNT(*) FROM mutations AS m JOIN clinical_sample AS c
+        ON c.study_id = m.study_id AND c.SAMPLE_ID = m.Tumor_Sample_Barcode
+        WHERE c.sample_key != m.sample_key
+        """,
+        )
+        == [(0,)]
+    )
+
+
+def test_incremental_combine(tmp_path, monkeypatch, capsys):
+    study_paths = make_datahub(tmp_path / "hub", studies=3)
+    processed_path = tmp_path / "processed"
+    run(processed_path, monkeypatch, "ingest", str(tmp_path / "hub"))
+    combined = run(processed_path, monkeypatch, "combine", "--incremental")
+    check_partitions(combined)
+    check_sample_keys(combined)
+    unchanged_fragment = combined / "combined_clinical_sample" / "synthetic_0.parquet"
+    mtime = unchanged_fragment.stat().st_mtime_ns
+
+    add_mutations(
+        study_paths[1],
+        dict(Tumor_Sample_Barcode="S1_0", Start_Position="1", End_Position="1"),
+    )
+    run(processed_path, monkeypatch, "ingest", str(tmp_path / "hub"))
+    capsys.readouterr()
+    run(processed_path, monkeypatch, "combine", "--incremental")
+    assert "Combined 1 changed studies" in capsys.readouterr().out
+    assert unchanged_fragment.stat().st_mtime_ns == mtime
+    check_partitions(combined)
+    check_sample_keys(combined)
+    manifest = json.loads((combined / "combine_manifest.json").read_text())
+    ranges = sorted(entry["sample_keys"] for entry in manifest["studies"].values())
+    for (start, count), (next_start, _) in zip(ranges, ranges[1:]):
+        assert start + count <= next_start
+
+    full = run(tmp_path / "full", monkeypatch, "ingest", str(tmp_path / "hub"))
+    run(tmp_path / "full", monkeypatch, "combine")
+    assert mutation_rows(combined) == mutation_rows(full)
+    for name in SUMMARY_TABLES:
+        assert summary_rows(combined, name) == summary_rows(full, name)
+
+    shutil.rmtree(processed_path / "studies" / "synthetic_2")
+    run(processed_path, monkeypatch, "combine", "--incremental")
+    assert "(2 unchanged, 1 removed)" in capsys.readouterr().out
+    check_partitions(combined)
+    assert query(combined, "SELECT DISTINCT study_id FROM mutations ORDER BY ALL") == [
+        ("synthetic_0",),
+        ("synthetic_1",),
+    ]
+
+
+@pytest.mark.parametrize("layout", [[], ["--partition"]])
+def test_relative_output_dir(tmp_path, monkeypatch, layout):
+    make_datahub(tmp_path / "hub")
+    run(tmp_path / "processed", monkeypatch, "ingest", str(tmp_path / "hub"))
+    monkeypatch.chdir(tmp_path)
+    run(tmp_path / "processed", monkeypatch, "combine", "--output-dir", "out", *layout)
+
+    # the catalog's views still find the tables from another directory
+    monkeypatch.chdir(tmp_path / "hub")
+    con = duckdb.connect(str(tmp_path / "out" / CATALOG_FILE), read_only=True)
+    try:
+        assert con.execute("SELECT COUNT(*) FROM mutations").fetchall() == [(200,)]
+    finally:
+        con.close()
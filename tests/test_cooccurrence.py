@@ -0,0 +1,134 @@
+from fractions import Fraction
+from math import comb
+
+import numpy as np
+import pytest
+
+from cbiohub.cooccurrence import (
+    MutationMatrix,
+    benjamini_hochberg,
+    hypergeometric_tail,
+    log_factorials,
+    pairwise_cooccurrence,
+)
+
+
+def exact_tail(k, draws, successes, population, upper):
+    """P(X >= k) or P(X <= k) of a hypergeometric X, as an exact fraction."""
+    support = range(max(0, draws + successes - population), min(draws, successes) + 1)
+    total = sum(
+        comb(successes, x) * comb(population - successes, draws - x)
+        for x in support
+        if (x >= k if upper else x <= k)
+    )
+    return Fraction(total, comb(population, draws))
+
+
+def tail_cases(population):
+    for draws in range(population + 1):
+        for successes in range(population + 1):
+            for k in range(-1, min(draws, successes) + 2):
+                yield k, draws, successes
+
+
+@pytest.mark.parametrize("upper", [True, False])
+@pytest.mark.parametrize("population", [1, 7, 20])
+def test_hypergeometric_tail_is_exact(population, upper):
+    cases = np.array(list(tail_cases(population)), dtype=np.int64)
+    k, draws, successes = cases.T
+    tail = hypergeometric_tail(
+        k,
+        draws,
+        successes,
+        np.full(len(k), population, dtype=np.int64),
+        log_factorials(population),
+        upper=upper,
+    )
+    for value, (k, draws, successes) in zip(tail, cases):
+        expected = exact_tail(int(k), int(draws), int(successes), population, upper)
+        assert value == pytest.approx(float(expected), rel=1e-9, abs=1e-300)
+
+
+def test_hypergeometric_tail_far_in_the_tail():
+    # 1000 samples, two genes mutated in 300 samples that all overlap
+    population, draws, successes = 1000, 300, 300
+    tail = hypergeometric_tail(
+        np.array([300, 150, 0]),
+        np.full(3, draws),
+        np.full(3, successes),
+        np.full(3, population),
+        log_factorials(population),
+        upper=True,
+    )
+    for value, k in zip(tail, [300, 150, 0]):
+        expected = exact_tail(k, draws, successes, population, upper=True)
+        assert value == pytest.approx(float(expected), rel=1e-9)
+
+
+def test_benjamini_hochberg_is_exact():
+    p_values = [
+        Fraction(1, 100),
+        Fraction(4, 100),
+        Fraction(3, 100),
+        Fraction(5, 1000),
+        Fraction(9, 10),
+        Fraction(4, 100),
+    ]
+    count = len(p_values)
+    ranked = sorted(p_values)
+    # q of the i-th smallest p is the min over j >= i of p_j * m / j
+    expected = {}
+    for i, p in enumerate(ranked):
+        q = min(ranked[j] * count / (j + 1) for j in range(i, count))
+        expected[p] = min(q, Fraction(1))
+
+    q_values = benjamini_hochberg(np.array([float(p) for p in p_values]))
+    for p, q in zip(p_values, q_values):
+        assert q == pytest.approx(float(expected[p]), rel=1e-12)
+
+
+def test_benjamini_hochberg_empty():
+    assert len(benjamini_hochberg(np.empty(0))) == 0
+
+
+def matrix(rows, num_samples):
+    """Pack a {gene: [mutated sample indices]} dict into a MutationMatrix."""
+    bits = np.zeros((len(rows), (num_samples + 63) // 64), dtype=np.uint64)
+    for i, samples in enumerate(rows.values()):
+        for sample in samples:
+            bits[i, sample // 64] |= np.uint64(1) << np.uint64(sample % 64)
+    return MutationMatrix(list(rows), [f"s{i}" for i in range(num_samples)], bits)
+
+
+def pair(result, gene_a, gene_b):
+    rows = result[(result["gene_a"] == gene_a) & (result["gene_b"] == gene_b)]
+    assert len(rows) == 1
+    return rows.iloc[0]
+
+
+def test_undefined_odds_ratio_has_no_tendency():
+    # A is mutated in every sample, so the odds ratio of A and B is 0 / 0
+    result = pairwise_cooccurrence(matrix({"A": [0, 1, 2, 3], "B": [0, 1]}, 4))
+    row = pair(result, "A", "B")
+    assert np.isnan(row["log2_odds_ratio"])
+    assert row["p_value"] == 1.0
+    assert row["tendency"] is None
+
+
+def test_infinite_odds_ratios_have_a_tendency():
+    result = pairwise_cooccurrence(
+        matrix({"A": [0, 1, 2], "B": [0, 1, 2], "C": [3, 4, 5]}, 8)
+    )
+    cooccurring = pair(result, "A", "B")
+    assert cooccurring["log2_odds_ratio"] == np.inf
+    assert cooccurring["tendency"] == "Co-occurrence"
+    assert cooccurring["p_value"] == pytest.approx(
+        float(exact_tail(3, 3, 3, 8, upper=True))
+    )
+
+    exclusive = pair(result, "A", "C")
+    assert exclusive["log2_odds_ratio"] == -np.inf
+    assert exclusive["tendency"] == "Mutual exclusivity"
+    assert exclusive["p_value"] == pytest.approx(
+        float(exact_tail(0, 3, 3, 8, upper=False))
+    )
@@ -0,0 +1,29 @@
+from click.testing import CliRunner
+from dynaconf import settings
+
+from cbiohub.data_commands import data
+from cbiohub.discovery import discover_studies, duplicate_study_names
+
+
+def make_study(path):
+    path.mkdir(parents=True)
+    (path / "meta_study.txt").write_text(f"cancer_study_identifier: {path.name}\n")
+
+
+def test_nested_studies_with_the_same_name(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(tmp_path / "processed"))
+    hub = tmp_path / "hub"
+    make_study(hub / "public" / "brca")
+    make_study(hub / "private" / "brca")
+    make_study(hub / "luad")
+
+    study_paths = discover_studies(hub, use_catalog=False)
+    assert len(study_paths) == 3
+    assert duplicate_study_names(study_paths) == {
+        "brca": [hub / "private" / "brca", hub / "public" / "brca"]
+    }
+
+    result = CliRunner().invoke(data, ["ingest", str(hub)])
+    assert result.exit_code != 0
+    assert "brca" in result.output
+    assert not (tmp_path / "processed" / "studies").exists()
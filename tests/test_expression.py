@@ -0,0 +1,58 @@
+import pandas as pd
+from click.testing import CliRunner
+from dynaconf import settings
+
+from benchmarks.synthetic import generate_datahub
+from cbiohub.cli import cli
+from cbiohub.data_commands import data
+from cbiohub.expression import get_expression
+from helpers import study_samples, write_matrix
+
+
+def test_combined_expression(tmp_path, monkeypatch):
+    study_paths = generate_datahub(
+        tmp_path / "hub", studies=3, samples=5, mutations_per_sample=1
+    )
+    expected = []
+    for i, study_path in enumerate(study_paths[:2]):
+        samples = study_samples(study_path)
+        for profile in ["mrna_seq_v2_rsem", "mrna_seq_v2_rsem_zscores"]:
+            values = [i * 10 + j + 0.5 for j in range(len(samples))]
+            write_matrix(
+                study_path / f"data_{profile}.txt",
+                samples,
+                [("KRAS", "3845", [0] * len(samples)), ("ERBB2", "2064", values)],
+            )
+            expected += [
+                (study_path.name, profile, sample, value)
+                for sample, value in zip(samples, values)
+            ]
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(tmp_path / "processed"))
+    data.main(["ingest", str(tmp_path / "hub")], standalone_mode=False)
+    data.main(["combine"], standalone_mode=False)
+    combined = tmp_path / "processed" / "combined"
+
+    columns = ["study_id", "profile", "SAMPLE_ID", "value"]
+    df = get_expression("2064", directory=combined)
+    assert sorted(df[columns].itertuples(index=False, name=None)) == sorted(expected)
+    assert set(df["Hugo_Symbol"]) == {"ERBB2"}
+    assert get_expression("TP53", directory=combined).empty
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "expression",
+            "ERBB2",
+            "--profile",
+            "*zscores",
+            "--output",
+            str(tmp_path / "erbb2.tsv"),
+            "--processed-dir",
+            str(combined),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    df = pd.read_csv(tmp_path / "erbb2.tsv", sep="\t")
+    assert sorted(df[columns].itertuples(index=False, name=None)) == sorted(
+        row for row in expected if row[1] == "mrna_seq_v2_rsem_zscores"
+    )
@@ -0,0 +1,50 @@
+import shutil
+
+import pyarrow.parquet as pq
+from click.testing import CliRunner
+from dynaconf import settings
+
+from benchmarks.synthetic import SCALES, generate_datahub
+from cbiohub.data_commands import data
+
+
+def ingest(hub, processed_path, monkeypatch, *args):
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(processed_path))
+    result = CliRunner().invoke(data, ["ingest", str(hub), *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_ingest_with_workers(tmp_path, monkeypatch):
+    hub = tmp_path / "hub"
+    study_paths = generate_datahub(hub, seed=0, **SCALES["tiny"])
+    # studies that fail, in an order the workers may well finish them out of
+    for name in ["z_broken", "a_broken"]:
+        shutil.copytree(study_paths[0], hub / name)
+        with open(hub / name / "data_mutations.txt", "a") as f:
+            f.write("\t".join(["x"] * 100) + "\n")
+    (hub / "incomplete").mkdir()
+    (hub / "incomplete" / "meta_study.txt").write_text(
+        "cancer_study_identifier: incomplete\n"
+    )
+
+    serial = ingest(hub, tmp_path / "serial", monkeypatch)
+    parallel = ingest(hub, tmp_path / "parallel", monkeypatch, "--workers", "2")
+    for output in [serial, parallel]:
+        assert "Finished processing 3 studies" in output
+        assert "Skipped due to errors: a_broken, z_broken" in output
+        assert "Skipped due to missing files: incomplete" in output
+
+    for study_path in study_paths:
+        for file_name in [
+            "data_mutations",
+            "data_clinical_sample",
+            "data_clinical_patient",
+        ]:
+            relative_path = f"studies/{study_path.name}/{file_name}.parquet"
+            assert pq.read_table(tmp_path / "parallel" / relative_path).equals(
+                pq.read_table(tmp_path / "serial" / relative_path)
+            )
+
+    output = ingest(hub, tmp_path / "parallel", monkeypatch, "--workers", "2")
+    assert "3 studies were already processed" in output
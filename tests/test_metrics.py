@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.synthetic import generate_datahub
+from cbiohub import metrics
+from cbiohub.cli import cli
+
+
+@pytest.fixture(autouse=True)
+def recording(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", False)
+    monkeypatch.setattr(metrics, "_spans", [])
+    monkeypatch.setattr(metrics, "_open_spans", [])
+
+
+def allocate(size):
+    """Touch size bytes of memory, and free them again."""
+    np.ones(size // 8)
+
+
+@pytest.mark.skipif(not metrics.reset_peak_rss(), reason="can't reset peak RSS")
+def test_peak_rss_is_per_span():
+    size = 256 * 2**20
+    metrics.enable()
+    with metrics.span("outer") as outer:
+        with metrics.span("allocate"):
+            allocate(size)
+        with metrics.span("after"):
+            pass
+        outer.rows = 1
+    spans = {s["stage"]: s for s in metrics.get_spans()}
+    assert spans["allocate"]["peak_rss"] >= size
+    # the memory freed before a span started doesn't count towards its peak
+    assert spans["after"]["peak_rss"] < size
+    assert spans["outer"]["peak_rss"] >= spans["allocate"]["peak_rss"]
+    assert spans["outer"]["rows"] == 1
+    assert [s["stage"] for s in metrics.get_spans()] == ["allocate", "after", "outer"]
+
+
+def test_spans_are_only_recorded_when_enabled():
+    with metrics.span("stage"):
+        pass
+    assert metrics.get_spans() == []
+
+
+def test_summary():
+    spans = [
+        dict(stage="a", study="s1", seconds=1.0, rows=10, bytes=None, peak_rss=None),
+        dict(stage="a.study", study="s1", seconds=2.0, rows=5, bytes=7, peak_rss=3),
+        dict(stage="a.study", study="s2", seconds=0.5, rows=5, bytes=1, peak_rss=9),
+    ]
+    assert metrics.summarize(spans) == [
+        ("a.study", 2, 2.5, 10, 8, 9),
+        ("a", 1, 1.0, 10, 0, None),
+    ]
+    assert metrics.slowest_studies(spans) == [("s1", 2.0), ("s2", 0.5)]
+    assert "Slowest studies" in metrics.format_summary(spans)
+
+
+def test_metrics_of_ingest_workers(tmp_path, monkeypatch):
+    from dynaconf import settings
+
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(tmp_path / "processed"))
+    study_paths = generate_datahub(
+        tmp_path / "hub", studies=2, samples=5, mutations_per_sample=2
+    )
+    metrics_file = tmp_path / "metrics.json"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "--metrics-json",
+            str(metrics_file),
+            "data",
+            "ingest",
+            str(tmp_path / "hub"),
+            "--workers",
+            "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    report = json.loads(metrics_file.read_text())
+    # the spans of the studies are recorded in the worker processes
+    assert sorted(
+        s["study"] for s in report["spans"] if s["stage"] == "ingest.study"
+    ) == sorted(path.name for path in study_paths)
+    assert "ingest" in [row["stage"] for row in report["summary"]]
@@ -0,0 +1,81 @@
+from dynaconf import settings
+
+from cbiohub.combine import COMBINED_TABLES, DERIVED_TABLES
+from cbiohub.query_cache import FINGERPRINT_TABLES, QueryCache, combined_fingerprint
+from cbiohub.summaries import SUMMARY_TABLES
+
+
+def combine(directory, content):
+    """Stand in for a combine of directory, changing its fingerprint."""
+    directory.mkdir(exist_ok=True)
+    (directory / "combined_mutations.parquet").write_text(content)
+
+
+def test_disk_entries_are_evicted_per_directory(tmp_path):
+    disk_path = tmp_path / "query_cache"
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    combine(first, "1")
+    combine(second, "1")
+
+    cache = QueryCache(disk_path=disk_path)
+    assert cache.get_or_compute("query", first, [1], lambda: [("a", 1)]) == [("a", 1)]
+    assert cache.get_or_compute("query", second, [1], lambda: [("b", 1)]) == [("b", 1)]
+    assert cache.get_or_compute("query", first, [1], lambda: None) == [("a", 1)]
+    assert cache.info()["hits"] == 1
+    first_path = cache._directory_path(first.resolve())
+    second_path = cache._directory_path(second.resolve())
+    old_fingerprints = list(first_path.iterdir())
+    assert len(old_fingerprints) == 1
+
+    # a new process reads the results back from disk
+    cache = QueryCache(disk_path=disk_path)
+    assert cache.get_or_compute("query", second, [1], lambda: None) == [("b", 1)]
+    assert cache.info()["disk_hits"] == 1
+
+    # a new combine of first only drops the results of its older combine
+    combine(first, "22")
+    assert cache.get_or_compute("query", first, [1], lambda: [("a", 2)]) == [("a", 2)]
+    assert cache.info()["misses"] == 1
+    assert not old_fingerprints[0].exists()
+    assert len(list(first_path.iterdir())) == 1
+    assert len(list(second_path.iterdir())) == 1
+
+    cache = QueryCache(disk_path=disk_path)
+    assert cache.get_or_compute("query", second, [1], lambda: None) == [("b", 1)]
+    assert cache.get_or_compute("query", first, [1], lambda: None) == [("a", 2)]
+    assert cache.info()["disk_hits"] == 2
+
+
+def test_hits_return_a_copy(tmp_path):
+    combine(tmp_path, "1")
+    cache = QueryCache()
+    cache.get_or_compute("query", tmp_path, [1], lambda: [("a", 1)]).append("x")
+    result = cache.get_or_compute("query", tmp_path, [1], lambda: None)
+    assert result == [("a", 1)]
+    result.clear()
+    assert cache.get_or_compute("query", tmp_path, [1], lambda: None) == [("a", 1)]
+
+
+def test_fingerprint_inputs(tmp_path, monkeypatch):
+    combine(tmp_path, "1")
+    fingerprints = {combined_fingerprint(tmp_path)}
+    for file_name in [
+        "cohort_index/bitmaps.parquet",
+        "summary_gene.parquet",
+        "combined_clinical_sample_long/_common_metadata",
+        "combined_clinical_patient_core.parquet",
+    ]:
+        (tmp_path / file_name).parent.mkdir(exist_ok=True)
+        (tmp_path / file_name).write_text("1")
+        fingerprints.add(combined_fingerprint(tmp_path))
+    monkeypatch.setattr(settings, "COHORT_ATTRIBUTES", ["CANCER_TYPE"], False)
+    fingerprints.add(combined_fingerprint(tmp_path))
+    monkeypatch.setattr(settings, "SUMMARY_ATTRIBUTES", ["CANCER_TYPE"], False)
+    fingerprints.add(combined_fingerprint(tmp_path))
+    assert len(fingerprints) == 7
+
+    # every table combine writes for queries is part of the fingerprint
+    assert {*COMBINED_TABLES, *DERIVED_TABLES, *SUMMARY_TABLES} <= set(
+        FINGERPRINT_TABLES
+    )
@@ -0,0 +1,94 @@
+import threading
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.synthetic import HOTSPOTS
+from cbiohub.analyze import find_variant
+from cbiohub.cli import cli
+from cbiohub.server import create_server, get_server_url, query_server
+
+
+def start(server):
+    server.quiet = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def server_url(combined, tmp_path):
+    server = create_server(combined, socket_path=tmp_path / "s.sock")
+    thread = start(server)
+    yield f"unix://{tmp_path / 's.sock'}"
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_queries(combined, server_url):
+    _, chrom, position, ref, alt, _ = HOTSPOTS[0]
+    variant = dict(chrom=chrom, start=position, end=position, ref=ref, alt=alt)
+    exists, samples = find_variant(**variant, directory=combined)
+    response = query_server(server_url, "find", variant)
+    assert response == {"exists": exists, "unique_ids": list(samples)}
+    assert query_server(server_url, "status", {})["directory"] == str(combined)
+    with pytest.raises(ValueError, match="Missing parameter"):
+        query_server(server_url, "variant-frequency", {"chrom": chrom})
+    with pytest.raises(ValueError, match="Unknown endpoint"):
+        query_server(server_url, "nothing", {})
+
+
+def test_http(combined):
+    server = create_server(combined, port=0)
+    thread = start(server)
+    try:
+        port = server.server_address[1]
+        status = query_server(f"http://127.0.0.1:{port}", "status", {})
+        assert status["directory"] == str(combined)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_forwarding(combined, server_url):
+    _, chrom, position, ref, alt, _ = HOTSPOTS[0]
+    args = ["variant-frequency", chrom, str(position), str(position), ref, alt]
+    local = CliRunner().invoke(cli, [*args, "--processed-dir", str(combined)])
+    forwarded = CliRunner().invoke(cli, [*args, "--server", server_url])
+    assert forwarded.exit_code == 0, forwarded.output
+    assert "Variant frequency per CANCER_TYPE" in forwarded.output
+    assert forwarded.output == local.output
+
+    result = CliRunner().invoke(
+        cli, [*args, "--server", server_url, "--processed-dir", str(combined)]
+    )
+    assert result.exit_code == 2
+    assert "--server can't be combined with --processed-dir" in result.output
+    with pytest.raises(click.UsageError):
+        get_server_url(server_url, combined)
+
+    result = CliRunner().invoke(cli, [*args, "--server", "unix:///nonexistent"])
+    assert "Could not reach server" in result.output
+
+
+def test_socket_in_use(combined, tmp_path):
+    socket_path = tmp_path / "s.sock"
+    socket_path.write_text("")
+    with pytest.raises(ValueError, match="is not a socket"):
+        create_server(combined, socket_path=socket_path)
+    socket_path.unlink()
+
+    server = create_server(combined, socket_path=socket_path)
+    try:
+        with pytest.raises(ValueError, match="already listening"):
+            create_server(combined, socket_path=socket_path)
+    finally:
+        server.server_close()
+
+    # the socket of a server that is gone is replaced
+    assert socket_path.exists()
+    server = create_server(combined, socket_path=socket_path)
+    server.server_close()
@@ -0,0 +1,194 @@
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from dynaconf import settings
+
+from benchmarks.synthetic import generate_datahub
+from cbiohub import study as study_module
+from cbiohub.study import (
+    CommentLines,
+    Study,
+    clinical_tsv_to_parquet,
+    stream_tsv_to_parquet,
+)
+from helpers import study_samples, write_matrix
+
+
+def test_blank_lines_before_the_header(tmp_path):
+    path = tmp_path / "data_mutations.txt"
+    path.write_text("#version 2.4\n\n#comment\n\nA\tB\n1\t2\n3\t4\n")
+    rows = stream_tsv_to_parquet(path, tmp_path / "out.parquet", "study")
+    assert rows == 2
+    assert pq.read_table(tmp_path / "out.parquet").to_pydict() == {
+        "A": ["1", "3"],
+        "B": ["2", "4"],
+        "study_id": ["study", "study"],
+    }
+
+
+def test_short_rows_are_padded_with_nulls(tmp_path):
+    path = tmp_path / "data_mutations.txt"
+    path.write_text(
+        "A\tB\tC\n"
+        + "".join(f"{i}\t{i}\t{i}\n" if i % 3 else f"{i}\n" for i in range(300))
+    )
+    rows = stream_tsv_to_parquet(
+        path, tmp_path / "out.parquet", "study", block_size=256
+    )
+    assert rows == 300
+    table = pq.read_table(tmp_path / "out.parquet").sort_by([("A", "ascending")])
+    for a, b, c in zip(*(table[name].to_pylist() for name in "ABC")):
+        assert (b, c) == ((None, None) if int(a) % 3 == 0 else (a, a))
+
+
+def test_long_rows_are_an_error(tmp_path):
+    path = tmp_path / "data_mutations.txt"
+    path.write_text("A\tB\n1\t2\t3\n")
+    with pytest.raises(pa.ArrowInvalid):
+        stream_tsv_to_parquet(path, tmp_path / "out.parquet", "study")
+
+
+def test_clinical_short_rows(tmp_path):
+    path = tmp_path / "data_clinical_sample.txt"
+    path.write_text(
+        "#Sample\tAge\n#Sample id\tAge\n#STRING\tNUMBER\n#1\t1\n\n"
+        "SAMPLE_ID\tAGE\nS1\t50\nS2\n"
+    )
+    clinical_tsv_to_parquet(path, tmp_path / "out.parquet", "study")
+    assert pq.read_table(tmp_path / "out.parquet").to_pydict() == {
+        "SAMPLE_ID": ["S1", "S2"],
+        "AGE": [50.0, None],
+        "study_id": ["study", "study"],
+    }
+
+
+def test_comment_lines_after_the_header(tmp_path):
+    path = tmp_path / "data_mutations.txt"
+    path.write_text(
+        "#version 2.4\nA\tB\n1\t2\n#comment\n#x\ty\n#x\ty\tz\n3\t4\n#\n5\t6\n#end"
+    )
+    rows = stream_tsv_to_parquet(path, tmp_path / "out.parquet", "study")
+    assert rows == 3
+    assert pq.read_table(tmp_path / "out.parquet").to_pydict() == {
+        "A": ["1", "3", "5"],
+        "B": ["2", "4", "6"],
+        "study_id": ["study"] * 3,
+    }
+    # comment lines split across the chunks read from the file
+    for chunk_size in range(1, 12):
+        with CommentLines(path, chunk_size=chunk_size) as stream:
+            assert stream.read() == b"A\tB\n1\t2\n3\t4\n5\t6\n"
+
+
+@pytest.fixture
+def study(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROCESSED_PATH", str(tmp_path / "processed"))
+    (study_path,) = generate_datahub(
+        tmp_path / "hub", studies=1, samples=4, mutations_per_sample=2
+    )
+    samples = study_samples(study_path)
+    write_matrix(study_path / "data_cna.txt", samples, [("BRAF", "673", [2, 0, -2, 0])])
+    write_matrix(
+        study_path / "data_mrna_seq_v2_rsem.txt",
+        samples,
+        [("BRAF", "673", [1.5, 2.5, 3.5, 4.5])],
+    )
+    study = Study(study_path)
+    assert study.create_parquets()
+    assert study.is_processed()
+    return study
+
+
+def test_touched_files_are_not_changed(study):
+    for file_name in study.input_files():
+        os.utime(study.study_path / file_name)
+    assert study.changed_input_files(study.input_files()) == []
+    assert study.is_processed()
+
+
+def test_changed_and_added_files(study):
+    with open(study.study_path / "data_mutations.txt", "a") as f:
+        f.write("\n")
+    assert study.changed_input_files(study.input_files()) == ["data_mutations.txt"]
+    assert not study.is_processed()
+    assert study.create_parquets()
+
+    (study.study_path / "data_mrna_seq_v2_rsem_zscores.txt").write_text(
+        (study.study_path / "data_mrna_seq_v2_rsem.txt").read_text()
+    )
+    assert not study.is_processed()
+    assert study.create_parquets()
+    assert study.is_processed()
+    assert (
+        study.processed_path / "expression" / "mrna_seq_v2_rsem_zscores.arrow"
+    ).exists()
+
+
+def test_deleted_files(study):
+    cna_output = study.processed_path / "data_cna.parquet"
+    expression_output = study.processed_path / "expression" / "mrna_seq_v2_rsem.arrow"
+    assert cna_output.exists() and expression_output.exists()
+
+    (study.study_path / "data_cna.txt").unlink()
+    assert study.changed_input_files(study.input_files()) == ["data_cna.txt"]
+    assert not study.is_processed()
+    with pytest.raises(FileNotFoundError):
+        study.get_cna_df()
+    assert not cna_output.exists()
+
+    (study.study_path / "data_mrna_seq_v2_rsem.txt").unlink()
+    assert "data_mrna_seq_v2_rsem.txt" in study.changed_input_files(study.input_files())
+    assert study.create_parquets()
+    assert study.is_processed()
+    assert not expression_output.exists()
+
+
+def test_files_changed_during_the_ingest(study, monkeypatch):
+    convert = study_module.stream_tsv_to_parquet
+
+    def convert_and_change(file_path, *args, **kwargs):
+        rows = convert(file_path, *args, **kwargs)
+        with open(file_path, "a") as f:
+            f.write("\n")
+        return rows
+
+    monkeypatch.setattr(study_module, "stream_tsv_to_parquet", convert_and_change)
+    assert study.create_parquets()
+    # the change made after the file was read is picked up by the next ingest
+    assert not study.is_processed()
+
+
+def test_get_expression(study):
+    df = study.get_expression("673")
+    assert df["profile"].unique().tolist() == ["mrna_seq_v2_rsem"]
+    assert df["SAMPLE_ID"].tolist() == study_samples(study.study_path)
+    assert df["value"].tolist() == [1.5, 2.5, 3.5, 4.5]
+    assert study.get_expression("BRAF", profile="*zscores").empty
+
+
+def test_expression_without_a_manifest(study, monkeypatch):
+    shutil.rmtree(study.processed_path)
+    convert = study_module.expression_tsv_to_arrow
+    converted = []
+
+    def count_conversions(file_path, *args, **kwargs):
+        converted.append(file_path.name)
+        return convert(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(study_module, "expression_tsv_to_arrow", count_conversions)
+    for _ in range(3):
+        assert study.get_expression("BRAF")["value"].tolist() == [1.5, 2.5, 3.5, 4.5]
+    assert converted == ["data_mrna_seq_v2_rsem.txt"]
+
+    # a matrix that is newer than its Arrow file is converted again
+    path = study.study_path / "data_mrna_seq_v2_rsem.txt"
+    write_matrix(path, study_samples(study.study_path), [("BRAF", "673", [0, 0, 0, 1])])
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 10))
+    assert study.get_expression("BRAF")["value"].tolist() == [0, 0, 0, 1]
+    assert len(converted) == 2
+
+    path.unlink()
+    assert study.get_expression("BRAF").empty
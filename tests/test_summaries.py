@@ -0,0 +1,109 @@
+import pytest
+from click.testing import CliRunner
+
+from cbiohub.cli import cli
+from cbiohub.summaries import (
+    SUMMARY_ATTRIBUTES,
+    SUMMARY_LEVELS,
+    SUMMARY_TABLES,
+    mutation_summary,
+)
+from helpers import query
+
+COUNTS = """
+    COUNT(DISTINCT m.study_id || ':' || m.Tumor_Sample_Barcode) AS num_samples,
+    COUNT(DISTINCT m.study_id || ':' || c.PATIENT_ID) AS num_patients,
+    COUNT(DISTINCT m.study_id) AS num_studies
+"""
+
+JOIN = """
+    FROM mutations AS m LEFT JOIN clinical_sample AS c
+    ON c.study_id = m.study_id AND c.SAMPLE_ID = m.Tumor_Sample_Barcode
+"""
+
+
+def summary_rows(directory, name):
+    """All rows of a summary table, sorted."""
+    keys = SUMMARY_TABLES[name]
+    columns = ", ".join([*keys, "num_samples", "num_patients", "num_studies"])
+    return query(
+        directory,
+        f"SELECT {columns} FROM '{directory / name}.parquet' ORDER BY ALL",
+    )
+
+
+@pytest.mark.parametrize("level", SUMMARY_LEVELS)
+def test_summaries_match_the_mutations(combined, level):
+    keys = ", ".join(f"m.{key}" for key in SUMMARY_LEVELS[level])
+    assert summary_rows(combined, f"summary_{level}") == query(
+        combined, f"SELECT {keys}, {COUNTS} {JOIN} GROUP BY ALL ORDER BY ALL"
+    )
+    by_attribute = " UNION ALL ".join(
+        f"SELECT '{attribute}' AS attribute, "
+        f"CAST(c.{attribute} AS VARCHAR) AS attribute_value, {keys}, {COUNTS} "
+        f"{JOIN} GROUP BY ALL"
+        for attribute in SUMMARY_ATTRIBUTES
+    )
+    assert summary_rows(combined, f"summary_{level}_by_attribute") == query(
+        combined, f"{by_attribute} ORDER BY ALL"
+    )
+
+
+def test_sample_summaries(combined):
+    assert summary_rows(combined, "summary_samples") == query(
+        combined,
+        "SELECT COUNT(*), COUNT(DISTINCT study_id || ':' || PATIENT_ID), "
+        "COUNT(DISTINCT study_id) FROM clinical_sample",
+    )
+    by_attribute = " UNION ALL ".join(
+        f"SELECT '{attribute}', CAST({attribute} AS VARCHAR), COUNT(*), "
+        f"COUNT(DISTINCT study_id || ':' || PATIENT_ID), COUNT(DISTINCT study_id) "
+        f"FROM clinical_sample GROUP BY ALL"
+        for attribute in SUMMARY_ATTRIBUTES
+    )
+    assert summary_rows(combined, "summary_samples_by_attribute") == query(
+        combined, f"{by_attribute} ORDER BY ALL"
+    )
+
+
+def test_mutation_summary(combined):
+    ((total,),) = query(combined, "SELECT COUNT(*) FROM clinical_sample")
+    expected = query(
+        combined,
+        f"SELECT m.Hugo_Symbol, {COUNTS} {JOIN} GROUP BY ALL ORDER BY 2 DESC",
+    )
+    result = mutation_summary("gene", limit=5, directory=combined)
+    assert [row[1] for row in result] == [row[1] for row in expected[:5]]
+    for row in result:
+        assert row[:4] in expected
+        assert row[4] == pytest.approx(row[1] / total)
+
+    result = mutation_summary(
+        "protein_change", "CANCER_TYPE", gene="BRAF", limit=2, directory=combined
+    )
+    assert result
+    counts = {}
+    for row in result:
+        assert row[1] == "BRAF"
+        counts[row[0]] = counts.get(row[0], 0) + 1
+    assert max(counts.values()) <= 2
+
+    with pytest.raises(ValueError, match="not summarized"):
+        mutation_summary("gene", "AGE", directory=combined)
+
+
+def test_summary_command(combined):
+    result = CliRunner().invoke(
+        cli,
+        [
+            "summary",
+            "--clinical-attribute",
+            "CANCER_TYPE",
+            "--limit",
+            "3",
+            "--processed-dir",
+            str(combined),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Most frequently mutated genes" in result.output
@@ -0,0 +1,55 @@
+from benchmarks.synthetic import HOTSPOTS
+from cbiohub.analyze import find_variant
+from cbiohub.variant_index import lookup_variant_index
+from helpers import expected_samples, query
+
+
+def coordinate_queries(directory):
+    """The hotspots, other variants in the datahub and one that isn't in it."""
+    variants = [
+        (chrom, start, start, ref, alt) for _, chrom, start, ref, alt, _ in HOTSPOTS
+    ]
+    variants += query(
+        directory,
+        "SELECT DISTINCT Chromosome, Start_Position, End_Position, "
+        "Reference_Allele, Tumor_Seq_Allele2 FROM mutations "
+        "ORDER BY ALL LIMIT 20",
+    )
+    variants.append(("1", 1, 1, "A", "T"))
+    return variants
+
+
+def test_find_variant(combined, use_index):
+    for chrom, start, end, ref, alt in coordinate_queries(combined):
+        if use_index:
+            assert (
+                lookup_variant_index(
+                    combined, "coordinates", (chrom, start, end, ref, alt)
+                )
+                is not None
+            )
+        expected = expected_samples(
+            combined,
+            f"Chromosome = '{chrom}' AND Start_Position = {start} "
+            f"AND End_Position = {end} AND Reference_Allele = '{ref}' "
+            f"AND Tumor_Seq_Allele2 = '{alt}'",
+        )
+        exists, samples = find_variant(
+            chrom=chrom, start=start, end=end, ref=ref, alt=alt, directory=combined
+        )
+        assert exists == bool(expected)
+        assert sorted(samples) == expected
+
+    for symbol, _, _, _, _, protein_change in HOTSPOTS:
+        expected = expected_samples(
+            combined,
+            f"Hugo_Symbol = '{symbol}' AND HGVSp_Short = '{protein_change}'",
+        )
+        assert expected
+        exists, samples = find_variant(
+            hugo_symbol=symbol,
+            protein_change=protein_change[2:],
+            directory=combined,
+        )
+        assert exists
+        assert sorted(samples) == expected